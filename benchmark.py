@@ -0,0 +1,200 @@
+# benchmark.py
+"""
+Benchmark suite for the enrichment engine on synthetic data.
+
+Times the individual stages (read_sites, fuzzy_join, fuzzy_join_streaming,
+fuzzy_join_parallel, limit_inferred_hits, kinase_results,
+performKSEA_high_level) and start_eval end to end over a grid of input
+size, tolerance, amino acid mode and inferred hit limit. Results are written as JSON so runs can be compared over time.
+
+Usage:
+    python benchmark.py                                  # default grid
+    python benchmark.py --sizes 100,1000 --repeat 5 --output bench_results/base.json
+    python benchmark.py --compare bench_results/base.json bench_results/new.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Keep the engine quiet while timing; must be set before util is imported
+os.environ.setdefault("FUZZYKEA_LOG_LEVEL", "WARNING")
+
+import numpy as np
+import pandas as pd
+
+import enrichment
+import matching
+import synthetic_data
+import util
+
+ALL_AMINO_ACIDS = ["S", "T", "Y", "H"]
+
+
+def _timed(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return result, times
+
+
+def _summary(stage, params, times, rows):
+    return {
+        "stage": stage,
+        "params": params,
+        "times_s": [round(t, 6) for t in times],
+        "min_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "rows": rows,
+    }
+
+
+def run_case(background, content, tolerance, aa_mode, hit_limit, repeat,
+             correction_method="fdr_bh", statistical_test="fisher"):
+    """Times every stage for one parameter combination and returns a list of result dicts."""
+    params = {"tolerance": tolerance, "aa_mode": aa_mode, "hit_limit": hit_limit}
+    results = []
+
+    sites, times = _timed(lambda: util.read_sites(content), repeat)
+    results.append(_summary("read_sites", params, times, len(sites)))
+
+    matches, times = _timed(lambda: util.fuzzy_join(sites, background, tolerance=tolerance,
+                                                    aa_mode=aa_mode, inferred_hit_limit=None), repeat)
+    results.append(_summary("fuzzy_join", params, times, len(matches)))
+
+    streamed, times = _timed(lambda: matching.fuzzy_join_streaming(sites, background, tolerance=tolerance,
+                                                                   aa_mode=aa_mode, inferred_hit_limit=None), repeat)
+    results.append(_summary("fuzzy_join_streaming", params, times, len(streamed)))
+
+    sharded, times = _timed(lambda: matching.fuzzy_join_parallel(sites, background, tolerance=tolerance,
+                                                                 aa_mode=aa_mode, inferred_hit_limit=None), repeat)
+    results.append(_summary("fuzzy_join_parallel", params, times, len(sharded)))
+
+    limited, times = _timed(lambda: util.limit_inferred_hits(matches, hit_limit), repeat)
+    results.append(_summary("limit_inferred_hits", params, times, len(limited)))
+
+    unit = enrichment.FuzzySiteUnit(tolerance, aa_mode, hit_limit)
+    test = enrichment.get_test(statistical_test, unit)
+    p_vals, times = _timed(lambda: enrichment.kinase_results(limited, background, test, unit), repeat)
+    results.append(_summary("kinase_results", params, times, len(p_vals)))
+
+    (sub_results, _), times = _timed(lambda: util.performKSEA_high_level(background, sites, correction_method,
+                                                                         statistical_test), repeat)
+    results.append(_summary("performKSEA_high_level", params, times, len(sub_results)))
+
+    evaluation, times = _timed(lambda: util.start_eval(content, background, correction_method, statistical_test,
+                                                       aa_mode=aa_mode, tolerance=tolerance,
+                                                       selected_amino_acids=ALL_AMINO_ACIDS,
+                                                       inferred_hit_limit=hit_limit), repeat)
+    results.append(_summary("start_eval", params, times, len(evaluation[0])))
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(sizes, tolerances, aa_modes, hit_limits, repeat, n_substrates, n_kinases, seed):
+    background = synthetic_data.make_background(n_substrates=n_substrates, n_kinases=n_kinases, seed=seed)
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "seed": seed,
+            "background_rows": len(background),
+            "background_substrates": n_substrates,
+            "background_kinases": n_kinases,
+        },
+        "results": [],
+    }
+    for size in sizes:
+        content = synthetic_data.make_input(background, n_sites=size, seed=seed + size)
+        for tolerance, aa_mode, hit_limit in itertools.product(tolerances, aa_modes, hit_limits):
+            case = run_case(background, content, tolerance, aa_mode, hit_limit, repeat)
+            for entry in case:
+                entry["params"] = {"input_size": size, **entry["params"]}
+                print(f"{entry['stage']:<24} {json.dumps(entry['params']):<80} median {entry['median_s']:.4f}s")
+            report["results"].append(case)
+    report["results"] = [entry for case in report["results"] for entry in case]
+    return report
+
+
+def _result_key(entry):
+    return entry["stage"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare_reports(baseline_path, candidate_path):
+    """Prints the median time ratio candidate/baseline for every stage and parameter set."""
+    with open(baseline_path) as f:
+        baseline = {_result_key(e): e for e in json.load(f)["results"]}
+    with open(candidate_path) as f:
+        candidate = json.load(f)["results"]
+
+    print(f"{'stage':<24} {'params':<80} {'base':>9} {'new':>9} {'ratio':>7}")
+    for entry in candidate:
+        base = baseline.get(_result_key(entry))
+        if base is None:
+            continue
+        ratio = entry["median_s"] / base["median_s"] if base["median_s"] else float("nan")
+        print(f"{entry['stage']:<24} {json.dumps(entry['params']):<80} "
+              f"{base['median_s']:>9.4f} {entry['median_s']:>9.4f} {ratio:>7.2f}")
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def _str_list(value):
+    return [v for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fuzzyKEA enrichment engine on synthetic data.")
+    parser.add_argument("--sizes", type=_int_list, default=[100, 1000, 5000], help="Input sizes (number of lines)")
+    parser.add_argument("--tolerances", type=_int_list, default=[0, 5])
+    parser.add_argument("--aa-modes", type=_str_list, default=["exact", "ignore"])
+    parser.add_argument("--hit-limits", type=_int_list, default=[0, 7])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--substrates", type=int, default=3000, help="Substrates in the synthetic background")
+    parser.add_argument("--kinases", type=int, default=300, help="Kinases in the synthetic background")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON output path (default: bench_results/bench_<timestamp>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare_reports(*args.compare)
+        return 0
+
+    report = run_benchmarks(args.sizes, args.tolerances, args.aa_modes, args.hit_limits, args.repeat,
+                            args.substrates, args.kinases, args.seed)
+
+    output = args.output or os.path.join("bench_results", f"bench_{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
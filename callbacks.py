@@ -2,15 +2,25 @@
 import dash
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc # Falls direkt in Callbacks verwendet
-from dash import dcc, html # Falls direkt in Callbacks verwendet (z.B. für dcc.send_data_frame)
+from dash import dcc, html, Patch # Falls direkt in Callbacks verwendet (z.B. für dcc.send_data_frame)
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
 import math
-import base64
+import json
+import os
+import tempfile
 import uuid
 
 import util  # Deine Utility-Funktionen
 import constants # Deine Konstanten
+import profiling
+import result_store
+import table_query
+import export
+import store_codec
+import uploads
+import importers
 
 # Globale DataFrame-Variablen hier entfernen! Daten werden über Stores verwaltet.
 
@@ -25,13 +35,13 @@ def register_callbacks(app):
     )
     def initialize_raw_data_store(session_id):
         if session_id:
-            print("Initializing raw-data-store with default dataset.")
-            raw_data = util.load_psp_dataset()
-            print(f"Default dataset loaded, rows: {len(raw_data) if raw_data is not None else 0}")
-            if raw_data is not None and len(raw_data) > 0:
+            util.log_info("Initializing raw-data-store with default dataset.")
+            raw_data = util.load_encoded_psp_dataset()
+            util.log_info(f"Default dataset loaded, rows: {raw_data['rows'] if raw_data is not None else 0}")
+            if raw_data is not None and raw_data["rows"] > 0:
                 return raw_data
             else:
-                print("Failed to load default dataset or dataset is empty.")
+                util.log_error("Failed to load default dataset or dataset is empty.")
                 return [] # Leere Liste als Fallback
         return dash.no_update
 
@@ -44,304 +54,581 @@ def register_callbacks(app):
         if existing_id:
             return existing_id
         new_id = str(uuid.uuid4())
-        print(f"New session started: {new_id}")
+        util.log_info("New session started", user_context=new_id)
         return new_id
 
     @app.callback(
-        Output("selected-amino-acids-store", "data"),
-        Input("amino-acid-checklist", "value")
-    )
-    def update_selected_amino_acids(selected_values):
-        # Die `selected_values` ist eine Liste der 'value's der angeklickten Checkboxen
-        print(f"INFO: Selected amino acids updated in store: {selected_values}")
-        return selected_values
-
-
-    @app.callback(
-        Output("current-title-store", "data"),
-        Input("notes", "value")
-    )
-    def update_download_title_in_store(notes_value):
-        if notes_value and notes_value.strip() != "":
-            return notes_value.strip()
-        return constants.DEFAULT_DOWNLOAD_FILE_NAME
-
-
-    @app.callback(
-        Output("text-input", "value"),
+        [Output("text-input", "value"),
+         Output("upload-store", "data"),
+         Output("upload-info", "children"),
+         Output("upload-text-file", "contents")],
         [Input("button-example", "n_clicks"), Input("upload-text-file", "contents")],
+        [State("upload-text-file", "filename"), State("session-id", "data")],
         prevent_initial_call=True
     )
-    def load_example_or_file(n_clicks_example, file_contents):
+    def load_example_or_file(n_clicks_example, file_contents, filename, session_id):
         triggered_id = dash.callback_context.triggered_id
         if not triggered_id: # Sollte durch prevent_initial_call nicht passieren
-            return dash.no_update
+            return (dash.no_update,) * 4
 
         if "button-example" in triggered_id:
-            return constants.PLACEHOLDER_INPUT
+            return constants.PLACEHOLDER_INPUT, None, "", dash.no_update
         elif "upload-text-file" in triggered_id and file_contents:
+            # The file stays on the server (see uploads.py); the text area only gets a preview.
+            # Clearing the contents frees the browser copy and lets the same file be uploaded again.
             try:
-                content_type, content_string = file_contents.split(",")
-                decoded = base64.b64decode(content_string)
-                text = decoded.decode("utf-8")
-                return text
+                upload = uploads.store.put(session_id, file_contents, filename)
             except Exception as e:
-                print(f"Error processing uploaded file: {e}")
-                return "Error: Could not read file content."
-        return dash.no_update
+                util.log_error("Error processing uploaded file", e)
+                return "Error: Could not read file content.", None, "", None
+            info = f"{upload['filename'] or 'Uploaded file'}: {upload['lines']:,} lines"
+            if upload.get("format"):
+                info += f", {importers.FORMATS[upload['format']]['label']}"
+            if upload["lines"] > constants.UPLOAD_PREVIEW_LINES:
+                info += f" (first {constants.UPLOAD_PREVIEW_LINES} shown, the whole file is analysed)"
+            return upload["preview"], upload, info, None
+        return (dash.no_update,) * 4
+
+    # --- Client-side Callbacks (UI-only state, no server round trip) ---
+    # All analysis settings go into one store that run_analysis reads as State
+    app.clientside_callback(
+        """
+        function(correctionMethod, statisticalTest, floppyValue, matchingMode, aminoAcids, maxHits, minLocalizationProb,
+                 permutations, permutationSeed) {
+            return {
+                correction_method: correctionMethod,
+                statistical_test: statisticalTest,
+                floppy_value: parseInt(floppyValue, 10),
+                matching_mode: matchingMode,
+                selected_amino_acids: aminoAcids || [],
+                max_hits: parseInt(maxHits, 10),
+                min_localization_prob: parseFloat(minLocalizationProb),
+                n_permutations: parseInt(permutations, 10),
+                permutation_seed: parseInt(permutationSeed, 10)
+            };
+        }
+        """,
+        Output("settings-store", "data"),
+        Input("correction-method-dropdown", "value"),
+        Input("statistical-test-dropdown", "value"),
+        Input("floppy-slider", "value"),
+        Input("matching-mode-radio", "value"),
+        Input("amino-acid-checklist", "value"),
+        Input("limit-inferred-hits-slider", "value"),
+        Input("localization-prob-slider", "value"),
+        Input("permutations-input", "value"),
+        Input("permutation-seed-input", "value"),
+    )
 
-    @app.callback(
-        Output("correction-method-store", "data"),
-        Input("correction-method-dropdown", "value")
+    app.clientside_callback(
+        f"""
+        function(notes) {{
+            const title = (notes || "").trim();
+            return title !== "" ? title : {json.dumps(constants.DEFAULT_DOWNLOAD_FILE_NAME)};
+        }}
+        """,
+        Output("current-title-store", "data"),
+        Input("notes", "value"),
     )
-    def update_correction_method_store(selected_method):
-        return selected_method
-    
-    @app.callback(
-        Output("statistical-test-store", "data"),
-        Input("statistical-test-dropdown", "value")
+
+    app.clientside_callback(
+        f"""
+        function(nSite, nHigh, nCancel, title) {{
+            const noUpdate = window.dash_clientside.no_update;
+            const triggered = window.dash_clientside.callback_context.triggered;
+            const trigger = triggered.length ? triggered[0].prop_id.split(".")[0] : null;
+            if (trigger === "cancel-download-modal-button" && nCancel) {{
+                return [false, noUpdate, noUpdate];
+            }}
+            const hasTitle = title && title.trim() !== "" && title !== {json.dumps(constants.DEFAULT_DOWNLOAD_FILE_NAME)};
+            const filename = hasTitle ? title : "enrichment_results";
+            if (trigger === "button-download" && nSite) {{
+                return [true, filename, "site"];
+            }}
+            if (trigger === "button-download-high-level" && nHigh) {{
+                return [true, filename, "sub"];
+            }}
+            return [noUpdate, noUpdate, noUpdate];
+        }}
+        """,
+        [Output("download-filename-modal", "is_open"),
+         Output("download-filename-input", "value"),
+         Output("active-download-type-store", "data")],
+        [Input("button-download", "n_clicks"),
+         Input("button-download-high-level", "n_clicks"),
+         Input("cancel-download-modal-button", "n_clicks")],
+        State("current-title-store", "data"),
+        prevent_initial_call=True
     )
-    def update_statistical_test_store(selected_test):
-        return selected_test
 
-    @app.callback(
-        Output("floppy-settings-store", "data"),
-        Input("floppy-slider", "value"),
-        Input("matching-mode-radio", "value"),
+    app.clientside_callback(
+        "function(nOpen, nClose, isOpen) { return !isOpen; }",
+        Output("modal", "is_open"),
+        [Input("open-modal", "n_clicks"), Input("close-modal", "n_clicks")],
+        State("modal", "is_open"),
+        prevent_initial_call=True
+    )
+
+    app.clientside_callback(
+        "function(nOpen, nClose, isOpen) { return (nOpen || nClose) ? !isOpen : isOpen; }",
+        Output("about-modal", "is_open"),
+        [Input("open-about-button", "n_clicks"), Input("close-about-button", "n_clicks")],
+        State("about-modal", "is_open"),
     )
-    def update_floppy_settings(slider_value, radio_value):
-        settings = {
-            "floppy_value": int(slider_value),
-            "matching_mode": radio_value
-        }
-        print(f"Floppy settings updated in store: {settings}")
-        return settings
 
     # --- Analysis Callback ---
     @app.callback(
         [
-            Output("site-level-results-store", "data"),
-            Output("sub-level-results-store", "data"),
-            Output("site-hit-data-store", "data"),
-            Output("sub-hit-data-store", "data"),
+            Output("result-key-store", "data"),
             Output("table-viewer", "columns"),
-            Output("table-viewer", "data"),
+            Output("table-viewer", "page_current"),
             Output("table-viewer-high-level", "columns"),
-            Output("table-viewer-high-level", "data"),
+            Output("table-viewer-high-level", "page_current"),
             Output("bar-plot-site-enrichment", "figure"),
-            Output("bar-plot-sub-enrichment", "figure")
+            Output("bar-plot-sub-enrichment", "figure"),
+            Output("volcano-plot", "figure")
         ],
         [Input("button-start-analysis", "n_clicks")],
         
         [
             State("text-input", "value"),
-            State("correction-method-store", "data"),
-            State("statistical-test-store", "data"),
             State("raw-data-store", "data"),
-            State("floppy-settings-store", "data"),
-            State("selected-amino-acids-store", "data"),
-            State("limit-inferred-hits-store", "data")
+            State("settings-store", "data"),
+            State("top-n-slider", "value"),
+            State("upload-store", "data"),
+            State("session-id", "data")
         ],
         prevent_initial_call=True
     )
-    def run_analysis(n_clicks, text_value, correction_method, statistical_test, raw_data_dict, floppy_settings, selected_amino_acids, limit_inferred_hits):
+    def run_analysis(n_clicks, text_value, raw_data_dict, settings, top_n, upload, session_id):
         # Validate button click
         if not n_clicks or n_clicks == 0:
-            print("Analysis not started: Button not clicked.")
-            return (dash.no_update,) * 10
+            util.log_debug("Analysis not started: Button not clicked.")
+            return (dash.no_update,) * 8
         
+        if not settings:
+            util.log_warning("Analysis not started: Settings not available.")
+            return (dash.no_update,) * 8
+        selected_amino_acids = settings.get("selected_amino_acids")
+        correction_method = settings.get("correction_method", "fdr_bh")
+        statistical_test = settings.get("statistical_test", "fisher")
+
         # Check if at least one amino acid is selected
         if not selected_amino_acids or len(selected_amino_acids) == 0:
-            print("Analysis not started: No amino acids selected.")
-            return (dash.no_update,) * 10
+            util.log_info("Analysis not started: No amino acids selected.")
+            return (dash.no_update,) * 8
         
         # Validate all required inputs
         if not text_value or not text_value.strip():
-            print("Analysis not started: No text input provided.")
-            return (dash.no_update,) * 10
+            util.log_info("Analysis not started: No text input provided.")
+            return (dash.no_update,) * 8
         
         if not raw_data_dict:
-            print("Analysis not started: Raw data not loaded.")
-            return (dash.no_update,) * 10
-        
-        if not floppy_settings:
-            print("Analysis not started: Floppy settings not available.")
-            return (dash.no_update,) * 10
-        
-        if not limit_inferred_hits:
-            print("Analysis not started: Limit inferred hits setting not available.")
-            return (dash.no_update,) * 10
+            util.log_warning("Analysis not started: Raw data not loaded.")
+            return (dash.no_update,) * 8
         
         # Extract limit value
-        limit_inferred_hits_value = int(limit_inferred_hits.get("max_hits", 7))
-        print(f"Inferred hit limit: {limit_inferred_hits_value}")
-
-        # Convert raw_data_dict to DataFrame
-        raw_data_df = pd.DataFrame.from_dict(raw_data_dict)
+        limit_inferred_hits_value = int(settings.get("max_hits", 7))
+        min_localization_prob = settings.get("min_localization_prob") or None  # 0 keeps all sites
+        # Empty or invalid inputs arrive as null (NaN from parseInt)
+        n_permutations = min(int(settings.get("n_permutations") or constants.PERMUTATION_COUNT), constants.PERMUTATION_MAX)
+        permutation_seed = settings.get("permutation_seed")
+        permutation_seed = constants.PERMUTATION_SEED if permutation_seed is None else max(int(permutation_seed), 0)
+
+        # Columnar store payload (see store_codec.py) to DataFrame; decoded frames are cached by digest.
+        # Read-only: the cached frame itself is passed on, so repeated runs reach its background index by identity
+        raw_data_df = store_codec.decode_frame(raw_data_dict, copy=False)
         if raw_data_df.empty:
-            print("Raw data is empty. Cannot start analysis.")
-            return (dash.no_update,) * 10
+            util.log_warning("Raw data is empty. Cannot start analysis.")
+            return (dash.no_update,) * 8
 
-        print(f"INFO: Starting analysis with selected amino acids: {selected_amino_acids}")
-        print(f"Raw data (from store) rows: {len(raw_data_df)}")
+        util.log_info(f"Starting analysis with selected amino acids: {selected_amino_acids}, raw data rows: {len(raw_data_df)}")
         
-        floppy_val = floppy_settings.get("floppy_value", 5)
-        match_mode = floppy_settings.get("matching_mode", "exact")
-        print(f"Analysis params: Floppy={floppy_val}, MatchMode={match_mode}, Correction={correction_method}, Statistical Test={statistical_test}")
-
+        floppy_val = int(settings.get("floppy_value", 5))
+        match_mode = settings.get("matching_mode", "exact")
+        util.log_info(f"Analysis params: Floppy={floppy_val}, MatchMode={match_mode}, Correction={correction_method}, Statistical Test={statistical_test}, Inferred hit limit={limit_inferred_hits_value}")
+
+        # An unchanged upload preview stands for the whole uploaded file
+        upload_path = None
+        input_lines = text_value.count("\n") + 1
+        if upload and text_value == upload.get("preview"):
+            upload_path = uploads.store.path(upload)
+            if upload_path is None:
+                util.log_warning("Analysis not started: Uploaded file expired.", user_context=session_id)
+                empty_figure = {"data": [], "layout": go.Layout(title="The uploaded file has expired, please upload it again.")}
+                return None, [], 0, [], 0, empty_figure, empty_figure, empty_figure
+            input_lines = upload.get("lines", input_lines)
+
+        profile_params = {
+            "tolerance": floppy_val,
+            "aa_mode": match_mode,
+            "correction_method": correction_method,
+            "statistical_test": statistical_test,
+            "selected_amino_acids": selected_amino_acids,
+            "inferred_hit_limit": limit_inferred_hits_value,
+            "input_lines": input_lines,
+        }
+        if statistical_test == "permutation":
+            profile_params["n_permutations"] = n_permutations
+            profile_params["permutation_seed"] = permutation_seed
+        if upload_path is not None:
+            profile_params["input_file"] = upload.get("filename")
+            if upload.get("format"):
+                profile_params["input_format"] = upload["format"]
+                profile_params["min_localization_prob"] = min_localization_prob
         try:
-            site_level_results, sub_level_results, site_hits, sub_hits = util.start_eval(
-                content=text_value,
-                raw_data=raw_data_df,
-                correction_method=correction_method,
-                statistical_test=statistical_test,
-                rounding=True,
-                aa_mode=match_mode,
-                tolerance=floppy_val,
-                selected_amino_acids=selected_amino_acids,
-                inferred_hit_limit=limit_inferred_hits_value
-            )
+            with profiling.profile_request("run_analysis", session_id=session_id, params=profile_params):
+                sites = None
+                if upload_path is not None:
+                    with uploads.open_text(upload_path) as f:
+                        if upload.get("format"):
+                            sites = importers.read_site_table(f, upload["format"], min_localization_prob)
+                        else:
+                            sites = util.read_sites_stream(f)
+                site_level_results, sub_level_results, site_hits, sub_hits = util.start_eval(
+                    content=text_value,
+                    raw_data=raw_data_df,
+                    correction_method=correction_method,
+                    statistical_test=statistical_test,
+                    rounding=True,
+                    aa_mode=match_mode,
+                    tolerance=floppy_val,
+                    selected_amino_acids=selected_amino_acids,
+                    inferred_hit_limit=limit_inferred_hits_value,
+                    sites=sites,
+                    n_permutations=n_permutations,
+                    seed=permutation_seed
+                )
         except Exception as e:
-            print(f"Error during start_eval: {e}")
+            util.log_error("Error during start_eval", e)
             # Hier könntest du eine Fehlermeldung an den User senden
             empty_figure = {"data": [], "layout": go.Layout(title=f"Error during analysis: {e}")}
-            return [], [], [], [], [], [], [], [], empty_figure, empty_figure
+            return None, [], 0, [], 0, empty_figure, empty_figure, empty_figure
 
 
         if site_level_results.empty and sub_level_results.empty:
-            print("No enrichment results from start_eval.")
+            util.log_info("No enrichment results from start_eval.")
             empty_figure = {"data": [], "layout": go.Layout(title="No significant enrichment found.")}
-            return [], [], [], [], [], [], [], [], empty_figure, empty_figure
+            return None, [], 0, [], 0, empty_figure, empty_figure, empty_figure
 
-        bar_plot_site_enrichment, bar_plot_sub_enrichment = create_barplots(site_level_results, sub_level_results)
+        bar_plot_site_enrichment, bar_plot_sub_enrichment = create_barplots(site_level_results, sub_level_results, int(top_n or constants.BAR_TOP_N))
 
         site_level_results_sorted = site_level_results.sort_values(by="P_VALUE", ascending=True) if not site_level_results.empty else pd.DataFrame()
         sub_level_results_sorted = sub_level_results.sort_values(by="ADJ_P_VALUE", ascending=True) if not sub_level_results.empty else pd.DataFrame()
         
-        site_level_results_linked = util.add_uniprot_link_col(site_level_results_sorted.copy())
-        sub_level_results_linked = util.add_uniprot_link_col(sub_level_results_sorted.copy())
-
-        table_columns_site = [{"name": i, "id": i, "presentation": "markdown" if i == "UPID" else "input"} for i in site_level_results_linked.columns] if not site_level_results_linked.empty else []
-        table_columns_sub = [{"name": i, "id": i, "presentation": "markdown" if i == "UPID" else "input"} for i in sub_level_results_linked.columns] if not sub_level_results_linked.empty else []
-
-        print("Analysis successful.")
+        # The tables are paged server-side (see update_result_table_page); only the columns are sent here
+        table_columns_site = table_query.table_columns(site_level_results_sorted) if not site_level_results_sorted.empty else []
+        table_columns_sub = table_query.table_columns(sub_level_results_sorted) if not sub_level_results_sorted.empty else []
+
+        # N and M of the contingency tables, needed for the expected counts of the volcano plot
+        totals = util.contingency_totals(raw_data_df, site_hits, sub_hits, selected_amino_acids)
+
+        # Download files are rendered once per run, the download callback only sends them
+        result = result_store.AnalysisResult(
+            site_results=site_level_results_sorted,
+            sub_results=sub_level_results_sorted,
+            site_hits=site_hits,
+            sub_hits=sub_hits,
+            params=profile_params,
+            totals=totals,
+        ).render_downloads()
+        result_handle = result_store.results.put(session_id, result)
+
+        util.log_info("Analysis successful.", user_context=session_id)
         return (
-            site_level_results_sorted.to_dict("records"),
-            sub_level_results_sorted.to_dict("records"),
-            site_hits.to_dict("records") if not site_hits.empty else [],
-            sub_hits.to_dict("records") if not sub_hits.empty else [],
+            result_handle,
             table_columns_site,
-            site_level_results_linked.to_dict("records"),
+            0,
             table_columns_sub,
-            sub_level_results_linked.to_dict("records"),
+            0,
             bar_plot_site_enrichment,
-            bar_plot_sub_enrichment
+            bar_plot_sub_enrichment,
+            create_volcano_plot(result)
         )
 
+    # --- Server-side paging of the result tables ---
+    def render_result_page(frame, views, view_key, page_current, page_size, sort_by, filter_query, link_upid=True):
+        page, page_count = table_query.query_page(frame, page_current, page_size, sort_by, filter_query,
+                                                  cache=views, cache_key=view_key)
+        if page.empty:
+            return [], page_count
+        if link_upid and "UPID" in page.columns:
+            page = util.add_uniprot_link_col(page.copy())
+        return page.to_dict("records"), page_count
+
+    def correction_changed(result_handle):
+        # apply_correction_method patches the pages itself when it records a correction in the handle;
+        # the handle of a new run never carries one
+        return dash.callback_context.triggered_id == "result-key-store" and "correction_method" in (result_handle or {})
+
+    @app.callback(
+        [Output("table-viewer", "data"), Output("table-viewer", "page_count")],
+        [Input("result-key-store", "data"),
+         Input("table-viewer", "page_current"),
+         Input("table-viewer", "page_size"),
+         Input("table-viewer", "sort_by"),
+         Input("table-viewer", "filter_query")],
+        prevent_initial_call=True
+    )
+    def update_site_table_page(result_handle, page_current, page_size, sort_by, filter_query):
+        if correction_changed(result_handle):
+            return dash.no_update, dash.no_update
+        result = result_store.results.get(result_handle)
+        if result is None:
+            return [], 1
+        return render_result_page(result.site_results, result.views, "site", page_current, page_size, sort_by, filter_query)
+
+    @app.callback(
+        [Output("table-viewer-high-level", "data"), Output("table-viewer-high-level", "page_count")],
+        [Input("result-key-store", "data"),
+         Input("table-viewer-high-level", "page_current"),
+         Input("table-viewer-high-level", "page_size"),
+         Input("table-viewer-high-level", "sort_by"),
+         Input("table-viewer-high-level", "filter_query")],
+        prevent_initial_call=True
+    )
+    def update_sub_table_page(result_handle, page_current, page_size, sort_by, filter_query):
+        if correction_changed(result_handle):
+            return dash.no_update, dash.no_update
+        result = result_store.results.get(result_handle)
+        if result is None:
+            return [], 1
+        return render_result_page(result.sub_results, result.views, "sub", page_current, page_size, sort_by, filter_query)
+
     # --- Plotting Function (kann hier bleiben oder nach util.py) ---
-    def create_barplots(site_level_results, sub_level_results):
-        site_level_barplot = {"data": [], "layout": go.Layout(title="Site-level: No data to display")}
-        sub_level_barplot = {"data": [], "layout": go.Layout(title="Substrate-level: No data to display")}
-
-        if site_level_results is not None and not site_level_results.empty and "ADJ_P_VALUE" in site_level_results.columns and "KINASE" in site_level_results.columns:
-            site_df = site_level_results.copy()
-            site_df["LOG_ADJ_P_VALUE"] = site_df["ADJ_P_VALUE"].astype(float).apply(lambda x: -math.log10(x) if pd.notna(x) and x > 0 else 0)
-            
-            # Sort by ADJ_P_VALUE (lowest p-value = most significant) and take top 10
-            site_df = site_df.sort_values(by="ADJ_P_VALUE", ascending=True).head(10)
-            # Then sort by LOG_ADJ_P_VALUE for display (ascending=True puts highest at top in horizontal bar)
-            site_df = site_df.sort_values(by="LOG_ADJ_P_VALUE", ascending=True)
-            
-            site_level_barplot = {
-                "data": [
-                    go.Bar(
-                        y=site_df["KINASE"],
-                        x=site_df["LOG_ADJ_P_VALUE"],
-                        orientation="h",
-                        marker=dict(
-                            color=site_df["LOG_ADJ_P_VALUE"],
-                            colorscale=constants.BAR_COLORSCALE,
-                        ),
+    def barplot_values(results, top_n):
+        # Top-N kinases by adjusted p-value, ordered for display (highest bar at the top).
+        # The -log10 values are exact, also for p-values that underflow to 0
+        log_adj = util.neg_log10_adjusted(results)
+        top = np.argsort(-log_adj, kind="mergesort")[:top_n]
+        log_adj = log_adj[top]
+        order = np.argsort(log_adj, kind="mergesort")
+        return results["KINASE"].to_numpy()[top][order].tolist(), log_adj[order].tolist()
+
+    def bar_outline(kinases, highlight):
+        return {"width": [2 if k == highlight else 0 for k in kinases], "color": constants.BAR_HIGHLIGHT_COLOR}
+
+    def has_bar_data(results):
+        return results is not None and not results.empty and "ADJ_P_VALUE" in results.columns and "KINASE" in results.columns
+
+    def create_barplot(results, level_label, top_n=constants.BAR_TOP_N, highlight=None):
+        if not has_bar_data(results):
+            return {"data": [], "layout": go.Layout(title=f"{level_label}: No data to display")}
+        kinases, log_adj = barplot_values(results, top_n)
+        return {
+            "data": [
+                go.Bar(
+                    y=kinases,
+                    x=log_adj,
+                    orientation="h",
+                    marker=dict(
+                        color=log_adj,
+                        colorscale=constants.BAR_COLORSCALE,
+                        line=bar_outline(kinases, highlight),
                     ),
-                ],
-                "layout": go.Layout(
-                    title="Site-level enriched kinases (Top 10)",
-                    xaxis={"title": "-log10 (adjusted p-value)"},
-                    yaxis={"title": "Kinases", "automargin": True},
-                    margin=dict(l=150, r=20, t=50, b=50), # Adjust margins
-                    height=max(300, len(site_df) * 25 + 100) # Dynamische Höhe
                 ),
-            }
-
-        if sub_level_results is not None and not sub_level_results.empty and "ADJ_P_VALUE" in sub_level_results.columns and "KINASE" in sub_level_results.columns:
-            sub_df = sub_level_results.copy()
-            sub_df["LOG_ADJ_P_VALUE"] = sub_df["ADJ_P_VALUE"].astype(float).apply(lambda x: -math.log10(x) if pd.notna(x) and x > 0 else 0)
-            
-            # Sort by ADJ_P_VALUE (lowest p-value = most significant) and take top 10
-            sub_df = sub_df.sort_values(by="ADJ_P_VALUE", ascending=True).head(10)
-            # Then sort by LOG_ADJ_P_VALUE for display
-            sub_df = sub_df.sort_values(by="LOG_ADJ_P_VALUE", ascending=True)
-
-            sub_level_barplot = {
-                "data": [
-                    go.Bar(
-                        y=sub_df["KINASE"],
-                        x=sub_df["LOG_ADJ_P_VALUE"],
-                        orientation="h",
-                        marker=dict(
-                            color=sub_df["LOG_ADJ_P_VALUE"],
-                            colorscale=constants.BAR_COLORSCALE,
-                        ),
-                    ),
-                ],
-                "layout": go.Layout(
-                    title="Substrate-level enriched kinases (Top 10)",
-                    xaxis={"title": "-log10 (adjusted p-value)"},
-                    yaxis={"title": "Kinases", "automargin": True},
-                    margin=dict(l=150, r=20, t=50, b=50),
-                    height=max(300, len(sub_df) * 25 + 100)
-                ),
-            }
-        return site_level_barplot, sub_level_barplot
+            ],
+            "layout": go.Layout(
+                title=f"{level_label} enriched kinases (Top {top_n})",
+                xaxis={"title": "-log10 (adjusted p-value)"},
+                yaxis={"title": "Kinases", "automargin": True},
+                margin=dict(l=150, r=20, t=50, b=50), # Adjust margins
+                height=max(300, len(kinases) * 25 + 100) # Dynamische Höhe
+            ),
+        }
 
+    def patch_barplot(results, level_label, top_n=constants.BAR_TOP_N, highlight=None):
+        # Only the bar values change; trace styling and layout stay in the browser
+        if not has_bar_data(results):
+            return dash.no_update
+        kinases, log_adj = barplot_values(results, top_n)
+        patch = Patch()
+        patch["data"][0]["y"] = kinases
+        patch["data"][0]["x"] = log_adj
+        patch["data"][0]["marker"]["color"] = log_adj
+        patch["data"][0]["marker"]["line"] = bar_outline(kinases, highlight)
+        patch["layout"]["title"]["text"] = f"{level_label} enriched kinases (Top {top_n})"
+        patch["layout"]["height"] = max(300, len(kinases) * 25 + 100)
+        return patch
+
+    def create_barplots(site_level_results, sub_level_results, top_n=constants.BAR_TOP_N):
+        return (create_barplot(site_level_results, "Site-level", top_n),
+                create_barplot(sub_level_results, "Substrate-level", top_n))
+
+    # --- Volcano overview of all kinases ---
+    VOLCANO_LEVELS = (("site", "site_results", "Site-level"), ("sub", "sub_results", "Substrate-level"))
+
+    def volcano_trace_values(result, level, attr):
+        totals = result.totals.get(level, {})
+        coords = util.volcano_coordinates(getattr(result, attr), totals.get("N", 0), totals.get("M", 0))
+        keep = util.downsample_points(coords["RATIO"], coords["LOG_ADJ_P"],
+                                      constants.VOLCANO_MAX_POINTS, constants.VOLCANO_GRID)
+        coords = coords.iloc[keep]
+        values = {
+            "x": coords["RATIO"].tolist(),
+            "y": coords["LOG_ADJ_P"].tolist(),
+            "text": coords["KINASE"].tolist(),
+            "customdata": coords[["FOUND", "EXPECTED"]].to_numpy().tolist(),
+        }
+        return values, len(keep)
+
+    def volcano_title(shown, total):
+        if shown < total:
+            return f"Kinome overview ({shown} of {total} kinases shown)"
+        return f"Kinome overview ({total} kinases)"
+
+    def create_volcano_plot(result):
+        """Observed / expected hits vs. -log10 adjusted p-value of all kinases, one WebGL trace per level."""
+        traces = []
+        shown = total = 0
+        for level, attr, label in VOLCANO_LEVELS:
+            values, n_shown = volcano_trace_values(result, level, attr)
+            frame = getattr(result, attr)
+            shown += n_shown
+            total += 0 if frame is None else len(frame)
+            traces.append(go.Scattergl(
+                mode="markers",
+                name=label,
+                marker=dict(size=7, opacity=0.7),
+                hovertemplate="<b>%{text}</b><br>Found: %{customdata[0]:.0f}, expected: %{customdata[1]:.2f}"
+                              "<br>Ratio: %{x:.2f}<br>-log10 adj. p: %{y:.2f}<extra>" + label + "</extra>",
+                **values,
+            ))
+        significance = -math.log10(constants.VOLCANO_SIGNIFICANCE)
+        return {
+            "data": traces,
+            "layout": go.Layout(
+                title=volcano_title(shown, total),
+                xaxis={"title": "Observed / expected hits", "type": "log"},
+                yaxis={"title": "-log10 (adjusted p-value)"},
+                shapes=[dict(type="line", xref="paper", x0=0, x1=1, y0=significance, y1=significance,
+                             line=dict(dash="dash", width=1, color=constants.BAR_HIGHLIGHT_COLOR))],
+                margin=dict(l=60, r=20, t=50, b=50),
+                height=500,
+            ),
+        }
+
+    def patch_volcano_plot(result):
+        # Same traces, only the point arrays and the title change
+        patch = Patch()
+        shown = total = 0
+        for i, (level, attr, _) in enumerate(VOLCANO_LEVELS):
+            values, n_shown = volcano_trace_values(result, level, attr)
+            frame = getattr(result, attr)
+            shown += n_shown
+            total += 0 if frame is None else len(frame)
+            for key, value in values.items():
+                patch["data"][i][key] = value
+        patch["layout"]["title"]["text"] = volcano_title(shown, total)
+        return patch
+
+    def selected_kinase(active_cell, table_data):
+        if not active_cell or not table_data or active_cell.get("row", 0) >= len(table_data):
+            return None
+        return table_data[active_cell["row"]].get("KINASE")
 
-    def get_default_filename(current_title_from_store, level_type=""):
-        prefix = current_title_from_store if current_title_from_store and current_title_from_store.strip() != "" and current_title_from_store != constants.DEFAULT_DOWNLOAD_FILE_NAME else "enrichment_results"
-        return prefix
-    
     @app.callback(
-        [Output("download-filename-modal", "is_open"),
-        Output("download-filename-input", "value"),
-        Output("active-download-type-store", "data")],
-        [Input("button-download", "n_clicks"),
-        Input("button-download-high-level", "n_clicks"),
-        Input("cancel-download-modal-button", "n_clicks")],
-        [State("current-title-store", "data")], # State für is_open hier nicht mehr nötig für reines Öffnen
+        [Output("bar-plot-site-enrichment", "figure", allow_duplicate=True),
+         Output("bar-plot-sub-enrichment", "figure", allow_duplicate=True)],
+        [Input("top-n-slider", "value"),
+         Input("table-viewer", "active_cell"),
+         Input("table-viewer-high-level", "active_cell")],
+        [State("table-viewer", "data"),
+         State("table-viewer-high-level", "data"),
+         State("result-key-store", "data")],
         prevent_initial_call=True
     )
-    def open_download_modal(n_site, n_high, n_cancel, current_title_from_store):
-        ctx = dash.callback_context
-        if not ctx.triggered_id:
-            return dash.no_update, dash.no_update, dash.no_update
+    def update_barplots(top_n, site_cell, sub_cell, site_data, sub_data, result_handle):
+        """Top-N changes and kinase highlighting are sent as Patch, not as new figures."""
+        result = result_store.results.get(result_handle)
+        if result is None:
+            return dash.no_update, dash.no_update
+        triggered_id = dash.callback_context.triggered_id
+        top_n = int(top_n or constants.BAR_TOP_N)
+        site_patch = sub_patch = dash.no_update
+        if triggered_id != "table-viewer-high-level":
+            site_patch = patch_barplot(result.site_results, "Site-level", top_n, selected_kinase(site_cell, site_data))
+        if triggered_id != "table-viewer":
+            sub_patch = patch_barplot(result.sub_results, "Substrate-level", top_n, selected_kinase(sub_cell, sub_data))
+        return site_patch, sub_patch
+
+    def patch_adjusted_page(frame, views, view_key, page_data, page_current, page_size, sort_by, filter_query):
+        if not page_data:
+            return dash.no_update, dash.no_update
+        columns = [c for c in ("P_VALUE", "ADJ_P_VALUE", "NEG_LOG10_ADJ_P") if c in frame.columns]
+        adjusted = [c for c in columns if c != "P_VALUE"]
+        # A page sorted or filtered by an adjusted p-value may now contain other rows
+        if any(s.get("column_id") in adjusted for s in sort_by or []) or \
+                any(f"{{{c}}}" in (filter_query or "") for c in adjusted):
+            return render_result_page(frame, views, view_key, page_current, page_size, sort_by, filter_query)
+        values = {c: dict(zip(frame["KINASE"], frame[c].astype(float))) for c in columns}
+        patch = Patch()
+        for i, row in enumerate(page_data):
+            for column, by_kinase in values.items():
+                if row.get("KINASE") in by_kinase:
+                    patch[i][column] = by_kinase[row["KINASE"]]
+        return patch, dash.no_update
+
+    @app.callback(
+        [Output("result-key-store", "data", allow_duplicate=True),
+         Output("table-viewer", "data", allow_duplicate=True),
+         Output("table-viewer", "page_count", allow_duplicate=True),
+         Output("table-viewer-high-level", "data", allow_duplicate=True),
+         Output("table-viewer-high-level", "page_count", allow_duplicate=True),
+         Output("bar-plot-site-enrichment", "figure", allow_duplicate=True),
+         Output("bar-plot-sub-enrichment", "figure", allow_duplicate=True),
+         Output("volcano-plot", "figure", allow_duplicate=True)],
+        Input("correction-method-dropdown", "value"),
+        [State("result-key-store", "data"),
+         State("top-n-slider", "value"),
+         State("table-viewer", "data"),
+         State("table-viewer", "page_current"),
+         State("table-viewer", "page_size"),
+         State("table-viewer", "sort_by"),
+         State("table-viewer", "filter_query"),
+         State("table-viewer", "active_cell"),
+         State("table-viewer-high-level", "data"),
+         State("table-viewer-high-level", "page_current"),
+         State("table-viewer-high-level", "page_size"),
+         State("table-viewer-high-level", "sort_by"),
+         State("table-viewer-high-level", "filter_query"),
+         State("table-viewer-high-level", "active_cell")],
+        prevent_initial_call=True
+    )
+    def apply_correction_method(correction_method, result_handle, top_n,
+                                site_data, site_page, site_page_size, site_sort, site_filter, site_cell,
+                                sub_data, sub_page, sub_page_size, sub_sort, sub_filter, sub_cell):
+        """
+        Re-adjusts the stored p-values for another correction method without re-running the analysis.
+
+        The method is recorded in the result handle, so every worker resolves the handle to the
+        corrected result (see result_store). Table pages get a Patch of their p-value cells.
+        """
+        result = result_store.results.get(result_handle)
+        if result is None or not correction_method or result.params.get("correction_method") == correction_method:
+            return (dash.no_update,) * 8
+        util.log_info(f"Re-applying multiple testing correction: {correction_method}")
+        result = result.corrected(correction_method)
+        top_n = int(top_n or constants.BAR_TOP_N)
+
+        handle_patch = Patch()
+        handle_patch["correction_method"] = correction_method
+        site_page_data, site_page_count = patch_adjusted_page(result.site_results, result.views, "site", site_data,
+                                                              site_page, site_page_size, site_sort, site_filter)
+        sub_page_data, sub_page_count = patch_adjusted_page(result.sub_results, result.views, "sub", sub_data,
+                                                            sub_page, sub_page_size, sub_sort, sub_filter)
+        return (
+            handle_patch,
+            site_page_data,
+            site_page_count,
+            sub_page_data,
+            sub_page_count,
+            patch_barplot(result.site_results, "Site-level", top_n, selected_kinase(site_cell, site_data)),
+            patch_barplot(result.sub_results, "Substrate-level", top_n, selected_kinase(sub_cell, sub_data)),
+            patch_volcano_plot(result),
+        )
 
-        button_id_triggered = ctx.triggered_id
 
-        if button_id_triggered == "cancel-download-modal-button" and n_cancel:
-            print("INFO: Cancel button clicked. Closing modal.")
-            return False, dash.no_update, dash.no_update
-        
-        if button_id_triggered == "button-download" and n_site and n_site > 0:
-            print(f"INFO: Download-Button '{button_id_triggered}' geklickt. Öffne Dateinamen-Modal für Site-Level.") # <--- Logging
-            default_filename = get_default_filename(current_title_from_store)
-            return True, default_filename, "site" # Modal öffnen
-        elif button_id_triggered == "button-download-high-level" and n_high and n_high > 0:
-            print(f"INFO: Download-Button '{button_id_triggered}' geklickt. Öffne Dateinamen-Modal für Sub-Level.") # <--- Logging
-            default_filename = get_default_filename(current_title_from_store)
-            return True, default_filename, "sub" # Modal öffnen
-        
-        return dash.no_update, dash.no_update, dash.no_update
-    
-    
     @app.callback(
         [Output("download-tsv", "data"),  # Output für Site-Level dcc.Download
         Output("download-tsv-high-level", "data"),  # Output für Sub-Level dcc.Download
@@ -349,15 +636,11 @@ def register_callbacks(app):
         Input("confirm-download-modal-button", "n_clicks"),
         [State("download-filename-input", "value"),
         State("active-download-type-store", "data"),
-        State("site-level-results-store", "data"),
-        State("site-hit-data-store", "data"),
-        State("sub-level-results-store", "data"),
-        State("sub-hit-data-store", "data")],
+        State("download-format-radio", "value"),
+        State("result-key-store", "data")],
         prevent_initial_call=True
     )
-    def trigger_actual_download(n_confirm, input_filename, active_download_type,
-                                site_results_dict, site_hits_dict,
-                                sub_results_dict, sub_hits_dict):
+    def trigger_actual_download(n_confirm, input_filename, active_download_type, download_format, result_handle):
 
         # Prüfen, ob der Callback durch den Button-Klick ausgelöst wurde und ob Eingaben vorhanden sind
         if not n_confirm or n_confirm == 0 or not input_filename or not active_download_type:
@@ -369,215 +652,126 @@ def register_callbacks(app):
         if not filename_base: # Fallback, falls der Nutzer alles löscht oder nichts eingibt
             filename_base = "enrichment_results" # Oder ein anderer sinnvoller Default
 
+        result = result_store.results.get(result_handle)
+        if result is None:
+            util.log_warning("No stored results for download (not run yet or expired).")
+            return dash.no_update, dash.no_update, False
+
+        # Zip-Bundle aller Tabellen, über die Download-Komponente des geklickten Buttons
+        if download_format and download_format.startswith("bundle-"):
+            bundle = send_bundle(result, filename_base, download_format.split("-", 1)[1])
+            if active_download_type == "sub":
+                return dash.no_update, bundle, False
+            return bundle, dash.no_update, False
+
         # Logik für SITE-LEVEL DOWNLOAD
         if active_download_type == "site":
-            if not site_results_dict:
-                print("FEHLER: Site-Level Ergebnisse nicht im Store für den Download.")
-                return dash.no_update, dash.no_update, False 
-
-            site_results_df = pd.DataFrame.from_dict(site_results_dict)
-            if site_results_df.empty:
-                print("INFO: Site-Level DataFrame ist leer. Kein Download.")
-                return dash.no_update, dash.no_update, False 
-
-            downloadable_df_site = site_results_df.copy() 
-
-            if site_hits_dict:
-                site_hits_df = pd.DataFrame.from_dict(site_hits_dict)
-                if not site_hits_df.empty and "KINASE" in site_hits_df.columns and \
-                   "SUB_MOD_RSD_sample" in site_hits_df.columns and "IMPUTED" in site_hits_df.columns: # Prüfe auf neue Spalten
-                    print("INFO: Site hits data available for custom merging.")
-
-                    # Sicherstellen, dass die Spalten die richtigen Typen haben
-                    site_hits_df["SUB_MOD_RSD_sample"] = site_hits_df["SUB_MOD_RSD_sample"].astype(str)
-                    site_hits_df["IMPUTED"] = site_hits_df["IMPUTED"].astype(bool) # Sicherstellen, dass IMPUTED boolean ist
-
-                    
-                    
-                    def format_hit_string(row):
-                        # todo fixme gene names or upid
-                        upid = row.get("SUB_ACC_ID", "")
-                        # upid = row.get("SUB_GENE", "")
-                        site = row.get("SUB_MOD_RSD_sample", "")
-                        hit_str = f"{upid}-{site}"
-                        if row.get("IMPUTED", False):
-                            hit_str += "(i)"
-                        return hit_str
-
-                    site_hits_df["FORMATTED_HIT"] = site_hits_df.apply(format_hit_string, axis=1)
-                    
-                    
-                    
-                    
-                    # def format_hit_string(row):
-                    #     site = row["SUB_MOD_RSD_sample"]
-                    #     if row["IMPUTED"]:
-                    #         return f"{site}(i)"
-                    #     return site
-
-                    # # Anwenden der Formatierung auf jede Zeile
-                    # site_hits_df["FORMATTED_HIT"] = site_hits_df.apply(format_hit_string, axis=1)
-
-                    # Gruppieren nach KINASE und die formatierten Hits zusammenfassen
-                    # Wichtig: `dropna()` um sicherzustellen, dass nur Zeilen mit gültigen KINASE-Werten berücksichtigt werden
-                    # `set` um Duplikate innerhalb einer Kinase-Gruppe zu entfernen, dann `sorted` für konsistente Reihenfolge
-                    grouped_hits = (
-                        site_hits_df.dropna(subset=['KINASE', 'FORMATTED_HIT'])
-                        .groupby("KINASE")["FORMATTED_HIT"]
-                        .apply(lambda x: ", ".join(sorted(list(set(x))))) # Eindeutige, sortierte Hits
-                        .reset_index(name="HITS") # Spaltenname jetzt "HITS"
-                    )
-                    
-                    # Merge mit dem Haupt-DataFrame
-                    if not grouped_hits.empty:
-                        downloadable_df_site = pd.merge(downloadable_df_site, grouped_hits, on="KINASE", how="left")
-                    else:
-                        # Falls grouped_hits leer ist, füge eine leere HITS-Spalte hinzu, um Konsistenz zu wahren
-                        downloadable_df_site["HITS"] = pd.NA 
-                else:
-                    print("WARNUNG: Erforderliche Spalten (KINASE, SUB_MOD_RSD_sample, IMPUTED) nicht in site_hits_df gefunden oder DataFrame leer.")
-                    downloadable_df_site["HITS"] = pd.NA # Füge eine leere Spalte hinzu, falls keine Hits vorhanden sind
-            else:
-                print("INFO: Keine site_hits_dict Daten vorhanden.")
-                downloadable_df_site["HITS"] = pd.NA # Füge eine leere Spalte hinzu, falls keine Hits vorhanden sind
-            
+            tsv = result.downloads.get("site")
+            if tsv is None:
+                util.log_info("Site-level results are empty. No download.")
+                return dash.no_update, dash.no_update, False
+
             final_filename_site = f"{filename_base}_site_level.tsv"
-            print(f"INFO: Bereite Site-Level Download vor: {final_filename_site}")
-            return dcc.send_data_frame(downloadable_df_site.to_csv, final_filename_site, sep="\t", index=False), dash.no_update, False
+            util.log_info(f"Preparing site-level download: {final_filename_site}")
+            return dcc.send_string(tsv, final_filename_site), dash.no_update, False
 
         # Logik für SUB-LEVEL DOWNLOAD
         elif active_download_type == "sub":
-            if not sub_results_dict:
-                print("FEHLER: Sub-Level Ergebnisse nicht im Store für den Download.")
-                return dash.no_update, None, False # Modal schließen, kein Download
-
-            sub_results_df = pd.DataFrame.from_dict(sub_results_dict)
-            if sub_results_df.empty:
-                print("INFO: Sub-Level DataFrame ist leer. Kein Download.")
+            tsv = result.downloads.get("sub")
+            if tsv is None:
+                util.log_info("Substrate-level results are empty. No download.")
                 return dash.no_update, None, False # Modal schließen, kein Download
 
-            # DataFrame für den Download vorbereiten
-            downloadable_df_sub = sub_results_df.copy()
-            if sub_hits_dict:
-                sub_hits_df = pd.DataFrame.from_dict(sub_hits_dict)
-                if not sub_hits_df.empty and "KINASE" in sub_hits_df.columns and "SUB_GENE" in sub_hits_df.columns:
-                    sub_hits_df["SUB_GENE"] = sub_hits_df["SUB_GENE"].astype(str)
-                    high_hits_grouped = (
-                        sub_hits_df.groupby("KINASE")["SUB_GENE"]
-                        .apply(lambda x: ", ".join(sorted(list(set(x)))))
-                        .reset_index(name="ASSOCIATED_SUBSTRATES")
-                    )
-                    downloadable_df_sub = pd.merge(downloadable_df_sub, high_hits_grouped, on="KINASE", how="left")
-
             final_filename_sub = f"{filename_base}_sub_level.tsv"
-            
-            
-            print("Download mode: ", active_download_type)
-            print(f"INFO: Bereite Sub-Level Download vor: {final_filename_sub} with len {str(len(downloadable_df_sub))}")
+            util.log_info(f"Preparing substrate-level download: {final_filename_sub}")
             # Hier wird der Download für "download-tsv-high-level" ausgelöst
-            return dash.no_update, dcc.send_data_frame(downloadable_df_sub.to_csv, final_filename_sub, sep="\t", index=False), False
+            return dash.no_update, dcc.send_string(tsv, final_filename_sub), False
         
         else:
-            print(f"WARNUNG: Unbekannter active_download_type: {active_download_type}")
+            util.log_warning(f"Unknown active_download_type: {active_download_type}")
             return dash.no_update, dash.no_update, False # Modal schließen, kein Download
     
     
+    def send_bundle(result, filename_base, table_format):
+        if table_format == "parquet" and not export.PARQUET_AVAILABLE:
+            util.log_warning("Parquet export requested but pyarrow is not installed, using gzip TSV.")
+            table_format = "tsv.gz"
+        filename = f"{filename_base}_bundle.zip"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, filename)
+            manifest = export.write_bundle(path, result, table_format=table_format)
+            util.log_info(f"Preparing bundle download: {filename} with {len(manifest['tables'])} tables ({table_format})")
+            return dcc.send_file(path, filename=filename)
+
+
     # --- UI Interaction Callbacks (Modal, Detail Tables) ---
-    @app.callback(
-        Output("modal", "is_open"),
-        [Input("open-modal", "n_clicks"), Input("close-modal", "n_clicks")],
-        [State("modal", "is_open")],
-        prevent_initial_call=True,
-    )
-    def toggle_modal(n_open, n_close, is_open):
-        return not is_open
+    def render_hit_details(result, level, active_cell, table_data, page_current, page_size, sort_by, filter_query):
+        # A new selection starts at the first page of the detail table
+        triggered_by_selection = dash.callback_context.triggered_id in ("table-viewer", "table-viewer-high-level")
+        if triggered_by_selection:
+            page_current = 0
+        new_page = 0 if triggered_by_selection else dash.no_update
 
-    @app.callback(
-        [Output("table-viewer-deep-hits", "columns"), Output("table-viewer-deep-hits", "data")],
-        Input("table-viewer", "active_cell"),
-        State("table-viewer", "data"),
-        State("site-hit-data-store", "data"),
-        prevent_initial_call=True
-    )
-    def display_deep_hit_details(active_cell, table_data, site_hits_dict):
-        if not active_cell or not table_data or not site_hits_dict:
-            return [], [{"Info": "Select a kinase from the table above to see details."}]
-        
         try:
             row_data = table_data[active_cell["row"]]
             kinase = row_data.get("KINASE")
             if not kinase:
-                return [], [{"Info": "Could not identify kinase from selected row."}]
+                return [], [{"Info": "Could not identify kinase from selected row."}], 1, new_page
 
-            site_hits_df = pd.DataFrame.from_dict(site_hits_dict)
-            if site_hits_df.empty or "KINASE" not in site_hits_df.columns:
-                return [], [{"Info": f"No detailed hits data available for {kinase}."}]
-
-            filtered_hits = site_hits_df[site_hits_df["KINASE"] == kinase]
+            filtered_hits = result.hits_for_kinase(level, kinase)
+            if filtered_hits is None:
+                return [], [{"Info": f"No detailed hits data available for {kinase}."}], 1, new_page
             if filtered_hits.empty:
-                return [{"name": "Info", "id": "Info"}], [{"Info": f"No specific hits found for {kinase} in the detailed data."}]
+                return [{"name": "Info", "id": "Info"}], [{"Info": f"No specific hits found for {kinase} in the detailed data."}], 1, new_page
 
-            columns = [{"name": i, "id": i} for i in filtered_hits.columns]
-            return columns, filtered_hits.to_dict("records")
+            page, page_count = table_query.query_page(filtered_hits, page_current, page_size, sort_by, filter_query,
+                                                      cache=result.views, cache_key=(f"{level}-hits", kinase))
+            return table_query.table_columns(filtered_hits, markdown_columns=()), page.to_dict("records"), page_count, new_page
         except Exception as e:
-            print(f"Error in display_deep_hit_details: {e}")
-            return [], [{"Error": "An error occurred while fetching details."}]
-
+            util.log_error(f"Error fetching {level}-level hit details", e)
+            return [], [{"Error": "An error occurred while fetching details."}], 1, new_page
 
     @app.callback(
-        [Output("table-viewer-high-hits", "columns"), Output("table-viewer-high-hits", "data")],
-        Input("table-viewer-high-level", "active_cell"),
-        State("table-viewer-high-level", "data"),
-        State("sub-hit-data-store", "data"),
+        [Output("table-viewer-deep-hits", "columns"), Output("table-viewer-deep-hits", "data"),
+         Output("table-viewer-deep-hits", "page_count"), Output("table-viewer-deep-hits", "page_current")],
+        [Input("table-viewer", "active_cell"),
+         Input("table-viewer-deep-hits", "page_current"),
+         Input("table-viewer-deep-hits", "sort_by"),
+         Input("table-viewer-deep-hits", "filter_query")],
+        [State("table-viewer", "data"),
+         State("table-viewer-deep-hits", "page_size"),
+         State("result-key-store", "data")],
         prevent_initial_call=True
     )
-    def display_high_hit_details(active_cell, table_data, sub_hits_dict):
-        if not active_cell or not table_data or not sub_hits_dict:
-            return [], [{"Info": "Select a kinase from the table above to see details."}]
+    def display_deep_hit_details(active_cell, page_current, sort_by, filter_query, table_data, page_size, result_handle):
+        if not active_cell or not table_data or not result_handle:
+            return [], [{"Info": "Select a kinase from the table above to see details."}], 1, dash.no_update
+        result = result_store.results.get(result_handle)
+        if result is None:
+            return [], [{"Info": "Results expired. Please run the analysis again."}], 1, dash.no_update
+        return render_hit_details(result, "site", active_cell, table_data, page_current, page_size, sort_by, filter_query)
 
-        try:
-            row_data = table_data[active_cell["row"]]
-            kinase = row_data.get("KINASE")
-            if not kinase:
-                return [], [{"Info": "Could not identify kinase from selected row."}]
 
-            sub_hits_df = pd.DataFrame.from_dict(sub_hits_dict)
-            if sub_hits_df.empty or "KINASE" not in sub_hits_df.columns:
-                return [], [{"Info": f"No detailed hits data available for {kinase}."}]
-                
-            filtered_hits = sub_hits_df[sub_hits_df["KINASE"] == kinase]
-            if filtered_hits.empty:
-                return [{"name": "Info", "id": "Info"}], [{"Info": f"No specific hits found for {kinase} in the detailed data."}]
-                
-            columns = [{"name": i, "id": i} for i in filtered_hits.columns]
-            return columns, filtered_hits.to_dict("records")
-        except Exception as e:
-            print(f"Error in display_high_hit_details: {e}")
-            return [], [{"Error": "An error occurred while fetching details."}]
-        
     @app.callback(
-        Output("limit-inferred-hits-store", "data"),
-        Input("limit-inferred-hits-slider", "value"),
+        [Output("table-viewer-high-hits", "columns"), Output("table-viewer-high-hits", "data"),
+         Output("table-viewer-high-hits", "page_count"), Output("table-viewer-high-hits", "page_current")],
+        [Input("table-viewer-high-level", "active_cell"),
+         Input("table-viewer-high-hits", "page_current"),
+         Input("table-viewer-high-hits", "sort_by"),
+         Input("table-viewer-high-hits", "filter_query")],
+        [State("table-viewer-high-level", "data"),
+         State("table-viewer-high-hits", "page_size"),
+         State("result-key-store", "data")],
         prevent_initial_call=True
     )
-    def update_max_inferred_hit_store(slider_value):
-        settings = {
-            "max_hits": int(slider_value)
-        }
-        print(f"Maxium hits settings updated in store: {settings}")
-        return settings
-
-    # --- About Modal Callbacks ---
-    @app.callback(
-        Output("about-modal", "is_open"),
-        [Input("open-about-button", "n_clicks"), Input("close-about-button", "n_clicks")],
-        [State("about-modal", "is_open")],
-    )
-    def toggle_about_modal(n_open, n_close, is_open):
-        if n_open or n_close:
-            return not is_open
-        return is_open
-
+    def display_high_hit_details(active_cell, page_current, sort_by, filter_query, table_data, page_size, result_handle):
+        if not active_cell or not table_data or not result_handle:
+            return [], [{"Info": "Select a kinase from the table above to see details."}], 1, dash.no_update
+        result = result_store.results.get(result_handle)
+        if result is None:
+            return [], [{"Info": "Results expired. Please run the analysis again."}], 1, dash.no_update
+        return render_hit_details(result, "sub", active_cell, table_data, page_current, page_size, sort_by, filter_query)
+        
     @app.callback(
         Output("about-tab-content", "children"),
         Input("about-tabs", "active_tab")
@@ -14,7 +14,7 @@ Q9H1E3_NUCKS1_S79"""
 _BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 _ASSETS_DIR = os.path.join(_BASE_DIR, "assets")
 
-KIN_SUB_DATASET_PATH = os.path.join(_ASSETS_DIR, "Kinase_Substrate_Dataset.txt")
+KIN_SUB_DATASET_PATH = os.environ.get("FUZZYKEA_DATASET_PATH", os.path.join(_ASSETS_DIR, "Kinase_Substrate_Dataset.txt"))
 CUSTOM_DATASET_PATH  = os.path.join(_ASSETS_DIR, "PSP_HARRY_INTERSEC.tsv")
 
 REACTOME_PATH = os.path.join(_ASSETS_DIR, "UniProt2Reactome_All_Levels.tsv")
@@ -29,6 +29,51 @@ QUIET = False
 VIEW_ALL = False
 OUTPUT_PATH = "results.txt"
 
+# Logging (records are handed to a background thread, see util.py)
+LOG_LEVEL = os.environ.get("FUZZYKEA_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("FUZZYKEA_LOG_FORMAT", "color")  # "color", "plain" or "json"
+LOG_RATE_LIMIT_SECONDS = float(os.environ.get("FUZZYKEA_LOG_RATE_LIMIT", "10"))
+SHOW_PROGRESS = os.environ.get("FUZZYKEA_PROGRESS", "0") == "1"  # tqdm bars for pandas applies
+
+# Opt-in profiling of analysis requests (see profiling.py)
+PROFILE_ENABLED = os.environ.get("FUZZYKEA_PROFILE", "0") == "1"
+PROFILE_MODE = os.environ.get("FUZZYKEA_PROFILE_MODE", "cprofile")  # "cprofile" or "sample"
+PROFILE_DIR = os.environ.get("FUZZYKEA_PROFILE_DIR", os.path.join(_BASE_DIR, "profiles"))
+PROFILE_TOKEN = os.environ.get("FUZZYKEA_PROFILE_TOKEN", "")  # enables the admin header if set
+PROFILE_HEADER = "X-FuzzyKEA-Profile"
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("FUZZYKEA_PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Server-side result storage (see result_store.py)
+RESULT_STORE_MAX_ENTRIES = int(os.environ.get("FUZZYKEA_RESULT_STORE_MAX_ENTRIES", "200"))
+RESULT_STORE_TTL_SECONDS = int(os.environ.get("FUZZYKEA_RESULT_STORE_TTL", "3600"))
+RESULT_STORE_RUNS_PER_SESSION = 2
+RESULT_STORE_MODE = os.environ.get("FUZZYKEA_RESULT_STORE_MODE", "server")  # "server" or "client" (multi-worker)
+
+# Uploaded site files are kept on disk and parsed from there (see uploads.py)
+UPLOAD_DIR = os.environ.get("FUZZYKEA_UPLOAD_DIR", "")  # empty: a temporary directory
+UPLOAD_MAX_FILES = int(os.environ.get("FUZZYKEA_UPLOAD_MAX_FILES", "100"))
+UPLOAD_TTL_SECONDS = int(os.environ.get("FUZZYKEA_UPLOAD_TTL", "3600"))
+UPLOAD_PREVIEW_LINES = 20  # lines shown in the text area instead of the whole file
+SITE_CHUNK_LINES = 100000  # lines parsed per chunk by util.read_sites_stream
+
+# Fuzzy matching engine (see matching.py): "streaming" (chunked, bounded memory), "parallel"
+# (streaming sharded over a process pool) or "rowwise" (util.fuzzy_join)
+MATCH_ENGINE = os.environ.get("FUZZYKEA_MATCH_ENGINE", "streaming")
+MATCH_MEMORY_BUDGET_MB = float(os.environ.get("FUZZYKEA_MATCH_MEMORY_MB", "256"))  # candidate pairs per chunk
+MATCH_WORKERS = int(os.environ.get("FUZZYKEA_MATCH_WORKERS", "0")) or os.cpu_count() or 1
+MATCH_START_METHOD = os.environ.get("FUZZYKEA_MATCH_START_METHOD", "spawn")  # multiprocessing start method
+MATCH_PARALLEL_MIN_PAIRS = 200000  # smaller inputs are matched in-process
+
+P_VALUE_CACHE_SIZE = 100000  # memoized contingency tables (util.contingency_p_values)
+
+# Permutation test of the site level (see permutation.py)
+PERMUTATION_COUNT = int(os.environ.get("FUZZYKEA_PERMUTATIONS", "10000"))
+PERMUTATION_MAX = 100000
+PERMUTATION_SEED = int(os.environ.get("FUZZYKEA_PERMUTATION_SEED", "0"))
+PERMUTATION_BATCH = 500  # draws per sparse product and pool task
+# Sampling stops for a kinase once its p-value is certain to exceed this level (0 disables)
+PERMUTATION_ALPHA = float(os.environ.get("FUZZYKEA_PERMUTATION_ALPHA", "0.05"))
+
 APP_TITLE = "fuzzyKEA"
 APP_SUBTITLE = "Fuzzy Kinase Enrichment Analysis"
 APP_VERSION = "1.0.0-alpha"
@@ -104,6 +149,13 @@ DEFAULT_HEADER_STYLE = {
 }
 
 BAR_COLORSCALE = "Viridis"
+BAR_TOP_N = 10  # default number of kinases in the bar plots
+BAR_HIGHLIGHT_COLOR = DANGER_COLOR  # outline of the kinase selected in a result table
+
+# Volcano overview of all kinases (Scattergl); larger results are thinned out, see util.downsample_points
+VOLCANO_MAX_POINTS = 2000  # per level
+VOLCANO_GRID = 100  # cells per axis used to thin out overlapping points
+VOLCANO_SIGNIFICANCE = 0.05  # dashed line at -log10 of this adjusted p-value
 
 STORAGE_TYPE = "session"
 DEFAULT_DOWNLOAD_FILE_NAME = "fuzzyKEA_results"
@@ -112,6 +164,14 @@ DEFAULT_DOWNLOAD_FILE_NAME = "fuzzyKEA_results"
 STATISTICAL_TEST_METHODS = [
     {"label": "Fisher's Exact Test", "value": "fisher"},
     {"label": "Chi-Square Test", "value": "chi2"},
+    {"label": "Permutation Test (empirical)", "value": "permutation"},
+]
+
+# Download formats of the filename modal; bundles contain all tables of a run (see export.py)
+DOWNLOAD_FORMATS = [
+    {"label": "TSV (this table)", "value": "tsv"},
+    {"label": "Zip bundle of all tables (gzip TSV)", "value": "bundle-tsv.gz"},
+    {"label": "Zip bundle of all tables (Parquet)", "value": "bundle-parquet"},
 ]
 
 # Multiple testing correction methods
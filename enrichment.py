@@ -0,0 +1,202 @@
+# enrichment.py
+"""
+Kinase enrichment engine.
+
+An analysis combines a unit of counting with a test:
+
+- The unit decides which background rows are counted (M rows in total, n
+  per kinase) and how the input sites become hits:
+  SiteUnit counts exact (SUB_ACC_ID, SUB_MOD_RSD) matches of background rows,
+  SubstrateUnit counts kinase-substrate pairs (input and background reduced
+  to proteins, the background pairs come from the cached index of
+  matching.py), and FuzzySiteUnit counts the closest background site of
+  every input site within a position tolerance (site_matching.fuzzy_join or
+  matching.py), with hit counts capped at n.
+- The test turns the hit count x of a kinase, its annotations n, the number
+  of hits N and the background size M into a p-value: ContingencyTest
+  (Fisher's exact or chi-square, pvalues.contingency_p_values) or
+  PermutationTest (permutation.py, fuzzy sites only).
+
+run() computes the hits, the hit and annotation counts of all kinases (one
+groupby each), the p-values and the multiple testing correction.
+"""
+import numpy as np
+import pandas as pd
+
+import constants
+import logs
+import matching
+import permutation
+import pvalues
+import site_matching
+
+# Columns of enrichment results; ADJ_P_VALUE and NEG_LOG10_ADJ_P are added by pvalues.add_adjusted_p_values
+RESULT_COLUMNS = ["KINASE", "P_VALUE", "UPID", "FOUND", "SUB#", "NEG_LOG10_P"]
+
+
+class SiteUnit:
+    """Exact site matches: input sites joined with background rows on accession and site."""
+
+    label = "Site"
+    cap_hits = False
+    sort_by_p_value = False
+
+    def background(self, raw_data):
+        return raw_data
+
+    def hits(self, background, sites):
+        return pd.merge(background, sites, on=["SUB_ACC_ID", "SUB_MOD_RSD"])
+
+
+class SubstrateUnit:
+    """Kinase-substrate pairs: input proteins joined with the distinct (KINASE, SUB_ACC_ID) background rows."""
+
+    label = "Substrate"
+    cap_hits = False
+    sort_by_p_value = True
+
+    def background(self, raw_data):
+        # Built once per background version and amino acid filter (the residue view of raw_data)
+        return matching.residue_view(raw_data).substrates()
+
+    def hits(self, background, sites):
+        sites = sites.drop(columns=['SUB_MOD_RSD']).drop_duplicates(subset=["SUB_ACC_ID"])
+        return pd.merge(background.rows_for(sites['SUB_ACC_ID']), sites, on=["SUB_ACC_ID"])
+
+
+class FuzzySiteUnit:
+    """Closest background site per input site within a position tolerance, at most one hit per input site."""
+
+    label = "Fuzzy site"
+    cap_hits = True  # x is capped at n, see run
+    sort_by_p_value = False
+
+    def __init__(self, tolerance=0, aa_mode='exact', inferred_hit_limit=None, engine=None):
+        self.tolerance = tolerance
+        self.aa_mode = aa_mode
+        self.inferred_hit_limit = inferred_hit_limit
+        self.engine = engine or constants.MATCH_ENGINE
+
+    def background(self, raw_data):
+        return raw_data
+
+    def hits(self, background, sites):
+        if self.engine in ("streaming", "parallel"):
+            join = matching.fuzzy_join_parallel if self.engine == "parallel" else matching.fuzzy_join_streaming
+        else:
+            join = site_matching.fuzzy_join
+        # No pd.DataFrame() wrapper for frames: residue view frames are recognized by identity
+        background = background if isinstance(background, pd.DataFrame) else pd.DataFrame(background)
+        hits = join(samples=sites, background=background, tolerance=self.tolerance,
+                    aa_mode=self.aa_mode, inferred_hit_limit=self.inferred_hit_limit)
+        logs.log_debug(f"Fuzzy matches: {len(hits)} rows")
+        return hits
+
+
+class ContingencyTest:
+    """One-sided test of the 2x2 table of hits vs. annotations ('fisher' or 'chi2')."""
+
+    def __init__(self, name='fisher'):
+        self.name = name
+
+    def p_values(self, kinases, x, n, N, M, hits, background, unit):
+        return pvalues.contingency_p_values(x, n, [N] * len(x), [M] * len(x), self.name)
+
+
+class PermutationTest:
+    """Empirical p-values from random background site sets (see permutation.py)."""
+
+    name = 'permutation'
+
+    def __init__(self, n_permutations=None, seed=None):
+        self.n_permutations = n_permutations
+        self.seed = seed
+
+    def p_values(self, kinases, x, n, N, M, hits, background, unit):
+        # Observed counts before capping, the draws are not capped either
+        p_values = permutation.permutation_p_values(kinases, hits, background,
+                                                    n_permutations=self.n_permutations, seed=self.seed)
+        return p_values, -np.log10(p_values)
+
+
+def get_test(statistical_test, unit, n_permutations=None, seed=None):
+    """The test strategy for a statistical_test setting; permutations are only defined for fuzzy sites."""
+    if statistical_test == 'permutation':
+        if isinstance(unit, FuzzySiteUnit):
+            return PermutationTest(n_permutations, seed)
+        # Permutations model the fuzzy site matching; other units keep Fisher's exact test
+        return ContingencyTest('fisher')
+    return ContingencyTest(statistical_test)
+
+
+def kinase_results(hits, background, test, unit):
+    """
+    Hit counts and p-values of all kinases with hits.
+
+    Args:
+        hits: Hit table of the unit (KINASE, KIN_ACC_ID per hit)
+        background: Counted background rows of the unit (DataFrame, residue view frame or
+            matching.SubstrateBackground)
+        test: ContingencyTest or PermutationTest
+        unit: Unit of counting
+
+    Returns:
+        DataFrame with RESULT_COLUMNS, by descending hit count
+    """
+    kinases = hits.groupby(['KINASE', 'KIN_ACC_ID']).size().reset_index(name='count')
+    kinases = kinases.sort_values(by='count', ascending=False, kind='mergesort').reset_index(drop=True)
+    # Annotated rows per kinase and in total (partition counts of the index for residue views)
+    annotations, M = matching.annotation_counts(background)
+    n = annotations.reindex(kinases['KIN_ACC_ID']).fillna(0).to_numpy(dtype=np.int64)
+    x = kinases['count'].to_numpy(dtype=np.int64)
+    N = len(hits)
+    logs.log_info(f"Calculating p-values using {test.name} test (unit: {unit.label}), "
+                  f"kinases: {len(kinases)}, hits: {N}, background: {M}")
+
+    if unit.cap_hits:
+        capped = x > n
+        if capped.any():
+            logs.log_warning(f"Capped hit count x to n for {int(capped.sum())} kinase(s)", rate_limit_key="fuzzy-cap")
+        x = np.minimum(x, n)
+
+    # Tables with a negative cell are not tested
+    valid = (n - x >= 0) & (N - x >= 0) & (M - N - n + x >= 0)
+    p_values, neg_log10_p = np.ones(len(x)), np.zeros(len(x))
+    if valid.any():
+        tested, tested_log = test.p_values(kinases[valid], x[valid], n[valid], N, M, hits, background, unit)
+        p_values[valid], neg_log10_p[valid] = tested, tested_log
+    if ((p_values < 0) | (p_values > 1)).any():
+        logs.log_warning(f"Invalid p-values for kinases {kinases['KINASE'][(p_values < 0) | (p_values > 1)].tolist()}",
+                         rate_limit_key="invalid-p-value")
+
+    return pd.DataFrame({
+        "KINASE": kinases['KINASE'], "P_VALUE": p_values, "UPID": kinases['KIN_ACC_ID'],
+        "FOUND": x, "SUB#": n, "NEG_LOG10_P": neg_log10_p,
+    }, columns=RESULT_COLUMNS)
+
+
+def run(unit, raw_data, sites, correction_method, statistical_test='fisher', n_permutations=None, seed=None):
+    """
+    Runs one enrichment analysis.
+
+    Args:
+        unit: SiteUnit, SubstrateUnit or FuzzySiteUnit
+        raw_data: Background (PSP kinase-substrate rows)
+        sites: Parsed input sites (SUB_ACC_ID, SUB_MOD_RSD)
+        correction_method: Multiple testing correction (statsmodels method name)
+        statistical_test: 'fisher', 'chi2' or 'permutation'
+        n_permutations: Draws of the permutation test (default PERMUTATION_COUNT)
+        seed: Seed of the permutation test (default PERMUTATION_SEED)
+
+    Returns:
+        (results, hits): results with RESULT_COLUMNS plus the adjusted p-values
+    """
+    logs.log_info(f"Initiating {unit.label.lower()}-level KSEA analysis")
+    background = unit.background(raw_data)
+    hits = unit.hits(background, sites)
+    test = get_test(statistical_test, unit, n_permutations, seed)
+    results = kinase_results(hits, background, test, unit)
+    if unit.sort_by_p_value:
+        results = results.sort_values(by="P_VALUE", kind="mergesort")
+    pvalues.add_adjusted_p_values(results, correction_method)
+    return results.reset_index(drop=True), hits
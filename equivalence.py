@@ -0,0 +1,289 @@
+# equivalence.py
+"""
+Randomized equivalence harness for enrichment backends.
+
+Every faster matching or statistics path must reproduce the frozen
+reference implementation (reference_engine.py): the same kinases, p-values,
+FOUND and SUB# counts, and the same hit rows with the same IMPUTED flags.
+
+A backend is a callable
+
+    backend(raw_data, sites, correction_method, statistical_test,
+            tolerance, aa_mode, inferred_hit_limit) -> (results, hits)
+
+registered with @register_backend. The harness generates small random
+backgrounds and inputs that are dense in edge cases (ties in distance,
+sites annotated to several kinases, invalid sites, S/T mode, limit 0) and
+compares every registered backend against the reference.
+
+Usage:
+    python equivalence.py                      # all backends, 200 cases
+    python equivalence.py --backend util --cases 1000 --seed 7
+"""
+import argparse
+import math
+import sys
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import reference_engine
+
+BACKENDS = {}
+
+HIT_KEY_COLUMNS = ['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg',
+                   'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE']
+AA_MODES = ['exact', 'st-similar', 'ignore']
+TOLERANCES = [0, 1, 2, 3, 5, 10]
+HIT_LIMITS = [None, 0, 1, 2, 7]
+
+
+def register_backend(name):
+    """Decorator that adds a backend to the harness under the given name."""
+    def decorator(func):
+        BACKENDS[name] = func
+        return func
+    return decorator
+
+
+@register_backend("reference")
+def reference_backend(raw_data, sites, correction_method, statistical_test, tolerance, aa_mode, inferred_hit_limit):
+    return reference_engine.fuzzy_enrichment(raw_data, sites, correction_method, statistical_test,
+                                             tolerance=tolerance, aa_mode=aa_mode,
+                                             inferred_hit_limit=inferred_hit_limit)
+
+
+@register_backend("util")
+def util_backend(raw_data, sites, correction_method, statistical_test, tolerance, aa_mode, inferred_hit_limit):
+    import util
+    return util.perform_fuzzy_enrichment(raw_data, sites, correction_method, statistical_test,
+                                         tolerance=tolerance, aa_mode=aa_mode,
+                                         inferred_hit_limit=inferred_hit_limit, engine="rowwise")
+
+
+@register_backend("streaming")
+def streaming_backend(raw_data, sites, correction_method, statistical_test, tolerance, aa_mode, inferred_hit_limit):
+    import matching
+    # A budget of a few candidate pairs forces many chunks on the small cases
+    budget_mb = 8 * matching.BYTES_PER_PAIR / (1024 * 1024)
+    hits = matching.fuzzy_join_streaming(sites, raw_data, tolerance=tolerance, aa_mode=aa_mode,
+                                         inferred_hit_limit=inferred_hit_limit, memory_budget_mb=budget_mb)
+    return _fuzzy_stats(raw_data, hits, correction_method, statistical_test)
+
+
+@register_backend("parallel")
+def parallel_backend(raw_data, sites, correction_method, statistical_test, tolerance, aa_mode, inferred_hit_limit):
+    import matching
+    # Shard even the small cases over two workers
+    hits = matching.fuzzy_join_parallel(sites, raw_data, tolerance=tolerance, aa_mode=aa_mode,
+                                        inferred_hit_limit=inferred_hit_limit, workers=2, min_pairs=0)
+    return _fuzzy_stats(raw_data, hits, correction_method, statistical_test)
+
+
+def _fuzzy_stats(raw_data, hits, correction_method, statistical_test):
+    import enrichment
+    import util
+    unit = enrichment.FuzzySiteUnit()
+    results = enrichment.kinase_results(hits, raw_data, enrichment.get_test(statistical_test, unit), unit)
+    return util.add_adjusted_p_values(results, correction_method), hits
+
+
+def generate_case(rng):
+    """
+    Generates one random case.
+
+    Returns:
+        Dict with raw_data, sites and the analysis parameters
+    """
+    n_proteins = int(rng.integers(1, 7))
+    kinases = [(f"KIN{i}", f"K{i:04d}") for i in range(int(rng.integers(1, 7)))]
+    residues = ['S', 'T', 'Y', 'H']
+
+    bg_rows = []
+    sample_rows = []
+    for p in range(n_proteins):
+        acc, gene = f"P{p:04d}", f"GENE{p}"
+        positions = sorted(set(int(v) for v in rng.integers(1, 60, size=int(rng.integers(1, 8)))))
+        for pos in positions:
+            aa = residues[int(rng.choice(4, p=[0.5, 0.3, 0.15, 0.05]))]
+            # Sites annotated to several kinases create ties at distance 0
+            for k in rng.choice(len(kinases), size=int(rng.integers(1, min(3, len(kinases)) + 1)), replace=False):
+                kinase, kin_acc = kinases[int(k)]
+                bg_rows.append({"GENE": kinase, "KINASE": kinase, "KIN_ACC_ID": kin_acc,
+                                "SUB_ACC_ID": acc, "SUB_GENE": gene, "SUB_MOD_RSD": f"{aa}{pos}"})
+        # Input sites: exact copies, shifted sites and midpoints between two
+        # background sites (ties in distance)
+        for _ in range(int(rng.integers(0, 6))):
+            base = int(rng.choice(positions))
+            kind = rng.random()
+            if kind < 0.35:
+                pos = base
+            elif kind < 0.7 or len(positions) < 2:
+                pos = max(1, base + int(rng.integers(-6, 7)))
+            else:
+                i = int(rng.integers(len(positions) - 1))
+                pos = (positions[i] + positions[i + 1]) // 2
+            aa = residues[int(rng.choice(4, p=[0.5, 0.3, 0.15, 0.05]))]
+            sample_rows.append({"SUB_ACC_ID": acc, "UPID": gene, "SUB_MOD_RSD": f"{aa}{pos}"})
+
+    # Proteins missing from the background and malformed sites
+    if rng.random() < 0.5:
+        sample_rows.append({"SUB_ACC_ID": "Q9999", "UPID": "NOPE", "SUB_MOD_RSD": "S10"})
+    if rng.random() < 0.2 and sample_rows:
+        sample_rows.append({**sample_rows[0], "SUB_MOD_RSD": "Sx1"})
+    if rng.random() < 0.3 and bg_rows:
+        bg_rows.append({**bg_rows[0], "SUB_MOD_RSD": "S"})
+    if rng.random() < 0.2 and bg_rows:
+        bg_rows.append({**bg_rows[-1], "SUB_MOD_RSD": "Sab"})
+    if not sample_rows:
+        sample_rows.append({"SUB_ACC_ID": "P0000", "UPID": "GENE0", "SUB_MOD_RSD": "S1"})
+
+    raw_data = pd.DataFrame(bg_rows, columns=["GENE", "KINASE", "KIN_ACC_ID", "SUB_ACC_ID", "SUB_GENE", "SUB_MOD_RSD"])
+    sites = pd.DataFrame(sample_rows, columns=["SUB_ACC_ID", "UPID", "SUB_MOD_RSD"]).drop_duplicates()
+    return {
+        "raw_data": raw_data,
+        "sites": sites,
+        "correction_method": "fdr_bh",
+        "statistical_test": "chi2" if rng.random() < 0.2 else "fisher",
+        "tolerance": int(rng.choice(TOLERANCES)),
+        "aa_mode": str(rng.choice(AA_MODES)),
+        "inferred_hit_limit": HIT_LIMITS[int(rng.integers(len(HIT_LIMITS)))],
+    }
+
+
+def generate_cases(n_cases, seed=0):
+    rng = np.random.default_rng(seed)
+    return [generate_case(rng) for _ in range(n_cases)]
+
+
+def _close(a, b, rtol):
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return a == b or abs(a - b) <= rtol * max(abs(a), abs(b))
+
+
+def compare_results(expected, actual, rtol=1e-9):
+    """
+    Compares the output of two backends.
+
+    Args:
+        expected: (results, hits) of the reference
+        actual: (results, hits) of the candidate
+        rtol: Relative tolerance for P_VALUE and ADJ_P_VALUE
+
+    Returns:
+        List of human readable mismatches, empty if equivalent
+    """
+    problems = []
+    exp_results, exp_hits = expected
+    act_results, act_hits = actual
+
+    exp_by_kinase = {(r.KINASE, r.UPID): r for r in exp_results.itertuples(index=False)} if not exp_results.empty else {}
+    act_by_kinase = {(r.KINASE, r.UPID): r for r in act_results.itertuples(index=False)} if not act_results.empty else {}
+    missing = sorted(set(exp_by_kinase) - set(act_by_kinase))
+    extra = sorted(set(act_by_kinase) - set(exp_by_kinase))
+    if missing:
+        problems.append(f"missing kinases: {missing}")
+    if extra:
+        problems.append(f"unexpected kinases: {extra}")
+
+    for key in sorted(set(exp_by_kinase) & set(act_by_kinase)):
+        exp, act = exp_by_kinase[key], act_by_kinase[key]
+        exp_row, act_row = exp._asdict(), act._asdict()
+        for col in ("FOUND", "SUB#"):
+            # SUB# is renamed by itertuples since it is not a valid identifier
+            exp_val = exp[exp_results.columns.get_loc(col)]
+            act_val = act[act_results.columns.get_loc(col)]
+            if int(exp_val) != int(act_val):
+                problems.append(f"{key}: {col} {act_val} != {exp_val}")
+        for col in ("P_VALUE", "ADJ_P_VALUE"):
+            if col in exp_row and col in act_row and not _close(float(exp_row[col]), float(act_row[col]), rtol):
+                problems.append(f"{key}: {col} {act_row[col]!r} != {exp_row[col]!r}")
+
+    def hit_multiset(hits):
+        if hits is None or hits.empty:
+            return Counter()
+        cols = [c for c in HIT_KEY_COLUMNS if c in hits.columns]
+        frame = hits[cols].copy()
+        if 'IMPUTED' in frame.columns:
+            frame['IMPUTED'] = frame['IMPUTED'].astype(bool)
+        return Counter(map(tuple, frame.astype(object).to_numpy().tolist()))
+
+    exp_hits_set, act_hits_set = hit_multiset(exp_hits), hit_multiset(act_hits)
+    if exp_hits_set != act_hits_set:
+        problems.append(f"hit rows differ: missing {sorted(exp_hits_set - act_hits_set)[:5]}, "
+                        f"unexpected {sorted(act_hits_set - exp_hits_set)[:5]}")
+    return problems
+
+
+def run_case(backend, case):
+    args = (case["raw_data"], case["sites"], case["correction_method"], case["statistical_test"],
+            case["tolerance"], case["aa_mode"], case["inferred_hit_limit"])
+    return backend(*args)
+
+
+def check_backend(backend, cases, rtol=1e-9):
+    """
+    Runs a backend and the reference on all cases.
+
+    Returns:
+        List of (case index, case, problems) for every case that differs
+    """
+    failures = []
+    for i, case in enumerate(cases):
+        try:
+            expected = run_case(reference_backend, case)
+        except Exception as e:
+            # Degenerate tables (e.g. chi2 with a zero expected count) raise in
+            # the reference; a candidate has to fail the same way.
+            try:
+                run_case(backend, case)
+            except type(e):
+                continue
+            except Exception as other:
+                failures.append((i, case, [f"reference raised {type(e).__name__}, backend raised {type(other).__name__}"]))
+                continue
+            failures.append((i, case, [f"reference raised {type(e).__name__}: {e}, backend did not"]))
+            continue
+        try:
+            actual = run_case(backend, case)
+        except Exception as e:
+            failures.append((i, case, [f"backend raised {type(e).__name__}: {e}"]))
+            continue
+        problems = compare_results(expected, actual, rtol=rtol)
+        if problems:
+            failures.append((i, case, problems))
+    return failures
+
+
+def describe_case(case):
+    params = {k: v for k, v in case.items() if k not in ("raw_data", "sites")}
+    return (f"params: {params}\nbackground:\n{case['raw_data'].to_string()}\n"
+            f"sites:\n{case['sites'].to_string()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare enrichment backends against the frozen reference.")
+    parser.add_argument("--backend", action="append", help="Backend(s) to check (default: all)")
+    parser.add_argument("--cases", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rtol", type=float, default=1e-9)
+    args = parser.parse_args(argv)
+
+    names = args.backend or [name for name in BACKENDS if name != "reference"]
+    cases = generate_cases(args.cases, seed=args.seed)
+    exit_code = 0
+    for name in names:
+        failures = check_backend(BACKENDS[name], cases, rtol=args.rtol)
+        print(f"{name}: {len(cases) - len(failures)}/{len(cases)} cases equivalent")
+        for i, case, problems in failures[:3]:
+            print(f"--- case {i}: " + "; ".join(problems))
+            print(describe_case(case))
+        if failures:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
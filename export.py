@@ -0,0 +1,128 @@
+# export.py
+"""
+Export of a whole analysis run as one zip bundle.
+
+The bundle contains the site- and substrate-level result tables (with the
+HITS / ASSOCIATED_SUBSTRATES columns of the single-table downloads), both
+hit tables and a manifest.json with the analysis parameters and the
+version of the kinase-substrate background. Tables are stored either as
+gzip-compressed TSV or, if pyarrow is installed, as Parquet.
+
+Tables are written in row chunks straight into the zip file on disk, so
+memory use does not grow with the size of the run.
+"""
+import functools
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+
+import constants
+import util
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+PARQUET_AVAILABLE = pq is not None
+CHUNK_ROWS = 50000
+TABLE_FORMATS = ("tsv.gz", "parquet")
+
+
+@functools.lru_cache(maxsize=8)
+def _file_digest(path, size, mtime):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return {
+        "file": os.path.basename(path),
+        "size": size,
+        "modified": datetime.fromtimestamp(mtime, timezone.utc).isoformat(),
+        "sha256": sha.hexdigest(),
+    }
+
+
+def background_version(path=None):
+    """Identifies the background dataset file (name, size, modification time and SHA-256)."""
+    path = path or constants.KIN_SUB_DATASET_PATH
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {"file": os.path.basename(path), "available": False}
+    return dict(_file_digest(path, stat.st_size, stat.st_mtime))
+
+
+def _write_tsv_gz(zf, name, df):
+    with zf.open(name, "w", force_zip64=True) as member, gzip.GzipFile(fileobj=member, mode="wb") as gz:
+        for start in range(0, max(len(df), 1), CHUNK_ROWS):
+            chunk = df.iloc[start:start + CHUNK_ROWS]
+            gz.write(chunk.to_csv(sep="\t", index=False, header=start == 0).encode("utf-8"))
+
+
+def _write_parquet(zf, name, df, tmp_dir):
+    # ParquetWriter needs a seekable file, so row groups go to a temporary
+    # file first and are then copied into the archive
+    path = os.path.join(tmp_dir, name)
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, max(len(df), 1), CHUNK_ROWS):
+            chunk = df.iloc[start:start + CHUNK_ROWS]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    zf.write(path, name)
+    os.remove(path)
+
+
+def bundle_tables(result):
+    """Returns the (name, DataFrame) pairs of a stored AnalysisResult that go into the bundle."""
+    site_table, sub_table = util.build_download_tables(result.site_results, result.sub_results,
+                                                       result.site_hits, result.sub_hits)
+    tables = [("site_level_results", site_table), ("sub_level_results", sub_table),
+              ("site_level_hits", result.site_hits), ("sub_level_hits", result.sub_hits)]
+    return [(name, df) for name, df in tables if df is not None and not df.empty]
+
+
+def write_bundle(path, result, table_format="tsv.gz"):
+    """
+    Writes the zip bundle of an analysis run.
+
+    Args:
+        path: Output path of the zip file
+        result: result_store.AnalysisResult
+        table_format: "tsv.gz" or "parquet"
+
+    Returns:
+        The manifest written to manifest.json
+    """
+    if table_format not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format: {table_format}")
+    if table_format == "parquet" and not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet export requires pyarrow")
+
+    manifest = {
+        "app": constants.APP_TITLE,
+        "version": constants.APP_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "format": table_format,
+        "parameters": result.params,
+        "background": background_version(),
+        "tables": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name, df in bundle_tables(result):
+            filename = f"{name}.{table_format}"
+            if table_format == "parquet":
+                _write_parquet(zf, filename, df, tmp_dir)
+            else:
+                _write_tsv_gz(zf, filename, df)
+            manifest["tables"].append({"name": name, "file": filename, "rows": len(df),
+                                       "columns": [str(c) for c in df.columns]})
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2, default=str),
+                    compress_type=zipfile.ZIP_DEFLATED)
+    return manifest
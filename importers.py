@@ -0,0 +1,170 @@
+# importers.py
+"""
+Import of phosphosite report tables from search engines.
+
+Besides the ACC_GENE_S123 text format (util.read_sites), site tables of
+MaxQuant (Phospho (STY)Sites.txt), Spectronaut (PTM site reports) and
+DIA-NN (site reports) can be analysed directly. The format is detected
+from the header columns; each format lists candidate column names for
+the accession, gene, residue, position and localization probability.
+
+Tables are read in row chunks with only the needed columns, and each
+chunk is converted with vectorized string operations into the parsed-site
+structure that start_eval consumes (SUB_ACC_ID, UPID, SUB_MOD_RSD).
+Protein groups ("P1;P2") contribute their leading protein.
+"""
+import csv
+
+import numpy as np
+import pandas as pd
+
+import constants
+import util
+
+SITE_COLUMNS = ["SUB_ACC_ID", "UPID", "SUB_MOD_RSD"]
+
+# Candidate column names per role, first match wins. Rows flagged with "+"
+# in one of the exclude columns (decoys, contaminants) are dropped.
+FORMATS = {
+    "maxquant": {
+        "label": "MaxQuant site table",
+        "accession": ("Protein", "Leading proteins", "Proteins"),
+        "gene": ("Gene names", "Gene name"),
+        "residue": ("Amino acid",),
+        "position": ("Position",),
+        "probability": ("Localization prob",),
+        "exclude": ("Reverse", "Potential contaminant", "Contaminant"),
+    },
+    "spectronaut": {
+        "label": "Spectronaut PTM site report",
+        "accession": ("PTM.ProteinId", "PG.ProteinAccessions", "PG.ProteinGroups"),
+        "gene": ("PG.Genes", "PTM.Genes", "PG.GeneNames"),
+        "residue": ("PTM.SiteAA",),
+        "position": ("PTM.SiteLocation",),
+        "probability": ("PTM.SiteProbability",),
+        "exclude": (),
+    },
+    "diann": {
+        "label": "DIA-NN site report",
+        "accession": ("Protein", "Protein.Ids", "Protein.Group"),
+        "gene": ("Gene", "Genes"),
+        "residue": ("Residue",),
+        "position": ("Site",),
+        "probability": ("Site.Probability", "PTM.Site.Confidence", "Best.Site.Confidence"),
+        "exclude": (),
+    },
+}
+REQUIRED_ROLES = ("accession", "residue", "position")
+OPTIONAL_ROLES = ("gene", "probability")
+
+
+def split_header(line):
+    """Returns (columns, separator) of a header line; tab-separated unless there is no tab."""
+    line = line.rstrip("\r\n")
+    sep = "\t" if "\t" in line else ","
+    return next(csv.reader([line], delimiter=sep), []), sep
+
+
+def resolve_columns(columns, fmt):
+    """Maps the roles of a format to the columns present in a table, None where a role has no column."""
+    spec = FORMATS[fmt]
+    present = set(columns)
+    resolved = {role: next((c for c in spec[role] if c in present), None) for role in REQUIRED_ROLES + OPTIONAL_ROLES}
+    resolved["exclude"] = [c for c in spec["exclude"] if c in present]
+    return resolved
+
+
+def detect_format(columns):
+    """Returns the name of the first format whose required columns are all present, else None."""
+    for fmt in FORMATS:
+        resolved = resolve_columns(columns, fmt)
+        if all(resolved[role] is not None for role in REQUIRED_ROLES):
+            return fmt
+    return None
+
+
+def _first_item(series):
+    # Leading entry of ";"-separated protein groups
+    return series.str.split(";", n=1).str[0].str.strip()
+
+
+def convert_chunk(chunk, columns, min_localization_prob=None):
+    """
+    Converts rows of a site table into parsed sites.
+
+    Args:
+        chunk: DataFrame of str columns
+        columns: Role to column mapping (see resolve_columns)
+        min_localization_prob: Drop sites below this localization probability (None: keep all)
+
+    Returns:
+        DataFrame with SUB_ACC_ID, UPID and SUB_MOD_RSD
+    """
+    accession = _first_item(chunk[columns["accession"]].fillna(""))
+    # FASTA headers (sp|P12345|NAME_HUMAN) are reduced to the accession
+    accession = accession.str.replace(r"^(?:sp|tr)\|([^|]+)\|.*$", r"\1", regex=True)
+    residue = chunk[columns["residue"]].fillna("").str.strip().str.upper()
+    position = pd.to_numeric(_first_item(chunk[columns["position"]].fillna("")), errors="coerce")
+    if columns["gene"] is not None:
+        gene = _first_item(chunk[columns["gene"]].fillna(""))
+    else:
+        gene = pd.Series("", index=chunk.index)
+
+    keep = (accession != "") & residue.str.fullmatch("[A-Z]") & (position > 0) & (np.floor(position) == position)
+    if min_localization_prob is not None and columns["probability"] is not None:
+        probability = pd.to_numeric(_first_item(chunk[columns["probability"]].fillna("")), errors="coerce")
+        keep &= probability >= min_localization_prob
+    for column in columns["exclude"]:
+        keep &= chunk[column].fillna("").str.strip() != "+"
+
+    keep = keep.fillna(False).astype(bool)
+    return pd.DataFrame({
+        "SUB_ACC_ID": accession[keep],
+        "UPID": gene[keep],
+        "SUB_MOD_RSD": residue[keep] + position[keep].astype(np.int64).astype(str),
+    }, columns=SITE_COLUMNS)
+
+
+def read_site_table(f, fmt="auto", min_localization_prob=None, chunksize=constants.SITE_CHUNK_LINES):
+    """
+    Reads a search engine site table into parsed sites.
+
+    Args:
+        f: Text file object positioned at the header line
+        fmt: Name of a format in FORMATS, or "auto" to detect it from the header
+        min_localization_prob: Drop sites below this localization probability (None: keep all)
+        chunksize: Rows converted at a time
+
+    Returns:
+        DataFrame with SUB_ACC_ID, UPID and SUB_MOD_RSD, like util.read_sites
+    """
+    header, sep = split_header(f.readline())
+    if fmt == "auto":
+        fmt = detect_format(header)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown site table format, columns: {header[:10]}")
+    columns = resolve_columns(header, fmt)
+    missing = [role for role in REQUIRED_ROLES if columns[role] is None]
+    if missing:
+        raise ValueError(f"{FORMATS[fmt]['label']} is missing columns for: {', '.join(missing)}")
+    if min_localization_prob is not None and columns["probability"] is None:
+        util.log_warning(f"{FORMATS[fmt]['label']} has no localization probability column, sites are not filtered")
+
+    # Columns are selected by position, report tables may repeat unrelated column names
+    needed = {c for role, c in columns.items() if role != "exclude" and c is not None} | set(columns["exclude"])
+    positions = {header.index(c): c for c in needed}
+    try:
+        reader = pd.read_csv(f, sep=sep, header=None, usecols=sorted(positions), dtype=str, chunksize=chunksize,
+                             quoting=csv.QUOTE_MINIMAL if sep == "," else csv.QUOTE_NONE)
+    except pd.errors.EmptyDataError:  # header only
+        reader = []
+    frames = []
+    rows = 0
+    for chunk in reader:
+        chunk = chunk.rename(columns=positions)
+        rows += len(chunk)
+        frames.append(convert_chunk(chunk, columns, min_localization_prob).drop_duplicates())
+    sites = pd.concat(frames) if frames else pd.DataFrame(columns=SITE_COLUMNS)
+    sites = sites.drop_duplicates().reset_index(drop=True)
+    util.log_info(f"Imported {len(sites)} sites from {rows} rows ({FORMATS[fmt]['label']})")
+    return sites
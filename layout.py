@@ -2,6 +2,7 @@
 import dash_bootstrap_components as dbc
 from dash import dcc, html, dash_table
 import constants
+import export
 
 amino_acid_options = [
     {'label': 'Serine (S)', 'value': 'S'},
@@ -11,6 +12,19 @@ amino_acid_options = [
 ]
 default_amino_acids = ['S', 'T', 'Y', 'H']
 
+# Initial content of settings-store, kept in sync with the controls by a clientside callback
+default_settings = {
+    "correction_method": "fdr_bh",
+    "statistical_test": "fisher",
+    "floppy_value": 5,
+    "matching_mode": "exact",
+    "selected_amino_acids": default_amino_acids,
+    "max_hits": 7,
+    "min_localization_prob": 0.75,
+    "n_permutations": constants.PERMUTATION_COUNT,
+    "permutation_seed": constants.PERMUTATION_SEED,
+}
+
 
 def create_layout():
     """Creates the main layout for the fuzzyKEA application."""
@@ -81,17 +95,11 @@ def create_layout():
             dcc.Store(id="active-download-type-store", storage_type=constants.STORAGE_TYPE),
             dcc.Store(id="download-filename-store", storage_type=constants.STORAGE_TYPE),
             dcc.Store(id="session-id", storage_type=constants.STORAGE_TYPE),
-            dcc.Store(id="site-level-results-store", storage_type=constants.STORAGE_TYPE),
-            dcc.Store(id="sub-level-results-store", storage_type=constants.STORAGE_TYPE),
+            dcc.Store(id="result-key-store", storage_type=constants.STORAGE_TYPE),  # handle into result_store
             dcc.Store(id="raw-data-store", storage_type=constants.STORAGE_TYPE),
-            dcc.Store(id="site-hit-data-store", storage_type=constants.STORAGE_TYPE),
-            dcc.Store(id="sub-hit-data-store", storage_type=constants.STORAGE_TYPE),
-            dcc.Store(id="correction-method-store", data="fdr_bh", storage_type=constants.STORAGE_TYPE),
-            dcc.Store(id="statistical-test-store", data="fisher", storage_type=constants.STORAGE_TYPE),
+            dcc.Store(id="upload-store", storage_type=constants.STORAGE_TYPE),  # ID and preview of an uploaded file, see uploads.py
+            dcc.Store(id="settings-store", data=default_settings, storage_type=constants.STORAGE_TYPE),
             dcc.Store(id="current-title-store", data=constants.DEFAULT_DOWNLOAD_FILE_NAME, storage_type=constants.STORAGE_TYPE),
-            dcc.Store(id="floppy-settings-store", storage_type=constants.STORAGE_TYPE, data={"floppy_value": 5, "matching_mode": "exact"}),
-            dcc.Store(id="selected-amino-acids-store", storage_type=constants.STORAGE_TYPE, data=default_amino_acids),
-            dcc.Store(id="limit-inferred-hits-store", storage_type=constants.STORAGE_TYPE, data={"max_hits": 7}),
             
             # Download modal
             dbc.Modal(
@@ -101,8 +109,17 @@ def create_layout():
                         dbc.Label("Filename (without extension):"),
                         dbc.Input(id="download-filename-input", type="text", 
                                  placeholder="e.g., my_analysis_results"),
-                        html.Small("The .tsv extension will be added automatically.", 
-                                  className="text-muted")
+                        html.Small("The file extension will be added automatically.", 
+                                  className="text-muted"),
+                        dbc.Label("Format:", className="mt-3"),
+                        dbc.RadioItems(
+                            id="download-format-radio",
+                            options=[
+                                {**option, "disabled": option["value"] == "bundle-parquet" and not export.PARQUET_AVAILABLE}
+                                for option in constants.DOWNLOAD_FORMATS
+                            ],
+                            value="tsv",
+                        ),
                     ]),
                     dbc.ModalFooter([
                         dbc.Button("Cancel", id="cancel-download-modal-button", 
@@ -149,7 +166,8 @@ def create_layout():
                                     "fontSize": "14px"
                                 },
                                 className="form-control",
-                            )
+                            ),
+                            html.Small(id="upload-info", className="text-muted d-block mt-1"),
                         ])
                     ])
                 ], width=8),
@@ -197,7 +215,7 @@ def create_layout():
                             html.Small("Maximum position difference for fuzzy matching", className="text-muted d-block mb-2"),
                             dcc.Slider(
                                 id="floppy-slider",
-                                min=0, max=10, step=1, value=5,
+                                min=0, max=10, step=1, value=default_settings["floppy_value"],
                                 marks={i: str(i) for i in range(0, 11)},
                                 tooltip={"placement": "bottom", "always_visible": False},
                             ),
@@ -208,11 +226,22 @@ def create_layout():
                             html.Small("Limit imputed sites per kinase", className="text-muted d-block mb-2"),
                             dcc.Slider(
                                 id="limit-inferred-hits-slider",
-                                min=0, max=10, step=1, value=7,
+                                min=0, max=10, step=1, value=default_settings["max_hits"],
                                 marks={i: str(i) for i in range(0, 11)},
                                 tooltip={"placement": "bottom", "always_visible": False},
                             ),
                             
+                            # Localization Probability (site tables only)
+                            html.Label("Min. Localization Probability:", className="fw-bold mt-3 mb-1",
+                                      style={'color': constants.DARK_TEXT}),
+                            html.Small("Applied to uploaded MaxQuant, Spectronaut or DIA-NN site tables", className="text-muted d-block mb-2"),
+                            dcc.Slider(
+                                id="localization-prob-slider",
+                                min=0, max=1, step=0.05, value=default_settings["min_localization_prob"],
+                                marks={v: str(v) for v in (0, 0.25, 0.5, 0.75, 1)},
+                                tooltip={"placement": "bottom", "always_visible": False},
+                            ),
+                            
                             # Amino Acid Matching Mode
                             html.Label("Amino Acid Matching:", className="fw-bold mt-3 mb-1",
                                       style={'color': constants.DARK_TEXT}),
@@ -223,7 +252,7 @@ def create_layout():
                                     {"label": " S/T Similar", "value": "st-similar"},
                                     {"label": " Ignore", "value": "ignore"},
                                 ],
-                                value="exact",
+                                value=default_settings["matching_mode"],
                                 inline=True,
                                 className="mb-2"
                             ),
@@ -245,10 +274,18 @@ def create_layout():
                             dcc.Dropdown(
                                 id="statistical-test-dropdown",
                                 options=constants.STATISTICAL_TEST_METHODS,
-                                value="fisher",
+                                value=default_settings["statistical_test"],
                                 clearable=False,
                                 className="mb-2"
                             ),
+                            html.Small("Permutations and random seed (permutation test only)", className="text-muted d-block mb-1"),
+                            dbc.InputGroup([
+                                dbc.Input(id="permutations-input", type="number", min=100,
+                                          max=constants.PERMUTATION_MAX, step=100,
+                                          value=default_settings["n_permutations"]),
+                                dbc.Input(id="permutation-seed-input", type="number", min=0, step=1,
+                                          value=default_settings["permutation_seed"]),
+                            ], size="sm", className="mb-2"),
                             
                             # Multiple Testing Correction
                             html.Label("Multiple Testing Correction:", className="fw-bold mt-3 mb-1",
@@ -256,7 +293,7 @@ def create_layout():
                             dcc.Dropdown(
                                 id="correction-method-dropdown",
                                 options=constants.CORRECTION_METHODS,
-                                value="fdr_bh",
+                                value=default_settings["correction_method"],
                                 clearable=False,
                             ),
                         ])
@@ -283,9 +320,14 @@ def create_layout():
                                 style_header=constants.DEFAULT_HEADER_STYLE,
                                 style_cell=constants.DEFAULT_CELL_STYLE,
                                 style_data_conditional=constants.DEFAULT_STYLE_DATA_CONDITIONAL,
-                                sort_action="native",
-                                filter_action="native",
+                                page_action="custom",
+                                sort_action="custom",
+                                sort_mode="multi",
+                                filter_action="custom",
+                                page_current=0,
                                 page_size=15,
+                                sort_by=[],
+                                filter_query="",
                             )
                         ])
                     ])
@@ -301,7 +343,13 @@ def create_layout():
                             html.Small("Click on a kinase to view details", className="text-muted d-block mb-2"),
                             dash_table.DataTable(
                                 id="table-viewer-deep-hits",
+                                page_action="custom",
+                                sort_action="custom",
+                                filter_action="custom",
+                                page_current=0,
                                 page_size=10,
+                                sort_by=[],
+                                filter_query="",
                                 style_table={"overflowX": "auto"},
                                 style_header=constants.DEFAULT_HEADER_STYLE,
                                 style_cell=constants.DEFAULT_CELL_STYLE,
@@ -331,9 +379,14 @@ def create_layout():
                                 style_header=constants.DEFAULT_HEADER_STYLE,
                                 style_cell=constants.DEFAULT_CELL_STYLE,
                                 style_data_conditional=constants.DEFAULT_STYLE_DATA_CONDITIONAL,
-                                sort_action="native",
-                                filter_action="native",
+                                page_action="custom",
+                                sort_action="custom",
+                                sort_mode="multi",
+                                filter_action="custom",
+                                page_current=0,
                                 page_size=15,
+                                sort_by=[],
+                                filter_query="",
                             )
                         ])
                     ])
@@ -349,7 +402,13 @@ def create_layout():
                             html.Small("Click on a kinase to view substrates", className="text-muted d-block mb-2"),
                             dash_table.DataTable(
                                 id="table-viewer-high-hits",
+                                page_action="custom",
+                                sort_action="custom",
+                                filter_action="custom",
+                                page_current=0,
                                 page_size=10,
+                                sort_by=[],
+                                filter_query="",
                                 style_table={"overflowX": "auto"},
                                 style_header=constants.DEFAULT_HEADER_STYLE,
                                 style_cell=constants.DEFAULT_CELL_STYLE,
@@ -361,6 +420,17 @@ def create_layout():
             ], className="mb-4"),
             
             # Visualization Row
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Kinases shown in the bar plots:", className="fw-bold mb-1",
+                              style={'color': constants.DARK_TEXT}),
+                    dcc.Slider(
+                        id="top-n-slider",
+                        min=5, max=50, step=5, value=constants.BAR_TOP_N,
+                        marks={n: str(n) for n in (5, 10, 20, 30, 40, 50)},
+                    ),
+                ], width=6),
+            ], className="mb-2"),
             dbc.Row([
                 dbc.Col([
                     dbc.Card([
@@ -387,6 +457,20 @@ def create_layout():
                     ])
                 ], width=6),
             ], className="mb-4"),
+            dbc.Row([
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardHeader("Kinome Overview (all kinases)", style={
+                            'backgroundColor': constants.SECONDARY_COLOR,
+                            'color': 'white',
+                            'fontWeight': 'bold'
+                        }),
+                        dbc.CardBody([
+                            dcc.Graph(id="volcano-plot")
+                        ])
+                    ])
+                ], width=12),
+            ], className="mb-4"),
             
             # Footer
             dbc.Row([
@@ -0,0 +1,368 @@
+# loadtest.py
+"""
+Concurrent-session load test against a locally started fuzzyKEA server.
+
+Each virtual user replays the callback chain the browser would run: page
+load (session init, store initialization), entering sites and settings,
+starting the analysis, changing display options, paging the result tables
+and opening the detail tables. Callbacks are read from /_dash-dependencies and executed through
+/_dash-update-component with the same payloads the Dash renderer sends,
+including chained callbacks triggered by updated outputs, so the tool
+follows changes to callbacks.py. Clientside callbacks run in the browser
+and are skipped; the scenario writes their stores (settings-store) directly.
+
+By default a server is started in a subprocess on a synthetic
+PhosphoSitePlus-shaped background, so no external services or dataset
+downloads are needed.
+
+Usage:
+    python loadtest.py --users 8 --iterations 3 --input-size 500
+    python loadtest.py --url http://127.0.0.1:8050 --users 4   # existing server
+    python loadtest.py --upload --input-size 50000              # gzip file uploads
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import synthetic_data
+
+MAX_CHAIN_DEPTH = 10
+
+
+def _parse_output_spec(spec):
+    """Splits a Dash output spec ("a.prop" or "..a.prop...b.prop..") into (id, property) pairs."""
+    if spec.startswith("..") and spec.endswith(".."):
+        parts = spec[2:-2].split("...")
+    else:
+        parts = [spec]
+    outputs = []
+    for part in parts:
+        component_id, prop = part.rsplit(".", 1)
+        outputs.append((component_id, prop.split("@")[0]))
+    return outputs
+
+
+def _walk_layout(node, state):
+    """Collects the initial props of every component with an ID."""
+    if isinstance(node, list):
+        for child in node:
+            _walk_layout(child, state)
+        return
+    if not isinstance(node, dict) or "props" not in node:
+        return
+    props = node["props"]
+    component_id = props.get("id")
+    if isinstance(component_id, str):
+        for prop, value in props.items():
+            if prop != "children" or not isinstance(value, (dict, list)):
+                state[(component_id, prop)] = value
+    for value in props.values():
+        if isinstance(value, (dict, list)):
+            _walk_layout(value, state)
+
+
+def _apply_patch(value, patch):
+    """Applies a dash.Patch update to a prop value like the renderer does."""
+    value = json.loads(json.dumps(value)) if value is not None else {}
+    for op in patch["operations"]:
+        *path, last = op["location"] or [None]
+        target = value
+        for key in path:
+            if isinstance(target, dict):
+                target = target.setdefault(key, {})
+            else:
+                target = target[key]
+        new = op["params"].get("value")
+        name = op["operation"]
+        if last is None:
+            if name == "Assign":
+                value = new
+            continue
+        if name == "Assign":
+            target[last] = new
+        elif name == "Merge":
+            target.setdefault(last, {}).update(new)
+        elif name in ("Extend", "Append", "Prepend", "Insert", "Remove", "Clear"):
+            items = target.setdefault(last, [])
+            if name == "Extend":
+                items.extend(new)
+            elif name == "Append":
+                items.append(new)
+            elif name == "Prepend":
+                items.insert(0, new)
+            elif name == "Insert":
+                items.insert(op["params"]["index"], new)
+            elif name == "Remove":
+                items.remove(new)
+            else:
+                items.clear()
+        elif name == "Delete":
+            del target[last]
+    return value
+
+
+class DashSession:
+    """Emulates one browser tab: holds component props and runs server callbacks."""
+
+    def __init__(self, base_url, dependencies, layout, recorder):
+        self.base_url = base_url.rstrip("/")
+        self.http = requests.Session()
+        self.recorder = recorder
+        self.state = {}
+        _walk_layout(layout, self.state)
+        self.callbacks = []
+        for dep in dependencies:
+            if dep.get("clientside_function"):
+                continue
+            self.callbacks.append({
+                "output": dep["output"],
+                "outputs": _parse_output_spec(dep["output"]),
+                "inputs": [(i["id"], i["property"]) for i in dep["inputs"]],
+                "state": [(s["id"], s["property"]) for s in dep["state"]],
+                "prevent_initial_call": dep.get("prevent_initial_call", False),
+            })
+
+    def _payload(self, callback, changed):
+        outputs = [{"id": cid, "property": prop} for cid, prop in callback["outputs"]]
+        return {
+            "output": callback["output"],
+            "outputs": outputs if len(outputs) > 1 or callback["output"].startswith("..") else outputs[0],
+            "inputs": [{"id": cid, "property": prop, "value": self.state.get((cid, prop))}
+                       for cid, prop in callback["inputs"]],
+            "changedPropIds": [f"{cid}.{prop}" for cid, prop in changed],
+            "state": [{"id": cid, "property": prop, "value": self.state.get((cid, prop))}
+                      for cid, prop in callback["state"]],
+        }
+
+    def _run_callback(self, callback, changed, depth):
+        label = callback["output"].strip(".").split("...")[0].split("@")[0]
+        payload = self._payload(callback, changed)
+        started = time.perf_counter()
+        try:
+            response = self.http.post(f"{self.base_url}/_dash-update-component", json=payload, timeout=600)
+            elapsed = time.perf_counter() - started
+            ok = response.status_code in (200, 204)
+            self.recorder.record(label, elapsed, ok, len(response.content))
+        except requests.RequestException:
+            self.recorder.record(label, time.perf_counter() - started, False, 0)
+            return
+        if response.status_code != 200:
+            return
+        updated = []
+        for component_id, props in response.json().get("response", {}).items():
+            for prop, value in props.items():
+                if isinstance(value, dict) and "__dash_patch_update" in value:
+                    value = _apply_patch(self.state.get((component_id, prop)), value)
+                self.state[(component_id, prop)] = value
+                updated.append((component_id, prop))
+        self._trigger(updated, depth + 1, source=callback)
+
+    def _trigger(self, changed, depth=0, source=None):
+        if not changed or depth > MAX_CHAIN_DEPTH:
+            return
+        changed_set = set(changed)
+        for callback in self.callbacks:
+            if callback is source:
+                continue  # the renderer does not re-run a circular callback on its own outputs
+            fired = [i for i in callback["inputs"] if i in changed_set]
+            if fired:
+                self._run_callback(callback, fired, depth)
+
+    def set_props(self, **props):
+        """Sets props like a user interaction ("text-input__value"="...") and runs dependent callbacks."""
+        changed = []
+        for key, value in props.items():
+            component_id, prop = key.split("__")
+            self.state[(component_id, prop)] = value
+            changed.append((component_id, prop))
+        self._trigger(changed)
+
+    def load_page(self):
+        started = time.perf_counter()
+        response = self.http.get(f"{self.base_url}/", timeout=60)
+        self.recorder.record("GET /", time.perf_counter() - started, response.status_code == 200, len(response.content))
+        self.state[("url", "pathname")] = "/"
+        for callback in self.callbacks:
+            if not callback["prevent_initial_call"]:
+                self._run_callback(callback, [], 0)
+
+    def click(self, component_id):
+        clicks = (self.state.get((component_id, "n_clicks")) or 0) + 1
+        self.set_props(**{f"{component_id}__n_clicks": clicks})
+
+
+class Recorder:
+    """Thread-safe collection of request latencies per callback."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def record(self, label, elapsed, ok, size):
+        with self._lock:
+            self.samples[label].append(elapsed)
+            self.bytes[label] += size
+            if not ok:
+                self.errors[label] += 1
+
+    def summary(self):
+        def percentile(values, q):
+            values = sorted(values)
+            index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+            return values[index]
+
+        rows = {}
+        for label, values in sorted(self.samples.items()):
+            rows[label] = {
+                "count": len(values),
+                "errors": self.errors[label],
+                "error_rate": self.errors[label] / len(values),
+                "mean_s": statistics.fmean(values),
+                "p50_s": percentile(values, 50),
+                "p90_s": percentile(values, 90),
+                "p95_s": percentile(values, 95),
+                "p99_s": percentile(values, 99),
+                "max_s": max(values),
+                "mean_bytes": self.bytes[label] / len(values),
+            }
+        return rows
+
+
+def _gzip_data_url(content):
+    return "data:application/gzip;base64," + base64.b64encode(gzip.compress(content.encode("utf-8"))).decode("ascii")
+
+
+def user_scenario(base_url, dependencies, layout, recorder, background, input_size, iterations, seed, upload=False):
+    """One virtual user: load the page, then run `iterations` analyses with detail lookups."""
+    session = DashSession(base_url, dependencies, layout, recorder)
+    session.load_page()
+    for i in range(iterations):
+        content = synthetic_data.make_input(background, n_sites=input_size, seed=seed * 1000 + i)
+        if upload:
+            # Stored server-side; the text area receives a preview only
+            session.set_props(**{"upload-text-file__filename": f"sites_{i}.txt.gz",
+                                 "upload-text-file__contents": _gzip_data_url(content)})
+        else:
+            session.set_props(**{"text-input__value": content})
+        # Settings are collected by a clientside callback, which is not replayed here
+        settings = dict(session.state.get(("settings-store", "data")) or {})
+        settings["floppy_value"] = [0, 3, 5][i % 3]
+        session.set_props(**{"settings-store__data": settings})
+        session.click("button-start-analysis")
+        # Display-only changes are answered with partial (Patch) updates
+        session.set_props(**{"top-n-slider__value": 20})
+        session.set_props(**{"correction-method-dropdown__value": ["bonferroni", "fdr_bh"][i % 2]})
+        for table in ("table-viewer", "table-viewer-high-level"):
+            if (session.state.get((table, "page_count")) or 1) > 1:
+                session.set_props(**{f"{table}__page_current": 1})
+            if session.state.get((table, "data")):
+                session.set_props(**{f"{table}__active_cell": {"row": 0, "column": 0, "column_id": "KINASE"}})
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, dataset_path):
+    """Starts the app with a threaded werkzeug server in a subprocess."""
+    env = dict(os.environ, FUZZYKEA_DATASET_PATH=dataset_path, FUZZYKEA_LOG_LEVEL="WARNING")
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port)],
+                               env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server process exited during startup")
+        try:
+            if requests.get(f"{url}/_dash-layout", timeout=2).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Server did not start within 120s")
+
+
+def serve(port):
+    import logging
+    from werkzeug.serving import make_server
+    from app import server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log per request
+    make_server("127.0.0.1", port, server, threaded=True).serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test fuzzyKEA with concurrent simulated sessions.")
+    parser.add_argument("--users", type=int, default=4, help="Concurrent sessions")
+    parser.add_argument("--iterations", type=int, default=2, help="Analyses per session")
+    parser.add_argument("--input-size", type=int, default=300, help="Input lines per analysis")
+    parser.add_argument("--substrates", type=int, default=2000, help="Substrates in the synthetic background")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--upload", action="store_true", help="Send the input as gzip file upload instead of text")
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--output", help="Write the summary as JSON to this path")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.port)
+        return 0
+
+    background = synthetic_data.make_background(n_substrates=args.substrates, seed=args.seed)
+    process = None
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url
+        if not url:
+            dataset_path = synthetic_data.write_psp_file(background, os.path.join(tmp, "Kinase_Substrate_Dataset.txt"))
+            process, url = start_server(_free_port(), dataset_path)
+        try:
+            dependencies = requests.get(f"{url}/_dash-dependencies", timeout=30).json()
+            layout = requests.get(f"{url}/_dash-layout", timeout=30).json()
+            recorder = Recorder()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.users) as pool:
+                futures = [pool.submit(user_scenario, url, dependencies, layout, recorder, background,
+                                       args.input_size, args.iterations, args.seed + u, args.upload)
+                           for u in range(args.users)]
+                for future in futures:
+                    future.result()
+            wall = time.perf_counter() - started
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    summary = recorder.summary()
+    total = sum(row["count"] for row in summary.values())
+    errors = sum(row["errors"] for row in summary.values())
+    print(f"{args.users} users x {args.iterations} analyses, input size {args.input_size}: "
+          f"{total} requests in {wall:.1f}s ({total / wall:.1f} req/s), error rate {errors / max(total, 1):.2%}")
+    print(f"{'callback':<40} {'n':>5} {'err':>5} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8} {'KB':>9}")
+    for label, row in summary.items():
+        print(f"{label[:40]:<40} {row['count']:>5} {row['errors']:>5} {row['p50_s']:>8.3f} {row['p90_s']:>8.3f} "
+              f"{row['p95_s']:>8.3f} {row['p99_s']:>8.3f} {row['max_s']:>8.3f} {row['mean_bytes'] / 1024:>9.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"params": vars(args), "wall_s": wall, "callbacks": summary}, f, indent=2, default=str)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
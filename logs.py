@@ -0,0 +1,203 @@
+# logs.py
+"""
+Logging of the app: colored, plain or JSON lines on stdout, written by a
+listener thread so that request threads only enqueue records, with
+per-key rate limiting for warnings on hot paths. util re-exports the
+log_* functions.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+import constants
+
+# ANSI color codes for terminal output
+class Colors:
+    RESET = '\033[0m'
+    BOLD = '\033[1m'
+    
+    # Regular colors
+    BLACK = '\033[30m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    MAGENTA = '\033[35m'
+    CYAN = '\033[36m'
+    WHITE = '\033[37m'
+    
+    # Bright colors
+    BRIGHT_BLACK = '\033[90m'
+    BRIGHT_RED = '\033[91m'
+    BRIGHT_GREEN = '\033[92m'
+    BRIGHT_YELLOW = '\033[93m'
+    BRIGHT_BLUE = '\033[94m'
+    BRIGHT_MAGENTA = '\033[95m'
+    BRIGHT_CYAN = '\033[96m'
+    BRIGHT_WHITE = '\033[97m'
+
+class ColoredFormatter(logging.Formatter):
+    """Custom formatter with colors for different log levels"""
+    
+    FORMATS = {
+        logging.DEBUG: Colors.BRIGHT_BLACK + '%(asctime)s [DEBUG] %(name)s: %(message)s' + Colors.RESET,
+        logging.INFO: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.GREEN + 'INFO' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': %(message)s',
+        logging.WARNING: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.YELLOW + 'WARN' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': ' + Colors.YELLOW + '%(message)s' + Colors.RESET,
+        logging.ERROR: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.RED + 'ERROR' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': ' + Colors.RED + '%(message)s' + Colors.RESET,
+        logging.CRITICAL: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.BRIGHT_RED + Colors.BOLD + 'CRITICAL' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': ' + Colors.BRIGHT_RED + Colors.BOLD + '%(message)s' + Colors.RESET,
+    }
+
+    def __init__(self):
+        super().__init__(datefmt='%H:%M:%S')
+        # One formatter per level, built once instead of once per record
+        self._formatters = {
+            level: logging.Formatter(fmt, datefmt='%H:%M:%S')
+            for level, fmt in self.FORMATS.items()
+        }
+
+    def format(self, record):
+        formatter = self._formatters.get(record.levelno)
+        if formatter is None:
+            return super().format(record)
+        return formatter.format(record)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops records that carry the same ``rate_limit_key`` within a time window.
+
+    Records without a key always pass. The first record let through after a
+    window reopens reports how many records were dropped in between.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._last_emit = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "rate_limit_key", None)
+        if key is None or self.interval <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_emit.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last_emit[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records with the message merged but the traceback kept separate."""
+
+    def prepare(self, record):
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+
+def _create_output_handler(log_format):
+    handler = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        handler.setFormatter(JSONFormatter())
+    elif log_format == "plain":
+        handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s', datefmt='%H:%M:%S'))
+    else:
+        handler.setFormatter(ColoredFormatter())
+    return handler
+
+
+# Configure logging: request threads only enqueue records, a listener thread
+# formats them and writes to stdout.
+_log_queue = queue.SimpleQueue()
+queue_handler = _QueueHandler(_log_queue)
+queue_handler.addFilter(RateLimitFilter(constants.LOG_RATE_LIMIT_SECONDS))
+console_handler = _create_output_handler(constants.LOG_FORMAT)
+log_listener = logging.handlers.QueueListener(_log_queue, console_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logging.basicConfig(
+    level=constants.LOG_LEVEL,
+    handlers=[queue_handler]
+)
+
+logger = logging.getLogger('fuzzyKEA')
+logger.setLevel(constants.LOG_LEVEL)
+
+def _extra(rate_limit_key):
+    return {"rate_limit_key": rate_limit_key} if rate_limit_key else None
+
+def log_info(message, user_context=None, rate_limit_key=None):
+    """Structured logging with optional user context"""
+    if user_context:
+        logger.info(f"[User: {user_context}] {message}", extra=_extra(rate_limit_key))
+    else:
+        logger.info(message, extra=_extra(rate_limit_key))
+
+def log_warning(message, user_context=None, rate_limit_key=None):
+    """Warning logging. Pass ``rate_limit_key`` for warnings raised on hot paths."""
+    if user_context:
+        logger.warning(f"[User: {user_context}] {message}", extra=_extra(rate_limit_key))
+    else:
+        logger.warning(message, extra=_extra(rate_limit_key))
+
+def log_error(message, exception=None, user_context=None):
+    """Structured error logging"""
+    prefix = f"[User: {user_context}] " if user_context else ""
+    if exception:
+        logger.error(f"{prefix}{message}: {str(exception)}", exc_info=True)
+    else:
+        logger.error(f"{prefix}{message}")
+
+def log_debug(message, user_context=None):
+    """Debug logging"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if user_context:
+        logger.debug(f"[User: {user_context}] {message}")
+    else:
+        logger.debug(message)
@@ -0,0 +1,671 @@
+# matching.py
+"""
+Streaming and parallel fuzzy matching with bounded memory.
+
+site_matching.fuzzy_join merges all input sites with all background sites
+of the same protein and evaluates every pair row by row. With a large
+tolerance and hub proteins that carry hundreds of annotated sites this
+intermediate table dominates memory. fuzzy_join_streaming gives the same
+hits without building it:
+
+- The background is parsed once into a BackgroundIndex: arrays of residue
+  and position, grouped by protein accession. Indexes are cached per
+  background content.
+- Input sites are processed in protein-partitioned chunks. A chunk holds
+  at most MATCH_MEMORY_BUDGET_MB worth of candidate pairs; a single input
+  site is never split, so one site with more candidates than the budget
+  forms a chunk of its own.
+- Per chunk, candidate pairs are built and filtered with numpy, and only
+  the closest match of every input site is kept (three integers per hit).
+  The hit rows are materialized once at the end.
+
+fuzzy_join_parallel shards the input sites by protein over a process pool.
+The site arrays of the index are placed in shared memory once, and workers
+attach to them by name, so only the input shards travel to the workers.
+Every parallel call holds the shared block until its shards are merged; an
+index evicted from the cache frees the block once no call holds it. The
+pool is started once with MATCH_WORKERS processes and shared by all calls.
+The per-shard matches are merged before limit_inferred_hits and the
+statistics, which run in the calling process.
+
+The index partitions its background by the leading residue of the site
+(S, T, Y, ...) with row and annotation counts per partition. The amino acid
+filter of a run is a ResidueView: its counts are sums of partition counts,
+its rows are taken once per residue selection, and its frame maps back to
+its own index without hashing the rows again. The same holds for the frame
+an index was built from, so a repeated run on the same (read-only) frame
+reaches its cached views directly. A view also holds the substrate level,
+the distinct kinase-substrate pairs, built on first use, so a run only
+looks up the input proteins (ResidueView.substrates).
+
+Tie-breaking is the one of site_matching.fuzzy_join: among equally close
+background sites the first in background order wins, and hits are ordered
+by distance and then by the row order of the pandas merge, which
+limit_inferred_hits relies on.
+"""
+import atexit
+import multiprocessing
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import constants
+import logs
+import site_matching
+
+HIT_COLUMNS = ['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg',
+               'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE']
+BYTES_PER_PAIR = 64  # numpy temporaries per candidate pair while matching a chunk
+INDEX_CACHE_SIZE = 4
+SHARDS_PER_WORKER = 4  # more shards than workers evens out skewed proteins
+AA_MODES = ('exact', 'st-similar', 'ignore')
+RESIDUE_S, RESIDUE_T = ord('S'), ord('T')
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+_view_frames = {}  # id(frame) -> weakref of the ResidueView that owns the frame
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_sites(values):
+    """
+    Vectorized site_matching.parse_site.
+
+    Returns:
+        (residue, position, valid): residue as int64 code point (0 for
+        invalid sites), position as int64, and the mask of parseable sites
+    """
+    values = pd.Series(values, copy=False)
+    notna = values.notna().to_numpy()
+    text = values.astype(str).str.strip()
+    pos_text = text.str[1:]
+    valid = notna & (text.str.len() >= 2).to_numpy() & pos_text.str.lstrip('-').str.isdigit().fillna(False).to_numpy(dtype=bool)
+    # int() rejects some strings that pass isdigit (e.g. "--5"), so do the conversion
+    positions = pd.to_numeric(pos_text.where(valid), errors="coerce").to_numpy(dtype=float)
+    valid &= ~np.isnan(positions)
+    residue = text.str[0].fillna("").to_numpy(dtype="<U1").view(np.uint32).astype(np.int64)
+    return residue, np.where(valid, positions, 0).astype(np.int64), valid
+
+
+class SiteArrays:
+    """
+    Residue and position arrays of the background sites, grouped by protein.
+
+    This is the part of a BackgroundIndex that matching needs; it can be
+    placed in shared memory (share) and attached from other processes.
+    """
+
+    FIELDS = 5  # residue, position, order (per site); starts, counts (per protein)
+
+    def __init__(self, residue, position, order, starts, counts):
+        self.residue = residue
+        self.position = position
+        self.order = order
+        self.starts = starts
+        self.counts = counts
+        self._shm = None
+
+    @classmethod
+    def build(cls, residue, position, codes, n_proteins):
+        # Stable sort: background order is kept within a protein (tie-breaking)
+        order = np.argsort(codes, kind="stable").astype(np.int64)
+        counts = np.bincount(codes, minlength=n_proteins).astype(np.int64)
+        starts = (np.cumsum(counts) - counts).astype(np.int64)
+        return cls(residue, position, order, starts, counts)
+
+    def candidates(self, codes):
+        """
+        All (input row, background row) pairs of the same protein.
+
+        Args:
+            codes: Protein code per input row (from BackgroundIndex.codes_for)
+
+        Returns:
+            (input positions into codes, background site positions)
+        """
+        counts = np.where(codes >= 0, self.counts[np.maximum(codes, 0)], 0)
+        total = int(counts.sum())
+        rows = np.repeat(np.arange(len(codes)), counts)
+        first = np.where(codes >= 0, self.starts[np.maximum(codes, 0)], 0)
+        # position of each pair within the block of its input row
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, self.order[np.repeat(first, counts) + within]
+
+    def share(self):
+        """Copies the arrays into a shared memory block; returns the descriptor for attach."""
+        if self._shm is None:
+            n_sites, n_proteins = len(self.residue), len(self.counts)
+            size = max(8 * (3 * n_sites + 2 * n_proteins), 8)
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            buffer = np.ndarray((size // 8,), dtype=np.int64, buffer=self._shm.buf)
+            buffer[:3 * n_sites + 2 * n_proteins] = np.concatenate(
+                [self.residue, self.position, self.order, self.starts, self.counts])
+            del buffer
+        return self._shm.name, len(self.residue), len(self.counts)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """Site arrays backed by the shared memory block of a descriptor from share()."""
+        name, n_sites, n_proteins = descriptor
+        shm = shared_memory.SharedMemory(name=name)
+        # Pool workers share the resource tracker of the creating process, which unlinks the block
+        buffer = np.ndarray((3 * n_sites + 2 * n_proteins,), dtype=np.int64, buffer=shm.buf)
+        cuts = np.cumsum([n_sites, n_sites, n_sites, n_proteins])
+        arrays = cls(*np.split(buffer, cuts))
+        arrays._shm = shm
+        return arrays
+
+    def release(self, unlink=True):
+        if self._shm is not None:
+            self.residue = self.position = self.order = self.starts = self.counts = None
+            self._shm.close()
+            if unlink:
+                self._shm.unlink()
+            self._shm = None
+
+
+class BackgroundIndex:
+    """Parsed background sites grouped by SUB_ACC_ID, in background order within each protein."""
+
+    def __init__(self, background, key=None):
+        residue, position, valid = parse_sites(background['SUB_MOD_RSD'])
+        self.key = key
+        self.invalid = int((~valid).sum())
+        self.frame = background[valid].reset_index(drop=True)  # rows in background order, invalid sites dropped
+        codes, self.accessions = pd.factorize(self.frame['SUB_ACC_ID'])
+        self.sites = SiteArrays.build(residue[valid], position[valid], codes, len(self.accessions))
+        self.background = background  # all rows, for the residue views and the substrate level
+        # One partition per leading residue of SUB_MOD_RSD, rows without a site in the last one
+        partition, self.residues = pd.factorize(background['SUB_MOD_RSD'].str[0])
+        self.partition = np.where(partition < 0, len(self.residues), partition)
+        self.partition_sizes = np.bincount(self.partition, minlength=len(self.residues) + 1)
+        self.partition_annotations = (background.groupby([background['KIN_ACC_ID'], self.partition]).size()
+                                      .unstack(fill_value=0)
+                                      .reindex(columns=range(len(self.residues) + 1), fill_value=0))
+        self._views = {}
+        self._shared = None
+        self._shared_users = 0  # parallel calls between shared() and unshare()
+        self._evicted = False
+        self._shared_lock = threading.Lock()
+        self.view()  # registers the background frame itself, see get_background_index
+
+    def __len__(self):
+        return len(self.frame)
+
+    def view(self, amino_acids=None):
+        """ResidueView of the rows whose site starts with one of amino_acids (all rows: None), cached."""
+        key = None if not amino_acids else tuple(sorted(set(amino_acids)))
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = ResidueView(self, key)
+        return view
+
+    def codes_for(self, accessions):
+        """Index positions of accessions in self.accessions, -1 where a protein has no background sites."""
+        return self.accessions.get_indexer(pd.Index(accessions))
+
+    def shared(self):
+        """Descriptor of the site arrays in shared memory (created on first use), held until unshare()."""
+        with self._shared_lock:
+            if self._shared is None:
+                self._shared = self.sites.share()
+            self._shared_users += 1
+            return self._shared
+
+    def unshare(self):
+        """Ends a use begun by shared(); the last use of an evicted index frees the shared copy."""
+        with self._shared_lock:
+            self._shared_users -= 1
+            if self._evicted and not self._shared_users:
+                self._free_shared()
+
+    def _free_shared(self):
+        if self._shared is not None:
+            shm, self.sites._shm = self.sites._shm, None
+            shm.close()
+            shm.unlink()
+            self._shared = None
+
+    def release(self):
+        # Only the shared copies are freed, once no parallel call holds them; the in-process arrays stay usable
+        with self._shared_lock:
+            self._evicted = True
+            if not self._shared_users:
+                self._free_shared()
+        for view in self._views.values():
+            if view._index is not None and view._index is not self:
+                view._index.release()
+
+
+class ResidueView:
+    """
+    Rows of a background whose site starts with one of the selected residues.
+
+    Counts are sums over the residue partitions of the BackgroundIndex. The
+    rows are one mask over the partition codes, taken once per selection;
+    with every partition selected the view is the background itself.
+    """
+
+    def __init__(self, parent, residues):
+        self.parent = parent
+        self.residues = residues
+        if residues is None:
+            selected = np.arange(len(parent.residues) + 1)
+        else:
+            selected = np.flatnonzero(parent.residues.isin(residues))
+        self.size = int(parent.partition_sizes[selected].sum())
+        annotations = parent.partition_annotations.iloc[:, selected].sum(axis=1)
+        self.annotations = annotations[annotations > 0]
+        if self.size == len(parent.background):
+            self.frame = parent.background
+        else:
+            self.frame = parent.background[np.isin(parent.partition, selected)]
+        self._index = parent if self.frame is parent.background else None
+        self._substrates = None
+        _register_view(self)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def index(self):
+        """BackgroundIndex of the rows of the view (built on first use)."""
+        if self._index is None:
+            self._index = BackgroundIndex(self.frame, key=(self.parent.key, self.residues))
+        return self._index
+
+    def substrates(self):
+        if self._substrates is None:
+            self._substrates = SubstrateBackground(self.frame)
+        return self._substrates
+
+
+def _register_view(view):
+    # Frames handed out by views resolve to their index without hashing them again.
+    # The first view of a frame keeps it (the index of a view registers the same frame)
+    key = id(view.frame)
+    with _index_lock:
+        if view_of(view.frame) is None:
+            _view_frames[key] = weakref.ref(view, lambda _: _view_frames.pop(key, None))
+
+
+def view_of(background):
+    """The ResidueView a frame came from, None for other frames."""
+    ref = _view_frames.get(id(background))
+    view = ref() if ref is not None else None
+    return view if view is not None and view.frame is background else None
+
+
+def residue_view(background):
+    """The ResidueView a frame came from, or the view of all rows of its index."""
+    return view_of(background) or get_background_index(background).view()
+
+
+def annotation_counts(background):
+    """Annotated rows per KIN_ACC_ID (n) and in total (M) of a counted background, precomputed where available."""
+    counted = background if isinstance(background, SubstrateBackground) else view_of(background)
+    if counted is None:
+        return background.groupby('KIN_ACC_ID').size(), len(background)
+    return counted.annotations, len(counted)
+
+
+class SubstrateBackground:
+    """Distinct (KINASE, SUB_ACC_ID) rows of a background with their annotation counts per kinase."""
+
+    def __init__(self, background):
+        self.frame = background.drop(columns=['SUB_MOD_RSD']).drop_duplicates(subset=["KINASE", "SUB_ACC_ID"])
+        self.frame = self.frame.reset_index(drop=True)
+        self.annotations = self.frame.groupby('KIN_ACC_ID').size()
+        self.codes, self.accessions = pd.factorize(self.frame['SUB_ACC_ID'])
+
+    def __len__(self):
+        return len(self.frame)
+
+    def rows_for(self, accessions):
+        """Rows of the given proteins, in background order."""
+        codes = self.accessions.get_indexer(pd.unique(pd.Series(accessions)))
+        # One extra slot for the -1 code of missing accessions, never a member
+        member = np.zeros(len(self.accessions) + 1, dtype=bool)
+        member[codes[codes >= 0]] = True
+        return self.frame[member[self.codes]]
+
+
+def _fingerprint(background):
+    columns = [c for c in ('KINASE', 'KIN_ACC_ID', 'SUB_ACC_ID', 'SUB_MOD_RSD', 'GENE', 'SUB_GENE')
+               if c in background.columns]
+    hashes = pd.util.hash_pandas_object(background[columns], index=False).to_numpy()
+    # order-sensitive: background order decides ties
+    weights = np.arange(1, len(hashes) + 1, dtype=np.uint64)
+    return (len(background), tuple(columns), int((hashes * weights).sum()), int(hashes.sum()))
+
+
+def get_background_index(background):
+    """
+    Returns the BackgroundIndex of a background table, cached by content.
+
+    Frames an index was built from or handed out (residue views) are found
+    by identity without hashing them, so they must not be modified in place;
+    callers pass read-only frames (e.g. store_codec.decode_frame(copy=False)).
+    """
+    view = view_of(background)
+    if view is not None:
+        return view.index
+    key = _fingerprint(background)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = BackgroundIndex(background, key=key)
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)[1].release()
+    return index
+
+
+@atexit.register
+def _release_indexes():
+    with _index_lock:
+        for index in _index_cache.values():
+            index.release()
+
+
+def _aa_match(sample_aa, bg_aa, aa_mode):
+    if aa_mode == 'ignore':
+        return np.ones(len(sample_aa), dtype=bool)
+    elif aa_mode == 'exact':
+        return sample_aa == bg_aa
+    elif aa_mode.lower() == 'st-similar':
+        st = ((sample_aa == RESIDUE_S) | (sample_aa == RESIDUE_T)) & ((bg_aa == RESIDUE_S) | (bg_aa == RESIDUE_T))
+        return (sample_aa == bg_aa) | st
+    raise ValueError(f"Unbekannter aa_mode: {aa_mode}")
+
+
+def _gene_source(sample_columns, bg_columns):
+    """Which frame and column site_matching.fuzzy_join copies into SUB_GENE, given the merge suffixes."""
+    shared = (set(sample_columns) & set(bg_columns)) - {'SUB_ACC_ID'}
+    merged = {}
+    for column in sample_columns:
+        merged[f"{column}_sample" if column in shared else column] = ("sample", column)
+    for column in bg_columns:
+        merged.setdefault(f"{column}_bg" if column in shared else column, ("bg", column))
+    for name in ('GENE_sample', 'GENE_bg', 'GENE', 'SUB_GENE_bg', 'SUB_GENE_sample'):
+        if name in merged:
+            return merged[name]
+    return None
+
+
+def _chunk_bounds(group_pairs, max_pairs):
+    """Greedy cut of consecutive groups into chunks of at most max_pairs pairs (at least one group each)."""
+    cumulative = np.cumsum(group_pairs)
+    bounds = []
+    start = 0
+    while start < len(group_pairs):
+        done = cumulative[start - 1] if start else 0
+        end = max(int(np.searchsorted(cumulative, done + max_pairs, side="right")), start + 1)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _max_pairs(memory_budget_mb):
+    budget = constants.MATCH_MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+    return max(1, int(budget * 1024 * 1024 / BYTES_PER_PAIR))
+
+
+class PreparedSites:
+    """Parsed input sites and their protein codes, in protein-partitioned processing order."""
+
+    def __init__(self, samples, background, aa_mode):
+        residue, position, valid = parse_sites(samples['SUB_MOD_RSD'])
+        if (~valid).any():
+            logs.log_warning(f"Removed {int((~valid).sum())} invalid sample sites")
+        self.samples = samples[valid].reset_index(drop=True)
+        self.residue, self.position = residue[valid], position[valid]
+        self.index = get_background_index(background)
+        if self.index.invalid:
+            logs.log_warning(f"Removed {self.index.invalid} invalid background sites")
+        self.empty = self.samples.empty or len(self.index) == 0
+        if self.empty:
+            logs.log_error("No valid sample or background sites after parsing!")
+            return
+
+        self.codes = self.index.codes_for(self.samples['SUB_ACC_ID'])
+        self.pairs = np.where(self.codes >= 0, self.index.sites.counts[np.maximum(self.codes, 0)], 0)
+        if not self.pairs.any():
+            # site_matching.fuzzy_join fails on the empty merge as well
+            raise ValueError("None of the input proteins has annotated sites in the background")
+        if aa_mode not in AA_MODES and aa_mode.lower() != 'st-similar':
+            raise ValueError(f"Unbekannter aa_mode: {aa_mode}")
+
+        # Row order of samples.merge(background, on='SUB_ACC_ID'): depending on the
+        # pandas version the rows are grouped by protein or kept in input order,
+        # so it is taken from a merge against the (unique) background proteins
+        probe = pd.DataFrame({'SUB_ACC_ID': self.samples['SUB_ACC_ID'], '_row': np.arange(len(self.samples))}).merge(
+            pd.DataFrame({'SUB_ACC_ID': self.index.accessions}), on='SUB_ACC_ID')
+        self.merge_rank = np.full(len(self.samples), -1, dtype=np.int64)
+        self.merge_rank[probe['_row'].to_numpy()] = np.arange(len(probe))
+
+        # An input site is identified like in site_matching.fuzzy_join (accession + '_' + site)
+        site_ids = self.samples['SUB_ACC_ID'].astype(str) + '_' + self.samples['SUB_MOD_RSD'].astype(str)
+        self.groups, group_ids = pd.factorize(site_ids)
+        # Protein-partitioned processing order; rows of one input site stay together
+        self.group_code = np.full(len(group_ids), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(self.group_code, self.groups, self.codes)
+        processing = np.lexsort((self.groups, self.group_code[self.groups]))
+        self.processing = processing[self.pairs[processing] > 0]
+
+    def task(self, rows):
+        """Arrays of _match_rows for a subset of self.processing."""
+        return self.codes[rows], self.residue[rows], self.position[rows], self.groups[rows], self.merge_rank[rows]
+
+    def to_frame(self, hits, inferred_hit_limit):
+        """Builds the hit table from (sample row, background site, distance) arrays, like site_matching.fuzzy_join."""
+        hit_rows, hit_bg, hit_distance = hits
+        if not len(hit_rows):
+            logs.log_warning("No matches found!")
+            return pd.DataFrame(columns=HIT_COLUMNS)
+        # Order of site_matching.fuzzy_join: stable sort of the merged rows by distance
+        order = np.lexsort((hit_bg, self.merge_rank[hit_rows], hit_distance))
+        hit_rows, hit_bg, hit_distance = hit_rows[order], hit_bg[order], hit_distance[order]
+        logs.log_info(f"Matches after 1:1 deduplication: {len(hit_rows)} (closest match per input site)")
+
+        bg_frame = self.index.frame
+        result = pd.DataFrame({
+            'SUB_ACC_ID': self.samples['SUB_ACC_ID'].to_numpy()[hit_rows],
+            'SUB_MOD_RSD_sample': self.samples['SUB_MOD_RSD'].to_numpy()[hit_rows],
+            'SUB_MOD_RSD_bg': bg_frame['SUB_MOD_RSD'].to_numpy()[hit_bg],
+            'KINASE': bg_frame['KINASE'].to_numpy()[hit_bg],
+            'KIN_ACC_ID': bg_frame['KIN_ACC_ID'].to_numpy()[hit_bg],
+            'IMPUTED': hit_distance > 0,
+        })
+        source = _gene_source(list(self.samples.columns) + ['AA', 'Pos'], list(bg_frame.columns) + ['AA', 'Pos'])
+        if source is None:
+            logs.log_warning("No GENE column found in matched data!")
+            result['SUB_GENE'] = ''
+        elif source[0] == "sample":
+            result['SUB_GENE'] = self.samples[source[1]].to_numpy()[hit_rows]
+        else:
+            result['SUB_GENE'] = bg_frame[source[1]].to_numpy()[hit_bg]
+
+        if inferred_hit_limit is not None:
+            logs.log_info(f"Applying inferred hit limit: {inferred_hit_limit} per kinase")
+            result = site_matching.limit_inferred_hits(result, inferred_hit_limit)
+        return result
+
+
+def _match_rows(sites, codes, residue, position, groups, merge_rank, tolerance, aa_mode, max_pairs):
+    """
+    Closest background site per input site, chunk by chunk.
+
+    The input arrays are in processing order (rows of an input site are
+    adjacent). Returns (input positions, background sites, distances) of
+    the kept matches.
+    """
+    pairs = np.where(codes >= 0, sites.counts[np.maximum(codes, 0)], 0)
+    group_starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    group_ends = np.r_[group_starts[1:], len(groups)]
+    hit_rows, hit_bg, hit_distance = [], [], []
+    for start, end in _chunk_bounds(np.add.reduceat(pairs, group_starts), max_pairs):
+        rows = np.arange(group_starts[start], group_ends[end - 1])
+        pair_rows, bg_rows = sites.candidates(codes[rows])
+        sample_rows = rows[pair_rows]
+        del pair_rows
+        distance = np.abs(position[sample_rows] - sites.position[bg_rows])
+        keep = (distance <= tolerance) & _aa_match(residue[sample_rows], sites.residue[bg_rows], aa_mode)
+        sample_rows, bg_rows, distance = sample_rows[keep], bg_rows[keep], distance[keep]
+        if not len(sample_rows):
+            continue
+        # Closest match per input site; ties go to the earlier row of the merge
+        order = np.lexsort((bg_rows, merge_rank[sample_rows], distance, groups[sample_rows]))
+        sorted_groups = groups[sample_rows][order]
+        first = order[np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]]
+        hit_rows.append(sample_rows[first])
+        hit_bg.append(bg_rows[first])
+        hit_distance.append(distance[first])
+    if not hit_rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return np.concatenate(hit_rows), np.concatenate(hit_bg), np.concatenate(hit_distance)
+
+
+def fuzzy_join_streaming(samples, background, tolerance=0, aa_mode='exact', inferred_hit_limit=None,
+                         memory_budget_mb=None):
+    """
+    Same result as site_matching.fuzzy_join, computed in chunks with bounded memory.
+
+    Args:
+        samples: DataFrame with sample sites (SUB_ACC_ID, SUB_MOD_RSD)
+        background: Background DataFrame
+        tolerance: Maximum position difference allowed
+        aa_mode: Amino acid matching mode ('exact', 'st-similar', 'ignore')
+        inferred_hit_limit: Maximum number of inferred hits per kinase
+        memory_budget_mb: Memory for candidate pairs per chunk (default MATCH_MEMORY_BUDGET_MB)
+
+    Returns:
+        DataFrame with matched sites, each sample site matched to max 1 DB site
+    """
+    prepared = PreparedSites(samples, background, aa_mode)
+    if prepared.empty:
+        return pd.DataFrame(columns=HIT_COLUMNS)
+    rows = prepared.processing
+    logs.log_info(f"Streaming fuzzy matching: {int(prepared.pairs.sum())} candidate pairs")
+    local, hit_bg, hit_distance = _match_rows(prepared.index.sites, *prepared.task(rows), tolerance, aa_mode,
+                                              _max_pairs(memory_budget_mb))
+    return prepared.to_frame((rows[local], hit_bg, hit_distance), inferred_hit_limit)
+
+
+# --- Process pool ---
+_worker_sites = OrderedDict()  # shared memory name -> attached SiteArrays, per worker process
+
+
+def _match_shard(descriptor, arrays, tolerance, aa_mode, max_pairs):
+    sites = _worker_sites.get(descriptor[0])
+    if sites is None:
+        sites = SiteArrays.attach(descriptor)
+        _worker_sites[descriptor[0]] = sites
+        while len(_worker_sites) > INDEX_CACHE_SIZE:
+            _worker_sites.popitem(last=False)[1].release(unlink=False)
+    return _match_rows(sites, *arrays, tolerance, aa_mode, max_pairs)
+
+
+def get_pool():
+    """
+    The process pool of the matching workers, started on first use with MATCH_WORKERS processes.
+
+    Calls share the pool; their workers argument sets the number of shards
+    or batches they submit, not the pool size.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Worker processes are spawned: forking the threaded server process is not safe
+            _pool = ProcessPoolExecutor(max_workers=constants.MATCH_WORKERS,
+                                        mp_context=multiprocessing.get_context(constants.MATCH_START_METHOD))
+        return _pool
+
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+
+
+def shard_rows(rows, protein, pairs, n_shards):
+    """
+    Splits rows (in processing order) into shards of whole proteins with similar pair counts.
+
+    Proteins are dealt to the shards in descending order of their pairs,
+    in a back-and-forth (snake) order. Each shard keeps the processing order.
+    """
+    proteins, inverse = np.unique(protein[rows], return_inverse=True)
+    load = np.bincount(inverse, weights=pairs[rows])
+    rank = np.empty(len(proteins), dtype=np.int64)
+    rank[np.argsort(-load, kind="stable")] = np.arange(len(proteins))
+    lap, position = np.divmod(rank, n_shards)
+    shard_of_protein = np.where(lap % 2 == 0, position, n_shards - 1 - position)
+    shard = shard_of_protein[inverse]
+    return [rows[shard == i] for i in range(n_shards) if (shard == i).any()]
+
+
+def fuzzy_join_parallel(samples, background, tolerance=0, aa_mode='exact', inferred_hit_limit=None,
+                        workers=None, memory_budget_mb=None, min_pairs=None):
+    """
+    Same result as site_matching.fuzzy_join, with the matching spread over a process pool.
+
+    Args:
+        samples: DataFrame with sample sites (SUB_ACC_ID, SUB_MOD_RSD)
+        background: Background DataFrame
+        tolerance: Maximum position difference allowed
+        aa_mode: Amino acid matching mode ('exact', 'st-similar', 'ignore')
+        inferred_hit_limit: Maximum number of inferred hits per kinase
+        workers: Shards are dealt for this many workers of the pool (default MATCH_WORKERS)
+        memory_budget_mb: Memory for candidate pairs per chunk and worker (default MATCH_MEMORY_BUDGET_MB)
+        min_pairs: Inputs with fewer candidate pairs are matched in-process (default MATCH_PARALLEL_MIN_PAIRS)
+
+    Returns:
+        DataFrame with matched sites, each sample site matched to max 1 DB site
+    """
+    workers = workers or constants.MATCH_WORKERS
+    min_pairs = constants.MATCH_PARALLEL_MIN_PAIRS if min_pairs is None else min_pairs
+    prepared = PreparedSites(samples, background, aa_mode)
+    if prepared.empty:
+        return pd.DataFrame(columns=HIT_COLUMNS)
+    total_pairs = int(prepared.pairs.sum())
+    if workers <= 1 or total_pairs < min_pairs:
+        # Not worth the inter-process traffic
+        local, hit_bg, hit_distance = _match_rows(prepared.index.sites, *prepared.task(prepared.processing),
+                                                  tolerance, aa_mode, _max_pairs(memory_budget_mb))
+        return prepared.to_frame((prepared.processing[local], hit_bg, hit_distance), inferred_hit_limit)
+
+    shards = shard_rows(prepared.processing, prepared.group_code[prepared.groups], prepared.pairs,
+                        workers * SHARDS_PER_WORKER)
+    logs.log_info(f"Parallel fuzzy matching: {total_pairs} candidate pairs in {len(shards)} shards on {workers} workers")
+    descriptor = prepared.index.shared()
+    futures = []
+    try:
+        pool = get_pool()
+        for rows in shards:
+            futures.append(pool.submit(_match_shard, descriptor, prepared.task(rows), tolerance, aa_mode,
+                                       _max_pairs(memory_budget_mb)))
+        hit_rows, hit_bg, hit_distance = [], [], []
+        for rows, future in zip(shards, futures):
+            local, bg, distance = future.result()
+            hit_rows.append(rows[local])
+            hit_bg.append(bg)
+            hit_distance.append(distance)
+    finally:
+        # Shards still running read the block; it can be freed only after them
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        prepared.index.unshare()
+    return prepared.to_frame((np.concatenate(hit_rows), np.concatenate(hit_bg), np.concatenate(hit_distance)),
+                             inferred_hit_limit)
@@ -0,0 +1,218 @@
+# permutation.py
+"""
+Empirical p-values of the site-level (fuzzy) enrichment by permutation.
+
+Fisher's exact and the chi-square test treat every background row as an
+independent draw. Fuzzy matching keeps one background row per input site
+(1:1), so a site annotated with several kinases counts for one of them
+only, and the rows of a site are not independent. The permutation test
+uses the site structure of the background as the null model instead:
+
+- Every distinct background site matches itself at distance 0, whatever
+  the tolerance and amino acid mode, and the first of its rows in
+  background order wins the tie. That row's kinase is the one a hit on
+  the site counts for. The site x kinase map is a sparse matrix, cached
+  per background version.
+- A draw is a random set of distinct background sites with the same size
+  and residue composition as the matched input sites. The hit counts of
+  all kinases for a batch of draws are one sparse product of the draw
+  indicator matrix with the site x kinase matrix.
+- The p-value of a kinase is (1 + draws with at least the observed count)
+  / (1 + draws). Batches have fixed sizes and seeds derived from the run
+  seed, so results do not depend on the number of workers. Batches run on
+  the matching process pool.
+- Sampling stops early (Besag & Clifford, 1991) for a kinase once h draws
+  reached its observed count, with h chosen so that its p-value is certain
+  to exceed PERMUTATION_ALPHA. Its p-value is then h / draws so far. Only
+  kinases near or below alpha get the full number of draws; since the
+  batches are fixed, their p-values equal those of a run without stopping.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import constants
+import logs
+import matching
+
+_null_cache = OrderedDict()
+_null_lock = threading.Lock()
+
+
+class NullModel:
+    """Distinct background sites with their residue and the kinase their hit counts for."""
+
+    def __init__(self, index):
+        # First row per site in background order (invalid sites are not in the index frame)
+        rows = index.frame.drop_duplicates(subset=['SUB_ACC_ID', 'SUB_MOD_RSD']).reset_index(drop=True)
+        self.sites = rows[['SUB_ACC_ID', 'SUB_MOD_RSD']]
+        self.residue = self.sites['SUB_MOD_RSD'].astype(str).str[0].to_numpy()
+        self.kinase = pd.MultiIndex.from_frame(rows[['KINASE', 'KIN_ACC_ID']])
+
+    def __len__(self):
+        return len(self.sites)
+
+    def matrix(self, kinases):
+        """Sparse site x kinase indicator for the (KINASE, KIN_ACC_ID) pairs of kinases."""
+        columns = pd.MultiIndex.from_frame(kinases[['KINASE', 'KIN_ACC_ID']]).get_indexer(self.kinase)
+        rows = np.flatnonzero(columns >= 0)
+        return sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns[rows])),
+                                 shape=(len(self), len(kinases)))
+
+    def strata(self, residues):
+        """
+        Site pools and draw sizes per residue of the matched input sites.
+
+        Residues with fewer background sites than input sites are drawn completely.
+        """
+        pools, sizes = [], []
+        for residue, size in pd.Series(residues).value_counts(sort=False).items():
+            pool = np.flatnonzero(self.residue == residue)
+            if size > len(pool):
+                logs.log_warning(f"Only {len(pool)} background sites with residue {residue} for {size} input sites",
+                                 rate_limit_key="permutation-stratum")
+                size = len(pool)
+            if size:
+                pools.append(pool)
+                sizes.append(int(size))
+        return pools, sizes
+
+
+def get_null_model(background):
+    """Returns the NullModel of a background, cached per background version."""
+    index = matching.get_background_index(background)
+    with _null_lock:
+        model = _null_cache.get(index.key)
+        if model is not None:
+            _null_cache.move_to_end(index.key)
+            return model
+    model = NullModel(index)
+    with _null_lock:
+        _null_cache[index.key] = model
+        while len(_null_cache) > matching.INDEX_CACHE_SIZE:
+            _null_cache.popitem(last=False)
+    return model
+
+
+def draw_sites(rng, pools, sizes, draws):
+    """Random site sets (one row per draw) with sizes[i] distinct sites from pools[i]."""
+    drawn = np.empty((draws, sum(sizes)), dtype=np.int64)
+    for row in drawn:
+        offset = 0
+        for pool, size in zip(pools, sizes):
+            row[offset:offset + size] = pool[rng.choice(len(pool), size, replace=False)]
+            offset += size
+    return drawn
+
+
+def _permutation_batch(pools, sizes, matrix, observed, draws, seed):
+    """Per draw and kinase whether the kinase reaches its observed count, bit-packed over the draws."""
+    drawn = draw_sites(np.random.default_rng(seed), pools, sizes, draws)
+    width = drawn.shape[1]
+    indicator = sparse.csr_matrix((np.ones(drawn.size, dtype=np.int32), drawn.ravel(),
+                                   np.arange(0, drawn.size + 1, width)), shape=(draws, matrix.shape[0]))
+    counts = (indicator @ matrix).toarray()
+    return np.packbits(counts >= observed, axis=0)
+
+
+def _batches(n_permutations, seed):
+    sizes = [constants.PERMUTATION_BATCH] * (n_permutations // constants.PERMUTATION_BATCH)
+    if n_permutations % constants.PERMUTATION_BATCH:
+        sizes.append(n_permutations % constants.PERMUTATION_BATCH)
+    return zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))
+
+
+def stopping_count(n_permutations, alpha):
+    """Exceedances after which a p-value is certain to be above alpha (n_permutations + 1: never stop)."""
+    if not alpha or alpha >= 1:
+        return n_permutations + 1
+    # h > alpha * n_permutations: both h / draws and the p-value of all draws are then above alpha
+    return min(math.floor(alpha * n_permutations) + 1, n_permutations + 1)
+
+
+class SequentialCounts:
+    """Exceedance counts per kinase with Besag-Clifford stopping at h exceedances."""
+
+    def __init__(self, n_kinases, h):
+        self.h = h
+        self.exceed = np.zeros(n_kinases, dtype=np.int64)
+        self.draws = np.zeros(n_kinases, dtype=np.int64)
+        self.stopped = np.zeros(n_kinases, dtype=bool)
+
+    def add(self, columns, reached):
+        """
+        Adds one batch of draws.
+
+        Args:
+            columns: Kinases the batch was drawn for
+            reached: Boolean draws x columns, whether the kinase reached its observed count
+        """
+        keep = ~self.stopped[columns]
+        columns, reached = columns[keep], reached[:, keep]
+        cumulative = self.exceed[columns] + np.cumsum(reached, axis=0)
+        stop = cumulative[-1] >= self.h
+        # Draw at which the h-th exceedance occurred
+        stop_at = np.argmax(cumulative >= self.h, axis=0) + 1
+        self.draws[columns] += np.where(stop, stop_at, len(reached))
+        self.exceed[columns] = np.minimum(cumulative[-1], self.h)
+        self.stopped[columns] |= stop
+
+    def p_values(self, n_permutations):
+        return np.where(self.stopped, self.h / np.maximum(self.draws, 1), (1 + self.exceed) / (1 + n_permutations))
+
+
+def permutation_p_values(kinases, merged, _raw_data, n_permutations=None, seed=None, workers=None, alpha=None):
+    """
+    Empirical p-values for fuzzy matching results (the permutation test of enrichment.py).
+
+    Args:
+        kinases: DataFrame with kinase information (KINASE, KIN_ACC_ID, count)
+        merged: Merged fuzzy data (hits of the run)
+        _raw_data: Raw dataset
+        n_permutations: Maximum number of random site sets drawn (default PERMUTATION_COUNT)
+        seed: Seed of the random draws (default PERMUTATION_SEED)
+        workers: Batches per round, run on the matching pool (default MATCH_WORKERS)
+        alpha: Level for early stopping (default PERMUTATION_ALPHA, 0 disables)
+
+    Returns:
+        Array of p-values, in the order of kinases
+    """
+    n_permutations = int(n_permutations or constants.PERMUTATION_COUNT)
+    seed = constants.PERMUTATION_SEED if seed is None else int(seed)
+    workers = workers or constants.MATCH_WORKERS
+    alpha = constants.PERMUTATION_ALPHA if alpha is None else alpha
+    if kinases.empty:
+        return np.zeros(0)
+
+    logs.log_info(f"Calculating permutation p-values ({n_permutations} permutations, seed {seed}, alpha {alpha})")
+    model = get_null_model(_raw_data)
+    pools, sizes = model.strata(merged['SUB_MOD_RSD_sample'].astype(str).str[0])
+    matrix = model.matrix(kinases)
+    observed = kinases['count'].to_numpy()
+
+    counts = SequentialCounts(len(kinases), stopping_count(n_permutations, alpha))
+    batches = list(_batches(n_permutations, seed))
+    # One batch per worker and round; the stopping rule is applied between rounds
+    round_size = 1 if workers <= 1 else workers
+    for start in range(0, len(batches), round_size):
+        columns = np.flatnonzero(~counts.stopped)
+        if not len(columns):
+            break
+        args = (pools, sizes, matrix[:, columns], observed[columns])
+        round_batches = batches[start:start + round_size]
+        if round_size == 1:
+            packed = [_permutation_batch(*args, draws, batch_seed) for draws, batch_seed in round_batches]
+        else:
+            pool = matching.get_pool()
+            packed = [future.result() for future in
+                      [pool.submit(_permutation_batch, *args, draws, batch_seed) for draws, batch_seed in round_batches]]
+        for (draws, _), bits in zip(round_batches, packed):
+            counts.add(columns, np.unpackbits(bits, axis=0, count=draws).astype(bool))
+    p_values = counts.p_values(n_permutations)
+    logs.log_info(f"Permutation draws: {int(counts.draws.sum())} of {n_permutations * len(kinases)}, "
+                  f"{int(counts.stopped.sum())} of {len(kinases)} kinases stopped early")
+    return p_values
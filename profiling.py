@@ -0,0 +1,141 @@
+# profiling.py
+"""
+Opt-in per-request profiling for analysis callbacks.
+
+Profiling is active for a request if FUZZYKEA_PROFILE=1 is set, or if
+FUZZYKEA_PROFILE_TOKEN is set and the request carries the same token in the
+X-FuzzyKEA-Profile header. Each profiled request writes one data file to
+constants.PROFILE_DIR plus a JSON sidecar with session ID and parameters:
+
+- mode "cprofile": <name>.pstats, readable with pstats / snakeviz
+- mode "sample":   <name>.collapsed, one "frame;frame;frame count" line per
+                   stack, readable with flamegraph.pl / speedscope
+"""
+import cProfile
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+import constants
+import util
+
+
+def profiling_requested():
+    """Returns True if the current request should be profiled."""
+    if constants.PROFILE_ENABLED:
+        return True
+    if not constants.PROFILE_TOKEN:
+        return False
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return False
+    if not has_request_context():
+        return False
+    header_value = request.headers.get(constants.PROFILE_HEADER, "")
+    return hmac.compare_digest(header_value.encode(), constants.PROFILE_TOKEN.encode())
+
+
+class StackSampler:
+    """Samples the call stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fuzzyKEA-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _output_basename(name, session_id):
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    session_tag = (session_id or "nosession")[:8]
+    return os.path.join(constants.PROFILE_DIR, f"{timestamp}_{name}_{session_tag}")
+
+
+@contextmanager
+def profile_request(name, session_id=None, params=None):
+    """
+    Profiles the enclosed block if profiling is requested, otherwise does nothing.
+
+    Args:
+        name: Label of the profiled operation, used in the file name
+        session_id: Session ID of the user, stored in the sidecar file
+        params: Dict of analysis parameters, stored in the sidecar file
+    """
+    if not profiling_requested():
+        yield
+        return
+
+    mode = constants.PROFILE_MODE
+    if mode == "sample":
+        profiler = StackSampler(threading.get_ident(), constants.PROFILE_SAMPLE_INTERVAL)
+    else:
+        mode = "cprofile"
+        profiler = cProfile.Profile()
+
+    started = time.perf_counter()
+    if mode == "cprofile":
+        profiler.enable()
+    else:
+        profiler.start()
+    try:
+        yield
+    finally:
+        if mode == "cprofile":
+            profiler.disable()
+        else:
+            profiler.stop()
+        duration = time.perf_counter() - started
+        try:
+            os.makedirs(constants.PROFILE_DIR, exist_ok=True)
+            base = _output_basename(name, session_id)
+            if mode == "cprofile":
+                data_path = base + ".pstats"
+                profiler.dump_stats(data_path)
+            else:
+                data_path = base + ".collapsed"
+                profiler.write(data_path)
+            with open(base + ".json", "w") as f:
+                json.dump({
+                    "name": name,
+                    "session_id": session_id,
+                    "params": params or {},
+                    "mode": mode,
+                    "duration_s": round(duration, 4),
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "data_file": os.path.basename(data_path),
+                }, f, indent=2, default=str)
+            util.log_info(f"Profile for {name} written to {data_path} ({duration:.2f}s)", user_context=session_id)
+        except OSError as e:
+            util.log_error("Could not write profile", e, user_context=session_id)
@@ -0,0 +1,130 @@
+# pvalues.py
+"""
+P-values of the kinase contingency tables and their multiple testing correction.
+
+contingency_p_values computes Fisher's exact or the chi-square test for
+all kinases of a run at once and memoizes the tables; the adjusted
+p-values are also kept as -log10 values, computed in log space where the
+correction allows it (see hypergeom.py).
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+from statsmodels.stats.multitest import multipletests
+
+import constants
+import hypergeom
+from logs import log_debug, log_warning
+
+def adjust_p_values(p_values, correction_method):
+    """Multiple testing correction that also accepts an empty result (no matched kinases)."""
+    if len(p_values) == 0:
+        return pd.Series(dtype=float)
+    return multipletests(p_values, method=correction_method)[1]
+
+
+def adjust_neg_log10_p_values(neg_log10_p, correction_method):
+    """
+    Multiple testing correction on -log10 p-values.
+
+    Bonferroni and the Benjamini-Hochberg/-Yekutieli step-ups are computed in
+    log space, so p-values below the smallest double keep their value; other
+    methods go through adjust_p_values.
+    """
+    neg_log10_p = np.asarray(neg_log10_p, dtype=float)
+    m = len(neg_log10_p)
+    if m == 0:
+        return np.zeros(0)
+    if correction_method == 'bonferroni':
+        return np.maximum(neg_log10_p - np.log10(m), 0.0)
+    if correction_method in ('fdr_bh', 'fdr_by'):
+        factor = np.log10(m)
+        if correction_method == 'fdr_by':
+            factor += np.log10(np.sum(1.0 / np.arange(1, m + 1)))
+        order = np.argsort(-neg_log10_p, kind="mergesort")  # ascending p
+        ranked = neg_log10_p[order] - factor + np.log10(np.arange(1, m + 1))
+        # adjusted p_(i) = min over j >= i of p_(j) * m / j
+        ranked = np.maximum.accumulate(ranked[::-1])[::-1]
+        adjusted = np.empty(m)
+        adjusted[order] = np.maximum(ranked, 0.0)
+        return adjusted
+    with np.errstate(divide="ignore"):
+        return -np.log10(np.clip(adjust_p_values(10.0 ** -neg_log10_p, correction_method), np.finfo(float).tiny, 1.0))
+
+
+def add_adjusted_p_values(results, correction_method):
+    """Sets ADJ_P_VALUE (and NEG_LOG10_ADJ_P if the results have NEG_LOG10_P) of a result table in place."""
+    results['ADJ_P_VALUE'] = adjust_p_values(results['P_VALUE'], correction_method)
+    if 'NEG_LOG10_P' in results.columns:
+        results['NEG_LOG10_ADJ_P'] = adjust_neg_log10_p_values(results['NEG_LOG10_P'], correction_method)
+    return results
+
+
+# Memo of contingency_p_values, (x, n, N, M, test) -> (p-value, -log10 p-value), least recently used first
+_p_value_cache = OrderedDict()
+_p_value_lock = threading.Lock()
+
+
+def contingency_p_values(x, n, N, M, statistical_test='fisher'):
+    """
+    One-sided p-values of the tables [[x, n - x], [N - x, M - N - n + x]], vectorized over kinases.
+
+    Fisher's exact test is the hypergeometric upper tail P(X >= x) from the
+    log-factorial table (hypergeom.py); the chi-square test is evaluated
+    with the log survival function of its statistic. Results are memoized
+    per table and test (P_VALUE_CACHE_SIZE entries): many kinases share a
+    table within a run (e.g. one hit and the same number of annotations),
+    and runs on the same background repeat them.
+
+    Returns:
+        (p-values, -log10 p-values)
+    """
+    if statistical_test not in ('fisher', 'chi2'):
+        log_warning(f"Unknown statistical test '{statistical_test}', defaulting to Fisher's exact", rate_limit_key="unknown-test")
+        statistical_test = 'fisher'
+    keys = [(int(a), int(b), int(c), int(d), statistical_test) for a, b, c, d in zip(x, n, N, M)]
+    values = {}
+    with _p_value_lock:
+        for key in keys:
+            cached = _p_value_cache.get(key)
+            if cached is not None:
+                _p_value_cache.move_to_end(key)
+                values[key] = cached
+    missing = [key for key in dict.fromkeys(keys) if key not in values]
+    if missing:
+        computed = _compute_p_values(missing, statistical_test)
+        values.update(computed)
+        with _p_value_lock:
+            _p_value_cache.update(computed)
+            while len(_p_value_cache) > constants.P_VALUE_CACHE_SIZE:
+                _p_value_cache.popitem(last=False)
+    log_debug(f"p-values: {len(keys)} tables, {len(missing)} computed")
+    p_values = np.array([values[key][0] for key in keys], dtype=float)
+    neg_log10_p = np.array([values[key][1] for key in keys], dtype=float)
+    return p_values, neg_log10_p
+
+
+def _compute_p_values(keys, statistical_test):
+    x, n, N, M = (np.array(column, dtype=np.int64) for column in list(zip(*keys))[:4])
+    if statistical_test == 'chi2':
+        log_p = stats.chi2.logsf(_yates_chi2(x, n, N, M), 1)
+    else:
+        log_p = hypergeom.log_sf(x, n, N, M)
+    return dict(zip(keys, zip(np.exp(log_p).tolist(), hypergeom.neg_log10(log_p).tolist())))
+
+
+def _yates_chi2(x, n, N, M):
+    """Chi-square statistics of the 2x2 tables with Yates' correction, as stats.chi2_contingency computes them."""
+    observed = np.stack([x, n - x, N - x, M - N - n + x], axis=1).astype(float)
+    rows = np.stack([n, n, M - n, M - n], axis=1)
+    columns = np.stack([N, M - N, N, M - N], axis=1)
+    expected = rows * columns / M[:, None].astype(float)
+    if (expected == 0).any():
+        raise ValueError("The internally computed table of expected frequencies has a zero element.")
+    # Continuity correction, never larger than the difference itself
+    diff = expected - observed
+    observed = observed + np.minimum(0.5, np.abs(diff)) * np.sign(diff)
+    return ((observed - expected) ** 2 / expected).sum(axis=1)
@@ -0,0 +1,163 @@
+# reference_engine.py
+"""
+Frozen reference implementation of fuzzy matching and fuzzy p-values.
+
+This is the row-wise fuzzy_join + limit_inferred_hits + calculate_fuzzy_p_vals
+path from util.py as of the introduction of the equivalence harness, with
+logging and progress bars stripped. It is deliberately slow and must not be
+optimized: faster backends are validated against it with equivalence.py.
+
+Tie-breaking is pinned to stable sorts: if several background rows are
+equally close to an input site, the first one in background order wins.
+"""
+import pandas as pd
+import scipy.stats as stats
+from scipy.stats import fisher_exact
+from statsmodels.stats.multitest import multipletests
+
+HIT_COLUMNS = ['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg',
+               'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE']
+RESULT_COLUMNS = ["KINASE", "P_VALUE", "UPID", "FOUND", "SUB#"]
+
+
+def parse_site(site_str):
+    if pd.isna(site_str):
+        return None, None
+    site_str = str(site_str).strip()
+    if len(site_str) < 2:
+        return None, None
+    pos_str = site_str[1:]
+    if not pos_str.lstrip('-').isdigit():
+        return None, None
+    return site_str[0], int(pos_str)
+
+
+def aa_match(aa1, aa2, aa_mode):
+    if aa_mode == 'ignore':
+        return True
+    elif aa_mode == 'exact':
+        return aa1 == aa2
+    elif aa_mode.lower() == 'st-similar':
+        return aa1 == aa2 or {aa1, aa2} <= {'S', 'T'}
+    raise ValueError(f"Unbekannter aa_mode: {aa_mode}")
+
+
+def limit_inferred_hits(df, inferred_hit_limit):
+    if df.empty:
+        return df
+    df = df.copy().reset_index(drop=True)
+
+    def extract_pos(site_str):
+        _, pos = parse_site(site_str)
+        return pos
+
+    df["sample_pos"] = df["SUB_MOD_RSD_sample"].apply(extract_pos)
+    df["bg_pos"] = df["SUB_MOD_RSD_bg"].apply(extract_pos)
+    df = df.dropna(subset=["sample_pos", "bg_pos"]).copy()
+    if df.empty:
+        return pd.DataFrame(columns=df.columns)
+    df["pos_diff"] = abs(df["sample_pos"] - df["bg_pos"])
+
+    result_rows = []
+    for _, group in df.groupby("KINASE"):
+        group = group.reset_index(drop=True).copy()
+        imputed_mask = group["IMPUTED"].astype(bool)
+        exact = group.loc[~imputed_mask].copy()
+        inferred = group.loc[imputed_mask].copy()
+        if not inferred.empty and inferred_hit_limit > 0:
+            inferred = inferred.sort_values("pos_diff", ascending=True, kind="mergesort").head(inferred_hit_limit)
+        elif inferred_hit_limit == 0:
+            inferred = pd.DataFrame(columns=group.columns)
+        result_rows.append(pd.concat([exact, inferred], ignore_index=True))
+
+    df_limited = pd.concat(result_rows, ignore_index=True) if result_rows else pd.DataFrame(columns=df.columns)
+    return df_limited.drop(columns=["sample_pos", "bg_pos", "pos_diff"])
+
+
+def fuzzy_join(samples, background, tolerance=0, aa_mode='exact', inferred_hit_limit=None):
+    samples = samples.copy()
+    background = background.copy()
+    samples[['AA', 'Pos']] = samples['SUB_MOD_RSD'].apply(parse_site).apply(pd.Series)
+    background[['AA', 'Pos']] = background['SUB_MOD_RSD'].apply(parse_site).apply(pd.Series)
+    samples = samples.dropna(subset=['AA', 'Pos'])
+    background = background.dropna(subset=['AA', 'Pos'])
+    if samples.empty or background.empty:
+        return pd.DataFrame(columns=HIT_COLUMNS)
+
+    merged = samples.merge(background, on='SUB_ACC_ID', suffixes=('_sample', '_bg'))
+
+    def match_and_calculate_distance(row):
+        if aa_match(row['AA_sample'], row['AA_bg'], aa_mode):
+            distance = abs(row['Pos_sample'] - row['Pos_bg'])
+            if distance <= tolerance:
+                return True, distance > 0, distance
+        return False, None, None
+
+    results = merged.apply(match_and_calculate_distance, axis=1)
+    merged[['match', 'IMPUTED', 'pos_distance']] = pd.DataFrame(results.tolist(), index=merged.index)
+    filtered = merged[merged['match']].copy()
+    if filtered.empty:
+        return pd.DataFrame(columns=HIT_COLUMNS)
+
+    filtered['sample_site_id'] = filtered['SUB_ACC_ID'] + '_' + filtered['SUB_MOD_RSD_sample']
+    filtered = filtered.sort_values('pos_distance', kind='mergesort')
+    filtered_unique = filtered.drop_duplicates(subset=['sample_site_id'], keep='first').copy()
+
+    for gene_col in ('GENE_sample', 'GENE_bg', 'GENE', 'SUB_GENE_bg', 'SUB_GENE_sample'):
+        if gene_col in filtered_unique.columns:
+            if gene_col != 'SUB_GENE':
+                filtered_unique['SUB_GENE'] = filtered_unique[gene_col]
+            break
+    else:
+        filtered_unique['SUB_GENE'] = ''
+
+    result = filtered_unique[HIT_COLUMNS].copy()
+    if inferred_hit_limit is not None:
+        result = limit_inferred_hits(result, inferred_hit_limit)
+    return result
+
+
+def calculate_fuzzy_p_vals(kinases, merged, _raw_data, statistical_test='fisher', mode="limit"):
+    results = []
+    for _, row in kinases.iterrows():
+        x = row["count"]
+        kinase = row["KINASE"]
+        upid = row["KIN_ACC_ID"]
+        N = len(merged)
+        n = len(_raw_data[_raw_data["KIN_ACC_ID"] == upid])
+        M = len(_raw_data)
+        if mode == "limit" and x > n:
+            x = n
+
+        table = [[x, n - x],
+                 [N - x, M - N - n + x]]
+        if all(value >= 0 for sublist in table for value in sublist):
+            if statistical_test == 'chi2':
+                _, p_value, _, _ = stats.chi2_contingency(table)
+            else:
+                _, p_value = fisher_exact(table, alternative='greater')
+            results.append([kinase, p_value, upid, x, n])
+        else:
+            results.append([kinase, 1.0, upid, x, n])
+    return results
+
+
+def fuzzy_enrichment(raw_data, sites, correction_method='fdr_bh', statistical_test='fisher',
+                     tolerance=0, aa_mode='exact', inferred_hit_limit=None):
+    """
+    Reference site-level fuzzy enrichment.
+
+    Returns:
+        Tuple (results, hits): results has the columns KINASE, P_VALUE, UPID,
+        FOUND, SUB#, ADJ_P_VALUE; hits has one row per matched input site.
+    """
+    hits = fuzzy_join(sites, pd.DataFrame(raw_data), tolerance=tolerance, aa_mode=aa_mode,
+                      inferred_hit_limit=inferred_hit_limit)
+    kinases = hits.groupby(['KINASE', 'KIN_ACC_ID']).size().reset_index(name='count')
+    results = pd.DataFrame(calculate_fuzzy_p_vals(kinases, hits, raw_data, statistical_test),
+                           columns=RESULT_COLUMNS)
+    if not results.empty:
+        results['ADJ_P_VALUE'] = multipletests(results['P_VALUE'], method=correction_method)[1]
+    else:
+        results['ADJ_P_VALUE'] = pd.Series(dtype=float)
+    return results.reset_index(drop=True), hits
@@ -0,0 +1,233 @@
+# result_store.py
+"""
+Server-side storage of analysis results.
+
+run_analysis keeps the full result tables and hit rows here and only sends
+a small handle ({"session_id", "run_id"}) to the browser. Downloads and
+detail tables resolve the handle instead of shipping the data back up. A
+correction method chosen after the run is added to the handle
+("correction_method"); get resolves it, on whichever worker, to a corrected
+copy of the stored result. Stored results are never modified, and the
+corrected copies are built once per method.
+
+The store lives in the memory of the worker process. It is bounded in the
+number of entries (least recently used entries are evicted first), in the
+number of runs kept per session, and entries expire after a TTL.
+
+With RESULT_STORE_MODE = "client" the handle additionally carries the
+result tables in the columnar store encoding (store_codec.py), so any
+worker of a multi-process deployment can rebuild a result it has not
+computed itself, at the cost of larger store payloads.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+import constants
+import store_codec
+import util
+
+
+def index_by_kinase(hits):
+    """Maps each KINASE to the positions of its rows in a hit table."""
+    if hits is None or hits.empty or "KINASE" not in hits.columns:
+        return {}
+    return {kinase: np.asarray(positions) for kinase, positions in hits.groupby("KINASE", sort=False).indices.items()}
+
+
+class AnalysisResult:
+    """Result tables of one analysis run."""
+
+    def __init__(self, site_results, sub_results, site_hits, sub_hits, params=None, downloads=None, totals=None):
+        self.site_results = site_results
+        self.sub_results = sub_results
+        self.site_hits = site_hits
+        self.sub_hits = sub_hits
+        self.params = params or {}  # user-facing settings of the run
+        self.totals = totals or {}  # N and M of the contingency tables per level (util.contingency_totals)
+        self.downloads = downloads or {}  # pre-rendered TSV text per level ("site", "sub")
+        self.created = time.time()
+        self.views = {}  # row orders of the paged tables, see table_query.query_page
+        # Built once so that detail tables do not scan all hits per click
+        self.hit_index = {"site": index_by_kinase(site_hits), "sub": index_by_kinase(sub_hits)}
+        # One result per correction method, shared by the result and its corrected copies
+        self._corrections = {self.params.get("correction_method"): self}
+        self._corrections_lock = threading.Lock()
+
+    def render_downloads(self):
+        """Renders the single-table TSV downloads of both levels (see util.build_download_tables)."""
+        site_table, sub_table = util.build_download_tables(self.site_results, self.sub_results,
+                                                           self.site_hits, self.sub_hits)
+        self.downloads = {level: util.to_tsv(table) for level, table in (("site", site_table), ("sub", sub_table))
+                          if table is not None}
+        return self
+
+    def corrected(self, correction_method):
+        """
+        The result with the adjusted p-values of another correction method; P_VALUEs are unchanged.
+
+        The copy shares the hit tables and is built once per method; self is not modified.
+        """
+        with self._corrections_lock:
+            result = self._corrections.get(correction_method)
+        if result is not None:
+            return result
+        result = copy.copy(self)
+        for attr in ("site_results", "sub_results"):
+            frame = getattr(self, attr)
+            if frame is not None and not frame.empty and "P_VALUE" in frame.columns:
+                frame = frame.copy()
+                frame["P_VALUE"] = frame["P_VALUE"].astype(float)
+                setattr(result, attr, util.add_adjusted_p_values(frame, correction_method))
+        result.params = {**self.params, "correction_method": correction_method}
+        result.views = {}
+        result.render_downloads()
+        with self._corrections_lock:
+            # Another thread may have built the same correction meanwhile; all callers get the first one
+            return self._corrections.setdefault(correction_method, result)
+
+    def hits_for_kinase(self, level, kinase):
+        """
+        Returns the hit rows of one kinase.
+
+        Args:
+            level: "site" or "sub"
+            kinase: Kinase name as shown in the result tables
+
+        Returns:
+            DataFrame of hits, None if the run has no hit table for this level
+        """
+        hits = self.site_hits if level == "site" else self.sub_hits
+        if hits is None or hits.empty or "KINASE" not in hits.columns:
+            return None
+        positions = self.hit_index[level].get(kinase)
+        if positions is None:
+            return hits.iloc[0:0]
+        return hits.iloc[positions]
+
+
+class ResultStore:
+    """Thread-safe LRU store with TTL eviction, keyed by (session ID, run ID)."""
+
+    def __init__(self, max_entries, ttl_seconds, max_runs_per_session):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_runs_per_session = max_runs_per_session
+        self._entries = OrderedDict()
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def put(self, session_id, result):
+        """
+        Stores a result and returns the handle for the browser.
+
+        Returns:
+            Dict with session_id and run_id
+        """
+        session_id = session_id or "anonymous"
+        key = (session_id, uuid.uuid4().hex)
+        self._insert(key, result)
+        return {"session_id": key[0], "run_id": key[1]}
+
+    def _insert(self, key, result):
+        session_id = key[0]
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._entries[key] = result
+            self._expires[key] = now + self.ttl_seconds
+            # Older runs of the same session are no longer reachable from the UI
+            session_keys = [k for k in self._entries if k[0] == session_id]
+            for old_key in session_keys[:-self.max_runs_per_session]:
+                self._remove(old_key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def get(self, handle):
+        """Returns the AnalysisResult for a handle (with the handle's correction), or None if unknown or expired."""
+        return _with_handle_correction(self._lookup(handle), handle)
+
+    def _lookup(self, handle):
+        if not handle or not isinstance(handle, dict):
+            return None
+        key = (handle.get("session_id"), handle.get("run_id"))
+        now = time.monotonic()
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                return None
+            if self._expires[key] < now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self._expires[key] = now + self.ttl_seconds
+            return result
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._expires.pop(key, None)
+
+    def _evict_expired(self, now):
+        for key in [k for k, expires in self._expires.items() if expires < now]:
+            self._remove(key)
+
+
+class ClientResultStore(ResultStore):
+    """
+    ResultStore whose handles also carry the encoded result tables.
+
+    The local entries act as a cache; a handle that is unknown to this
+    worker is decoded and cached.
+    """
+
+    TABLES = ("site_results", "sub_results", "site_hits", "sub_hits")
+
+    def put(self, session_id, result):
+        handle = super().put(session_id, result)
+        handle["tables"] = {
+            name: store_codec.encode_frame(getattr(result, name))
+            for name in self.TABLES if getattr(result, name) is not None
+        }
+        handle["params"] = result.params
+        handle["totals"] = result.totals
+        return handle
+
+    def get(self, handle):
+        result = self._lookup(handle)
+        if result is not None or not isinstance(handle, dict) or "tables" not in handle:
+            return _with_handle_correction(result, handle)
+        try:
+            tables = {name: store_codec.decode_frame(payload, copy=False) for name, payload in handle["tables"].items()}
+        except (ValueError, KeyError, TypeError) as e:
+            util.log_warning(f"Could not decode result tables from store: {e}")
+            return None
+        result = AnalysisResult(params=handle.get("params"), totals=handle.get("totals"),
+                                **{name: tables.get(name) for name in self.TABLES})
+        result.render_downloads()
+        self._insert((handle.get("session_id"), handle.get("run_id")), result)
+        return _with_handle_correction(result, handle)
+
+
+def _with_handle_correction(result, handle):
+    # The correction chosen after the run is kept in the handle (see callbacks.apply_correction_method),
+    # so every worker resolves the handle to the same corrected copy of its stored result
+    correction_method = handle.get("correction_method") if isinstance(handle, dict) else None
+    if result is None or not correction_method:
+        return result
+    return result.corrected(correction_method)
+
+
+_store_class = ClientResultStore if constants.RESULT_STORE_MODE == "client" else ResultStore
+results = _store_class(
+    max_entries=constants.RESULT_STORE_MAX_ENTRIES,
+    ttl_seconds=constants.RESULT_STORE_TTL_SECONDS,
+    max_runs_per_session=constants.RESULT_STORE_RUNS_PER_SESSION,
+)
@@ -0,0 +1,306 @@
+# site_matching.py
+"""
+Site parsing and the reference fuzzy join.
+
+fuzzy_join matches every input site to at most one background site of the
+same protein (the closest within the tolerance) with a pandas merge of all
+candidate pairs; limit_inferred_hits caps the fuzzy hits per kinase.
+matching.py computes the same hits with bounded memory and reuses
+limit_inferred_hits. util re-exports these functions.
+"""
+import pandas as pd
+from tqdm import tqdm
+
+import constants
+from logs import log_debug, log_error, log_info, log_warning
+
+tqdm.pandas(disable=not constants.SHOW_PROGRESS)
+
+
+# Hilfsfunktion zum Parsen der Site-Spalte
+def parse_site(site_str):
+    """Parse a site string like 'S123' into amino acid and position."""
+    try:
+        if pd.isna(site_str):
+            return None, None
+        
+        site_str = str(site_str).strip()
+        
+        if len(site_str) < 2:
+            log_warning(f"Invalid site format (too short): '{site_str}'", rate_limit_key="invalid-site")
+            return None, None
+        
+        aa = site_str[0]
+        pos_str = site_str[1:]
+        
+        # Check if position is a valid number
+        if not pos_str.lstrip('-').isdigit():
+            log_warning(f"Invalid position in site: '{site_str}'", rate_limit_key="invalid-site")
+            return None, None
+        
+        pos = int(pos_str)
+        
+        return aa, pos
+    except Exception as e:
+        log_warning(f"Error parsing site '{site_str}': {e}", rate_limit_key="invalid-site")
+        return None, None
+
+# Aminosäurevergleich je nach Modus
+def aa_match(aa1, aa2, aa_mode):
+    if aa_mode == 'ignore':
+        return True
+    elif aa_mode == 'exact':
+        return aa1 == aa2
+    elif aa_mode.lower() == 'st-similar':
+        if aa1 == aa2:
+            return True
+        if {aa1, aa2} <= {'S', 'T'}:
+            return True
+        return False
+    else:
+        raise ValueError(f"Unbekannter aa_mode: {aa_mode}")
+
+def limit_inferred_hits(df, inferred_hit_limit):
+    """
+    Limit the number of inferred (fuzzy-matched) hits per kinase.
+    Keeps all exact matches and only the closest inferred hits up to the limit.
+    
+    Args:
+        df: DataFrame with matched sites
+        inferred_hit_limit: Maximum number of inferred hits to keep per kinase
+    
+    Returns:
+        DataFrame with limited inferred hits
+    """
+    if df.empty:
+        return df
+    
+    if "SUB_MOD_RSD_sample" not in df.columns:
+        log_error(f"SUB_MOD_RSD_sample not in columns. Available columns: {list(df.columns)}")
+        raise ValueError("DataFrame must contain 'SUB_MOD_RSD_sample' column to limit inferred hits.")
+    
+    if "SUB_MOD_RSD_bg" not in df.columns:
+        log_error(f"SUB_MOD_RSD_bg not in columns. Available columns: {list(df.columns)}")
+        raise ValueError("DataFrame must contain 'SUB_MOD_RSD_bg' column to limit inferred hits.")
+    
+    # Work on a copy and reset index immediately to avoid alignment issues
+    df = df.copy().reset_index(drop=True)
+    
+    log_debug(f"limit_inferred_hits: Processing {df.shape[0]} hits")
+    
+    # Calculate position difference - handle parsing errors
+    def safe_extract_pos(site_str):
+        """Safely extract position from site string."""
+        try:
+            if pd.isna(site_str):
+                return None
+            site_str = str(site_str).strip()
+            if len(site_str) < 2:
+                return None
+            pos_part = site_str[1:]
+            if not pos_part.lstrip('-').isdigit():
+                return None
+            return int(pos_part)
+        except (ValueError, IndexError) as e:
+            log_warning(f"Could not extract position from '{site_str}': {e}", rate_limit_key="invalid-site")
+            return None
+    
+    df["sample_pos"] = df["SUB_MOD_RSD_sample"].apply(safe_extract_pos)
+    df["bg_pos"] = df["SUB_MOD_RSD_bg"].apply(safe_extract_pos)
+    
+    # Remove rows where position extraction failed
+    before_drop = len(df)
+    try:
+        df = df.dropna(subset=["sample_pos", "bg_pos"]).copy()
+        if len(df) < before_drop:
+            log_warning(f"Removed {before_drop - len(df)} rows with invalid positions")
+    except Exception as e:
+        log_error("Error during position filtering", e)
+        raise
+    
+    if df.empty:
+        log_warning("No valid positions found in limit_inferred_hits, returning empty DataFrame")
+        return pd.DataFrame(columns=df.columns)
+    
+    try:
+        df["pos_diff"] = abs(df["sample_pos"] - df["bg_pos"])
+    except Exception as e:
+        log_error("Error calculating position difference", e)
+        raise
+    
+    # For each kinase, keep all exact matches + closest inferred hits up to limit
+    result_rows = []
+    try:
+        for kinase, group in df.groupby("KINASE"):
+            # Reset index for the group to avoid negative index issues
+            group = group.reset_index(drop=True).copy()
+            log_debug(f"Processing kinase: {kinase}, {group.shape[0]} hits")
+            
+            # Convert IMPUTED to boolean explicitly to avoid indexing issues
+            imputed_mask = group["IMPUTED"].astype(bool)
+            
+            # Separate exact matches from inferred using .loc to be explicit
+            exact_mask = ~imputed_mask
+            
+            exact = group.loc[exact_mask].copy()
+            inferred = group.loc[imputed_mask].copy()
+            log_debug(f"Kinase {kinase} - exact: {len(exact)}, inferred: {len(inferred)}")
+            
+            # Sort inferred by position difference and keep only the closest ones
+            if not inferred.empty and inferred_hit_limit > 0:
+                # Stable sort: ties keep background order, so results are reproducible
+                inferred = inferred.sort_values("pos_diff", ascending=True, kind="mergesort").head(inferred_hit_limit)
+            elif inferred_hit_limit == 0:
+                inferred = pd.DataFrame(columns=group.columns)
+            
+            # Combine exact and limited inferred hits
+            kinase_hits = pd.concat([exact, inferred], ignore_index=True)
+            result_rows.append(kinase_hits)
+        
+        log_debug(f"Finished processing {len(result_rows)} kinases")
+    except Exception as e:
+        log_error("Error in kinase grouping loop", e)
+        raise
+    
+    log_info(f"Before limiting: {len(df)} total hits")
+    try:
+        df_limited = pd.concat(result_rows, ignore_index=True) if result_rows else pd.DataFrame(columns=df.columns)
+        log_info(f"After limiting: {len(df_limited)} total hits (max {inferred_hit_limit} inferred per kinase)")
+    except Exception as e:
+        log_error("Error concatenating results", e)
+        raise
+    
+    # Clean up temporary columns
+    try:
+        df_limited = df_limited.drop(columns=["sample_pos", "bg_pos", "pos_diff"])
+    except Exception as e:
+        log_error(f"Error dropping temporary columns. Available: {list(df_limited.columns)}", e)
+        raise
+    
+    return df_limited
+    
+    
+# Fuzzy Join Funktion
+def fuzzy_join(samples, background, tolerance=0, aa_mode='exact', inferred_hit_limit=None):
+    """
+    Fuzzy matching of sample sites to background database sites.
+    Each sample site is matched to AT MOST ONE database site (the closest one by position).
+    
+    Args:
+        samples: DataFrame with sample sites
+        background: DataFrame with database sites
+        tolerance: Maximum position difference allowed
+        aa_mode: Amino acid matching mode ('exact', 'st-similar', 'ignore')
+        inferred_hit_limit: Maximum number of inferred hits per kinase
+    
+    Returns:
+        DataFrame with matched sites, each sample site matched to max 1 DB site
+    """
+    
+    samples = samples.copy()
+    background = background.copy()
+
+    # AA + Pos extrahieren
+    log_info("Parsing sample sites...")
+    samples[['AA', 'Pos']] = samples['SUB_MOD_RSD'].progress_apply(parse_site).progress_apply(pd.Series)
+    
+    log_info("Parsing background sites...")
+    background[['AA', 'Pos']] = background['SUB_MOD_RSD'].progress_apply(parse_site).progress_apply(pd.Series)
+    
+    # Remove rows with invalid sites (None values)
+    samples_before = len(samples)
+    samples = samples.dropna(subset=['AA', 'Pos'])
+    if len(samples) < samples_before:
+        log_warning(f"Removed {samples_before - len(samples)} invalid sample sites")
+    
+    background_before = len(background)
+    background = background.dropna(subset=['AA', 'Pos'])
+    if len(background) < background_before:
+        log_warning(f"Removed {background_before - len(background)} invalid background sites")
+    
+    if samples.empty:
+        log_error("No valid sample sites after parsing!")
+        return pd.DataFrame(columns=['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
+                                     'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE'])
+    
+    if background.empty:
+        log_error("No valid background sites after parsing!")
+        return pd.DataFrame(columns=['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
+                                     'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE'])
+    
+    log_info("Applying fuzzy matching with 1:1 constraint (closest match)...")
+    
+    # Merge über UniprotID
+    merged = samples.merge(background, on='SUB_ACC_ID', suffixes=('_sample', '_bg'))
+
+    # Fuzzy-Matching mit Position-Distanz
+    def match_and_calculate_distance(row):
+        if aa_match(row['AA_sample'], row['AA_bg'], aa_mode):
+            distance = abs(row['Pos_sample'] - row['Pos_bg'])
+            if distance <= tolerance:
+                is_imputed = distance > 0
+                return True, is_imputed, distance
+        return False, None, None
+
+    # Apply Matching
+    tqdm.pandas(desc="Matching rows", disable=not constants.SHOW_PROGRESS)
+    results = merged.progress_apply(lambda row: match_and_calculate_distance(row), axis=1)
+    merged[['match', 'IMPUTED', 'pos_distance']] = pd.DataFrame(results.tolist(), index=merged.index)
+
+    # Nur passende behalten
+    filtered = merged[merged['match']].copy()
+    
+    if filtered.empty:
+        log_warning("No matches found!")
+        return pd.DataFrame(columns=['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
+                                     'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE'])
+    
+    log_info(f"Total matches before deduplication: {len(filtered)}")
+    
+    # CRITICAL: Each sample site should map to ONLY ONE database site
+    # Group by sample identifier (SUB_ACC_ID + SUB_MOD_RSD_sample) and keep only the closest match
+    filtered = filtered.copy()  # Ensure we're working with a copy
+    filtered['sample_site_id'] = filtered['SUB_ACC_ID'] + '_' + filtered['SUB_MOD_RSD_sample']
+    
+    # Sort by distance and keep only the first (closest) match for each sample site
+    # Stable sort: among equally close sites the first background row wins
+    filtered = filtered.sort_values('pos_distance', kind='mergesort')
+    filtered_unique = filtered.drop_duplicates(subset=['sample_site_id'], keep='first').copy()
+    
+    log_info(f"Matches after 1:1 deduplication: {len(filtered_unique)} (closest match per input site)")
+    log_info(f"Removed {len(filtered) - len(filtered_unique)} duplicate mappings")
+    
+    # Determine which GENE column to use (from sample or background)
+    if 'GENE_sample' in filtered_unique.columns:
+        gene_col = 'GENE_sample'
+    elif 'GENE_bg' in filtered_unique.columns:
+        gene_col = 'GENE_bg'
+    elif 'GENE' in filtered_unique.columns:
+        gene_col = 'GENE'
+    elif 'SUB_GENE_bg' in filtered_unique.columns:
+        gene_col = 'SUB_GENE_bg'
+    elif 'SUB_GENE_sample' in filtered_unique.columns:
+        gene_col = 'SUB_GENE_sample'
+    else:
+        log_warning(f"No GENE column found in filtered data! Available columns: {list(filtered_unique.columns)}")
+        gene_col = None
+    
+    # Create SUB_GENE column
+    if gene_col and gene_col != 'SUB_GENE':
+        filtered_unique = filtered_unique.copy()
+        filtered_unique['SUB_GENE'] = filtered_unique[gene_col]
+    elif not gene_col:
+        # If no gene column exists, create an empty one
+        filtered_unique = filtered_unique.copy()
+        filtered_unique['SUB_GENE'] = ''
+    
+    # Select final columns
+    result = filtered_unique[['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
+                              'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE']].copy()
+    
+    # APPLYING MAX INFERRED HIT LIMIT (per kinase)
+    if inferred_hit_limit is not None:
+        log_info(f"Applying inferred hit limit: {inferred_hit_limit} per kinase")
+        result = limit_inferred_hits(result, inferred_hit_limit)
+    
+    return result
@@ -0,0 +1,155 @@
+# store_codec.py
+"""
+Compact encoding of DataFrames for dcc.Store payloads.
+
+to_dict("records") repeats every column name in every row and is slow to
+build and parse. encode_frame stores one array per column instead,
+serialized with orjson (json as fallback), zlib-compressed and base64'd,
+together with the dtypes and a SHA-256 digest of the column names, dtypes,
+compression and serialized columns:
+
+    {"codec": "columnar-v1", "compression": "zlib", "rows": 2,
+     "columns": ["KINASE", ...], "dtypes": ["object", ...],
+     "digest": "...", "data": "<base64>"}
+
+The digest identifies the content (e.g. the version of the background
+dataset) and keys a small cache of decoded frames, so a store that is
+sent back unchanged with every analysis is only parsed once per worker.
+decode_frame also accepts the old list-of-records format.
+"""
+import base64
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, json is only slower
+    orjson = None
+
+CODEC = "columnar-v1"
+DECODE_CACHE_SIZE = 8
+
+_decoded = OrderedDict()
+_decoded_lock = threading.Lock()
+
+
+def dumps(obj):
+    """Serializes to JSON bytes; NaN/inf become null with both backends."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _column_values(series):
+    if pd.api.types.is_float_dtype(series):
+        # json refuses NaN; orjson would write null anyway
+        return [None if v != v or v in (float("inf"), float("-inf")) else v for v in series.tolist()]
+    values = series.astype(object).where(series.notna(), None)
+    return values.tolist()
+
+
+def _digest(body, columns, dtypes, compression):
+    # Everything decode_frame builds the frame from, so a relabelled payload has a digest of its own
+    header = dumps({"columns": columns, "dtypes": dtypes, "compression": compression})
+    return hashlib.sha256(header + b"\n" + body).hexdigest()
+
+
+def encode_frame(df, compress=True):
+    """
+    Encodes a DataFrame as a columnar store payload.
+
+    Args:
+        df: DataFrame (the index is not kept)
+        compress: zlib-compress and base64 the column data
+
+    Returns:
+        JSON-serializable dict
+    """
+    columns = [str(c) for c in df.columns]
+    dtypes = [str(t) for t in df.dtypes]
+    compression = "zlib" if compress else None
+    body = dumps([_column_values(df[c]) for c in df.columns])
+    payload = {
+        "codec": CODEC,
+        "compression": compression,
+        "rows": len(df),
+        "columns": columns,
+        "dtypes": dtypes,
+        "digest": _digest(body, columns, dtypes, compression),
+    }
+    if compress:
+        payload["data"] = base64.b64encode(zlib.compress(body, 6)).decode("ascii")
+    else:
+        payload["data"] = loads(body)
+    return payload
+
+
+def is_encoded(payload):
+    return isinstance(payload, dict) and payload.get("codec") == CODEC
+
+
+def _restore_dtype(series, dtype):
+    if dtype == "object" or str(series.dtype) == dtype:
+        return series
+    try:
+        return series.astype(dtype)
+    except (TypeError, ValueError):
+        return series  # e.g. an integer column that contains nulls
+
+
+def decode_frame(payload, copy=True):
+    """
+    Decodes a store payload into a DataFrame.
+
+    Args:
+        payload: Output of encode_frame, or a list of records
+        copy: Return a copy of a cached frame (set to False only for read-only use)
+
+    Returns:
+        DataFrame
+    """
+    if not is_encoded(payload):
+        return pd.DataFrame.from_dict(payload or [])
+
+    if payload["compression"] == "zlib":
+        body = zlib.decompress(base64.b64decode(payload["data"]))
+        columns_data = None
+    else:
+        columns_data = payload["data"]
+        body = dumps(columns_data)
+    # The digest covers the column data and the labels it is decoded with, and
+    # is checked before it is used as cache key, so a modified or relabelled
+    # payload can not replace the cached frame of another session
+    digest = _digest(body, payload.get("columns"), payload.get("dtypes"), payload.get("compression"))
+    if digest != payload.get("digest"):
+        raise ValueError("Store payload digest mismatch")
+
+    with _decoded_lock:
+        df = _decoded.get(digest)
+        if df is not None:
+            _decoded.move_to_end(digest)
+    if df is None:
+        if columns_data is None:
+            columns_data = loads(body)
+        df = pd.DataFrame(dict(zip(payload["columns"], columns_data)), columns=payload["columns"])
+        for name, dtype in zip(payload["columns"], payload["dtypes"]):
+            df[name] = _restore_dtype(df[name], dtype)
+        with _decoded_lock:
+            _decoded[digest] = df
+            while len(_decoded) > DECODE_CACHE_SIZE:
+                _decoded.popitem(last=False)
+    return df.copy() if copy else df
+
+
+def payload_digest(payload):
+    """Content digest of an encoded payload, None for other formats."""
+    return payload.get("digest") if is_encoded(payload) else None
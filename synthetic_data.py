@@ -0,0 +1,142 @@
+# synthetic_data.py
+"""
+Synthetic PhosphoSitePlus-shaped backgrounds and input site lists.
+
+Used by the benchmarks and test harnesses so they run offline without the
+licensed Kinase_Substrate_Dataset.txt. The shapes follow the real dataset:
+few hub kinases with many substrates, a long tail of kinases with a handful,
+substrates with a skewed number of annotated sites and mostly S/T residues.
+"""
+import numpy as np
+import pandas as pd
+
+import constants
+
+BACKGROUND_COLUMNS = [
+    "GENE",
+    "KINASE",
+    "KIN_ACC_ID",
+    "KIN_ORGANISM",
+    "SUBSTRATE",
+    "SUB_ACC_ID",
+    "SUB_GENE",
+    "SUB_ORGANISM",
+    "SUB_MOD_RSD",
+]
+
+RESIDUES = np.array(["S", "T", "Y", "H"])
+RESIDUE_WEIGHTS = np.array([0.72, 0.19, 0.085, 0.005])
+
+
+def _accession(prefix, i):
+    return f"{prefix}{i:05d}"
+
+
+def make_background(n_substrates=2000, n_kinases=300, mean_sites_per_substrate=4.0,
+                    max_kinases_per_site=3, seed=0):
+    """
+    Creates a background table with the columns of the PSP dataset.
+
+    Args:
+        n_substrates: Number of distinct substrate proteins
+        n_kinases: Number of distinct kinases
+        mean_sites_per_substrate: Mean number of annotated sites per substrate (log-normal)
+        max_kinases_per_site: Upper bound of kinases annotated to one site
+        seed: Random seed
+
+    Returns:
+        DataFrame with one row per kinase-site annotation
+    """
+    rng = np.random.default_rng(seed)
+
+    # Zipf-like kinase popularity: a few hub kinases get most annotations
+    kinase_weights = 1.0 / np.arange(1, n_kinases + 1) ** 1.1
+    kinase_weights /= kinase_weights.sum()
+    kinase_names = np.array([f"KIN{i}" for i in range(n_kinases)])
+    kinase_accs = np.array([_accession("K", i) for i in range(n_kinases)])
+
+    sigma = 0.9
+    mu = np.log(mean_sites_per_substrate) - sigma ** 2 / 2
+    sites_per_substrate = np.maximum(1, rng.lognormal(mu, sigma, n_substrates).astype(int))
+
+    rows = []
+    for sub in range(n_substrates):
+        sub_acc = _accession("P", sub)
+        sub_gene = f"GENE{sub}"
+        length = int(rng.integers(200, 3000))
+        n_sites = min(sites_per_substrate[sub], length)
+        positions = rng.choice(np.arange(1, length + 1), size=n_sites, replace=False)
+        residues = rng.choice(RESIDUES, size=n_sites, p=RESIDUE_WEIGHTS)
+        for pos, aa in zip(positions, residues):
+            n_kin = int(rng.integers(1, max_kinases_per_site + 1))
+            kinases = rng.choice(n_kinases, size=n_kin, replace=False, p=kinase_weights)
+            for k in kinases:
+                rows.append((
+                    kinase_names[k],
+                    kinase_names[k],
+                    kinase_accs[k],
+                    constants.KIN_ORGANISM,
+                    sub_gene,
+                    sub_acc,
+                    sub_gene,
+                    constants.SUB_ORGANISM,
+                    f"{aa}{pos}",
+                ))
+
+    return pd.DataFrame(rows, columns=BACKGROUND_COLUMNS)
+
+
+def make_input_lines(background, n_sites=500, exact_fraction=0.5, max_shift=10,
+                     unknown_fraction=0.2, multi_site_fraction=0.05, invalid_fraction=0.0,
+                     seed=0):
+    """
+    Creates input lines in the ACC_GENE_SITE format read by util.read_sites.
+
+    Args:
+        background: Background DataFrame, e.g. from make_background
+        n_sites: Number of input lines
+        exact_fraction: Fraction of sites copied exactly from the background
+        max_shift: Maximum position shift for the remaining background-derived sites
+        unknown_fraction: Fraction of sites on proteins that are not in the background
+        multi_site_fraction: Fraction of lines listing two sites ("S12, S15")
+        invalid_fraction: Fraction of lines with a malformed site
+        seed: Random seed
+
+    Returns:
+        List of input lines
+    """
+    rng = np.random.default_rng(seed)
+    sites = background[["SUB_ACC_ID", "SUB_GENE", "SUB_MOD_RSD"]].drop_duplicates().to_numpy()
+
+    lines = []
+    for i in range(n_sites):
+        draw = rng.random()
+        if draw < unknown_fraction:
+            acc, gene = _accession("U", i), f"UNK{i}"
+            aa = rng.choice(RESIDUES, p=RESIDUE_WEIGHTS)
+            site = f"{aa}{int(rng.integers(1, 2000))}"
+        else:
+            acc, gene, site = sites[rng.integers(len(sites))]
+            if rng.random() >= exact_fraction:
+                shift = int(rng.integers(-max_shift, max_shift + 1))
+                aa = site[0] if rng.random() < 0.7 else rng.choice(RESIDUES, p=RESIDUE_WEIGHTS)
+                site = f"{aa}{max(1, int(site[1:]) + shift)}"
+
+        if rng.random() < invalid_fraction:
+            site = f"{site[0]}x{site[1:]}"
+        elif rng.random() < multi_site_fraction:
+            second = f"{site[0]}{int(site[1:]) + int(rng.integers(1, 20))}"
+            site = f"{site}, {second}"
+        lines.append(f"{acc}_{gene}_{site}")
+    return lines
+
+
+def make_input(background, n_sites=500, seed=0, **kwargs):
+    """Like make_input_lines, but returns the text content as pasted into the text area."""
+    return "\n".join(make_input_lines(background, n_sites=n_sites, seed=seed, **kwargs))
+
+
+def write_psp_file(background, path):
+    """Writes a background in the Kinase_Substrate_Dataset.txt layout read by util.load_psp_dataset."""
+    background.to_csv(path, sep="\t", index=False)
+    return path
@@ -0,0 +1,140 @@
+# table_query.py
+"""
+Server-side paging, sorting and filtering for the result DataTables.
+
+The tables use page_action/sort_action/filter_action='custom', so the
+browser only sends page_current, page_size, sort_by and filter_query and
+receives the rows of the visible page. The row order for a given sort and
+filter is computed once per result and cached, so paging through a large
+hit table only slices positions.
+"""
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+MAX_CACHED_VIEWS = 16
+
+# Operators as written into filter_query by the DataTable; an "s"/"i" prefix
+# selects case-sensitive/-insensitive matching.
+_FILTER_PART = re.compile(
+    r"^\s*\{(?P<column>[^}]+)\}\s*"
+    r"(?P<case>[si]?)(?P<op>>=|<=|!=|=|<|>|eq|ne|ge|le|gt|lt|contains|datestartswith)"
+    r"\s*(?P<value>.*?)\s*$"
+)
+_OP_ALIASES = {"=": "eq", "!=": "ne", ">=": "ge", "<=": "le", ">": "gt", "<": "lt"}
+
+
+def parse_filter_part(part):
+    """
+    Parses one "{column} op value" expression of a DataTable filter_query.
+
+    Returns:
+        Tuple (column, operator, value, case_insensitive) or None if the part is not understood
+    """
+    match = _FILTER_PART.match(part)
+    if not match:
+        return None
+    value = match.group("value")
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+        value = value[1:-1].replace("\\" + value[0], value[0])
+    op = _OP_ALIASES.get(match.group("op"), match.group("op"))
+    return match.group("column"), op, value, match.group("case") == "i"
+
+
+def _filter_mask(frame, filter_query):
+    mask = np.ones(len(frame), dtype=bool)
+    if not filter_query:
+        return mask
+    for part in filter_query.split(" && "):
+        parsed = parse_filter_part(part)
+        if parsed is None or parsed[0] not in frame.columns:
+            continue
+        column, op, value, case_insensitive = parsed
+        series = frame[column]
+
+        if op in ("contains", "datestartswith"):
+            text = series.astype(str)
+            if case_insensitive:
+                text, value = text.str.lower(), value.lower()
+            hit = text.str.contains(value, regex=False) if op == "contains" else text.str.startswith(value)
+            mask &= hit.to_numpy()
+            continue
+
+        number = pd.to_numeric(value, errors="coerce") if value else np.nan
+        if pd.api.types.is_numeric_dtype(series) and not pd.isna(number):
+            left, right = series, number
+        else:
+            left, right = series.astype(str), value
+            if case_insensitive:
+                left, right = left.str.lower(), right.lower()
+        mask &= getattr(left, op)(right).fillna(False).to_numpy(dtype=bool)
+    return mask
+
+
+def ordered_positions(frame, sort_by=None, filter_query=""):
+    """
+    Returns the positional row order of `frame` after filtering and sorting.
+
+    Args:
+        frame: Result DataFrame
+        sort_by: DataTable sort_by list of {"column_id", "direction"}
+        filter_query: DataTable filter_query string
+    """
+    positions = np.flatnonzero(_filter_mask(frame, filter_query))
+    sort_by = [s for s in (sort_by or []) if s.get("column_id") in frame.columns]
+    if sort_by and len(positions):
+        view = frame.iloc[positions].reset_index(drop=True)
+        order = view.sort_values(
+            by=[s["column_id"] for s in sort_by],
+            ascending=[s.get("direction", "asc") == "asc" for s in sort_by],
+            kind="mergesort",
+        ).index.to_numpy()
+        positions = positions[order]
+    return positions
+
+
+def query_page(frame, page_current, page_size, sort_by=None, filter_query="", cache=None, cache_key=None):
+    """
+    Returns one page of `frame` for a custom-paged DataTable.
+
+    Args:
+        frame: Full result DataFrame (kept server-side)
+        page_current, page_size, sort_by, filter_query: DataTable props
+        cache: Optional dict to keep computed row orders in (e.g. AnalysisResult.views)
+        cache_key: Key of `frame` within the cache
+
+    Returns:
+        Tuple (page DataFrame, page_count)
+    """
+    if frame is None or frame.empty:
+        return pd.DataFrame(), 1
+    page_size = max(1, int(page_size or 15))
+    page_current = max(0, int(page_current or 0))
+
+    key = (cache_key, tuple((s.get("column_id"), s.get("direction")) for s in sort_by or []), filter_query or "")
+    positions = cache.get(key) if cache is not None and cache_key is not None else None
+    if positions is None:
+        positions = ordered_positions(frame, sort_by, filter_query)
+        if cache is not None and cache_key is not None:
+            while len(cache) >= MAX_CACHED_VIEWS:
+                cache.pop(next(iter(cache)), None)
+            cache[key] = positions
+
+    page_count = max(1, math.ceil(len(positions) / page_size))
+    start = min(page_current, page_count - 1) * page_size
+    return frame.iloc[positions[start:start + page_size]], page_count
+
+
+def table_columns(frame, markdown_columns=("UPID",)):
+    """DataTable column definitions; numeric columns are typed so that filters compare numerically."""
+    columns = []
+    for name in frame.columns:
+        column = {"name": name, "id": name}
+        if name in markdown_columns:
+            column["presentation"] = "markdown"
+        elif pd.api.types.is_numeric_dtype(frame[name]) and not pd.api.types.is_bool_dtype(frame[name]):
+            column["type"] = "numeric"
+        columns.append(column)
+    return columns
@@ -0,0 +1,32 @@
+"""
+Tests for the pre-rendered download tables.
+"""
+import pandas as pd
+
+import util
+
+
+def test_build_download_tables_aggregates_hits():
+    site_results = pd.DataFrame({"KINASE": ["AKT1", "SRC", "ABL1"], "P_VALUE": [0.01, 0.2, 0.5]})
+    sub_results = pd.DataFrame({"KINASE": ["AKT1", "SRC"], "ADJ_P_VALUE": [0.02, 0.3]})
+    site_hits = pd.DataFrame({
+        "KINASE": ["AKT1", "AKT1", "AKT1", "SRC"],
+        "SUB_ACC_ID": ["P2", "P1", "P2", "P3"],
+        "SUB_MOD_RSD_sample": ["S5", "T9", "S5", "Y1"],
+        "IMPUTED": [False, True, False, True],
+    })
+    sub_hits = pd.DataFrame({"KINASE": ["AKT1", "AKT1", "SRC"], "SUB_GENE": ["GENE2", "GENE1", "GENE2"]})
+
+    site_table, sub_table = util.build_download_tables(site_results, sub_results, site_hits, sub_hits)
+
+    assert site_table["HITS"].tolist()[:2] == ["P1-T9(i), P2-S5", "P3-Y1(i)"]
+    assert pd.isna(site_table["HITS"].iloc[2])
+    assert sub_table["ASSOCIATED_SUBSTRATES"].tolist() == ["GENE1, GENE2", "GENE2"]
+    assert util.to_tsv(site_table).splitlines()[0] == "KINASE\tP_VALUE\tHITS"
+
+
+def test_build_download_tables_without_hits():
+    site_results = pd.DataFrame({"KINASE": ["AKT1"], "P_VALUE": [0.01]})
+    site_table, sub_table = util.build_download_tables(site_results, pd.DataFrame(), pd.DataFrame(), None)
+    assert site_table["HITS"].isna().all()
+    assert sub_table is None
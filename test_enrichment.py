@@ -0,0 +1,68 @@
+"""
+Tests for the enrichment engine (units of counting and tests).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import fisher_exact
+
+import enrichment
+import util
+
+BACKGROUND = pd.DataFrame({
+    "GENE": ["AKT1", "AKT1", "AKT1", "SRC", "SRC", "ABL1"],
+    "KINASE": ["AKT1", "AKT1", "AKT1", "SRC", "SRC", "ABL1"],
+    "KIN_ACC_ID": ["P31749", "P31749", "P31749", "P12931", "P12931", "P00519"],
+    "SUB_ACC_ID": ["Q1", "Q1", "Q2", "Q1", "Q3", "Q4"],
+    "SUB_GENE": ["G1", "G1", "G2", "G1", "G3", "G4"],
+    "SUB_MOD_RSD": ["S10", "S20", "T5", "S10", "Y7", "S1"],
+})
+SITES = pd.DataFrame({"SUB_ACC_ID": ["Q1", "Q1", "Q2"], "UPID": ["G1", "G1", "G2"],
+                      "SUB_MOD_RSD": ["S10", "S21", "T5"]})
+
+
+def test_site_unit_counts_background_rows():
+    results, hits = enrichment.run(enrichment.SiteUnit(), BACKGROUND, SITES, "bonferroni")
+    akt1 = results.set_index("KINASE").loc["AKT1"]
+    # S10 (AKT1, SRC) and T5 (AKT1) match exactly: N = 3 hits of M = 6 rows
+    assert (akt1["FOUND"], akt1["SUB#"], len(hits)) == (2, 3, 3)
+    expected = fisher_exact([[2, 1], [1, 2]], alternative="greater")[1]
+    assert akt1["P_VALUE"] == pytest.approx(expected)
+    assert akt1["NEG_LOG10_P"] == pytest.approx(-np.log10(expected))
+
+
+def test_substrate_unit_counts_kinase_substrate_pairs():
+    results, hits = enrichment.run(enrichment.SubstrateUnit(), BACKGROUND, SITES, "fdr_bh")
+    found = results.set_index("KINASE")[["FOUND", "SUB#"]].to_dict("index")
+    # AKT1-Q1 is annotated twice but counted once
+    assert found == {"AKT1": {"FOUND": 2, "SUB#": 2}, "SRC": {"FOUND": 1, "SUB#": 2}}
+    assert len(hits) == 3
+    assert results["P_VALUE"].is_monotonic_increasing
+
+
+def test_fuzzy_unit_caps_hits_and_permutations_only_apply_to_fuzzy_sites():
+    unit = enrichment.FuzzySiteUnit(tolerance=2, engine="streaming")
+    results, hits = enrichment.run(unit, BACKGROUND, SITES, "fdr_bh")
+    # S21 is matched to S20 within the tolerance
+    assert hits["IMPUTED"].sum() == 1
+    assert (results["FOUND"] <= results["SUB#"]).all()
+    assert isinstance(enrichment.get_test("permutation", unit), enrichment.PermutationTest)
+    substrate_test = enrichment.get_test("permutation", enrichment.SubstrateUnit())
+    assert isinstance(substrate_test, enrichment.ContingencyTest) and substrate_test.name == "fisher"
+    assert list(results.columns) == util.RESULT_COLUMNS + ["ADJ_P_VALUE", "NEG_LOG10_ADJ_P"]
+
+
+def test_substrate_background_is_cached_per_amino_acid_filter():
+    import matching
+
+    index = matching.get_background_index(BACKGROUND)
+    view = index.view(["T", "S"])
+    assert view.substrates() is index.view(["S", "T"]).substrates()
+    # The residue view frame of start_eval gives the same results as a filtered copy
+    filtered = BACKGROUND[BACKGROUND["SUB_MOD_RSD"].str[0].isin(["S", "T"])]
+    expected, expected_hits = enrichment.run(enrichment.SubstrateUnit(), filtered, SITES, "fdr_bh")
+    results, hits = enrichment.run(enrichment.SubstrateUnit(), view.frame, SITES, "fdr_bh")
+    pd.testing.assert_frame_equal(results, expected)
+    pd.testing.assert_frame_equal(hits, expected_hits)
+    assert matching.residue_view(view.frame) is view
+    assert len(index.view(["Y"]).substrates().rows_for(["Q1", "Q9"])) == 0
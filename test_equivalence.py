@@ -0,0 +1,62 @@
+"""
+Equivalence of the enrichment backends with the frozen reference implementation.
+
+See equivalence.py for the harness and the backend protocol.
+"""
+import pandas as pd
+import pytest
+
+import equivalence
+
+CANDIDATES = [name for name in equivalence.BACKENDS if name != "reference"]
+
+
+@pytest.mark.parametrize("backend_name", CANDIDATES)
+def test_backend_matches_reference_on_random_cases(backend_name):
+    cases = equivalence.generate_cases(60, seed=1234)
+    failures = equivalence.check_backend(equivalence.BACKENDS[backend_name], cases)
+    assert not failures, "\n".join(
+        f"case {i}: {'; '.join(problems)}\n{equivalence.describe_case(case)}" for i, case, problems in failures[:3]
+    )
+
+
+def _edge_case(**params):
+    raw_data = pd.DataFrame({
+        "GENE": ["AKT1", "MAPK1", "CDK1", "GSK3B", "SRC", "ABL1", "SRC"],
+        "KINASE": ["AKT1", "MAPK1", "CDK1", "GSK3B", "SRC", "ABL1", "SRC"],
+        "KIN_ACC_ID": ["P31749", "P28482", "P06493", "P49841", "P12931", "P00519", "P12931"],
+        "SUB_ACC_ID": ["P12345", "P12345", "P12345", "P12345", "Q99999", "Q99999", "Q99999"],
+        "SUB_GENE": ["GENE1"] * 4 + ["GENE2"] * 3,
+        "SUB_MOD_RSD": ["S98", "S100", "S102", "T198", "Y50", "Y52", "S"],
+    })
+    sites = pd.DataFrame({
+        "SUB_ACC_ID": ["P12345", "P12345", "P12345", "Q99999", "Q99999"],
+        "UPID": ["GENE1"] * 3 + ["GENE2"] * 2,
+        "SUB_MOD_RSD": ["S100", "T200", "S101", "Y51", "Sx"],
+    })
+    case = {"raw_data": raw_data, "sites": sites, "correction_method": "fdr_bh", "statistical_test": "fisher",
+            "tolerance": 5, "aa_mode": "exact", "inferred_hit_limit": 7}
+    case.update(params)
+    return case
+
+
+@pytest.mark.parametrize("backend_name", CANDIDATES)
+@pytest.mark.parametrize("params", [
+    {},
+    {"inferred_hit_limit": 0},
+    {"inferred_hit_limit": None},
+    {"aa_mode": "st-similar"},
+    {"aa_mode": "ignore", "tolerance": 2},
+    {"tolerance": 0},
+])
+def test_backend_matches_reference_on_edge_cases(backend_name, params):
+    failures = equivalence.check_backend(equivalence.BACKENDS[backend_name], [_edge_case(**params)])
+    assert not failures, failures[0][2]
+
+
+def test_harness_detects_changed_tie_breaking():
+    def reversed_background(raw_data, sites, *args):
+        return equivalence.reference_backend(raw_data.iloc[::-1], sites, *args)
+
+    cases = equivalence.generate_cases(60, seed=1234)
+    assert equivalence.check_backend(reversed_background, cases)
@@ -0,0 +1,58 @@
+"""
+Tests for the zip bundle export.
+"""
+import io
+import json
+import zipfile
+
+import pandas as pd
+import pytest
+
+import export
+import result_store
+import util
+
+
+def _result():
+    site_results = pd.DataFrame({"KINASE": ["AKT1", "SRC"], "P_VALUE": [0.01, 0.2]})
+    sub_results = pd.DataFrame({"KINASE": ["AKT1"], "ADJ_P_VALUE": [0.02]})
+    site_hits = pd.DataFrame({"KINASE": ["AKT1", "SRC"], "SUB_ACC_ID": ["P1", "P2"],
+                              "SUB_MOD_RSD_sample": ["S5", "Y1"], "IMPUTED": [False, True]})
+    sub_hits = pd.DataFrame({"KINASE": ["AKT1"], "SUB_GENE": ["GENE1"]})
+    return result_store.AnalysisResult(site_results, sub_results, site_hits, sub_hits, params={"tolerance": 5},
+                                       totals={"site": {"N": 2, "M": 10}})
+
+
+def test_tsv_bundle_contains_tables_and_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "CHUNK_ROWS", 1)  # several chunks per table
+    path = tmp_path / "bundle.zip"
+    result = _result()
+    manifest = export.write_bundle(str(path), result, table_format="tsv.gz")
+
+    with zipfile.ZipFile(path) as zf:
+        assert json.loads(zf.read("manifest.json")) == json.loads(json.dumps(manifest, default=str))
+        site = pd.read_csv(io.BytesIO(zf.read("site_level_results.tsv.gz")), sep="\t", compression="gzip")
+        hits = pd.read_csv(io.BytesIO(zf.read("site_level_hits.tsv.gz")), sep="\t", compression="gzip")
+
+    expected_site, _ = util.build_download_tables(result.site_results, result.sub_results,
+                                                  result.site_hits, result.sub_hits)
+    pd.testing.assert_frame_equal(site, expected_site)
+    pd.testing.assert_frame_equal(hits, result.site_hits)
+    assert manifest["parameters"] == {"tolerance": 5}
+    assert [t["name"] for t in manifest["tables"]] == ["site_level_results", "sub_level_results",
+                                                       "site_level_hits", "sub_level_hits"]
+    assert "background" in manifest
+
+
+def test_parquet_bundle(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "bundle.zip"
+    export.write_bundle(str(path), _result(), table_format="parquet")
+    with zipfile.ZipFile(path) as zf:
+        hits = pd.read_parquet(io.BytesIO(zf.read("sub_level_hits.parquet")))
+    assert hits["SUB_GENE"].tolist() == ["GENE1"]
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        export.write_bundle(str(tmp_path / "bundle.zip"), _result(), table_format="xlsx")
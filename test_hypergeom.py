@@ -0,0 +1,69 @@
+"""
+Tests for the log-factorial hypergeometric tails.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from scipy.stats import fisher_exact, hypergeom as scipy_hypergeom
+
+import hypergeom
+import pvalues
+import util
+
+
+def test_tails_match_fisher_exact():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        M = int(rng.integers(1, 2000))
+        n, N = int(rng.integers(0, M + 1)), int(rng.integers(0, M + 1))
+        x = int(rng.integers(max(0, N + n - M), min(n, N) + 1))
+        expected = fisher_exact([[x, n - x], [N - x, M - N - n + x]], alternative="greater")[1]
+        assert np.exp(hypergeom.log_sf(x, n, N, M)[0]) == pytest.approx(expected, rel=1e-9)
+
+
+def test_fisher_p_values_do_not_underflow():
+    # 300 of 400 hits on a kinase with 400 of 100000 annotations: p ~ 1e-693
+    p_values, neg_log10_p = util.contingency_p_values([300, 2], [400, 10], [400, 400], [100000, 100000])
+    assert p_values[0] == 0.0
+    assert neg_log10_p[0] == pytest.approx(-scipy_hypergeom.logsf(299, 100000, 400, 400) / np.log(10), rel=1e-9)
+    assert p_values[1] == pytest.approx(scipy_hypergeom.sf(1, 100000, 10, 400), rel=1e-9)
+
+
+@pytest.mark.parametrize("method", ["fdr_bh", "fdr_by", "bonferroni"])
+def test_log_space_correction_matches_multipletests(method):
+    p_values = np.random.default_rng(1).uniform(0, 1, 50) ** 4
+    results = pd.DataFrame({"P_VALUE": p_values, "NEG_LOG10_P": -np.log10(p_values)})
+    util.add_adjusted_p_values(results, method)
+    np.testing.assert_allclose(10 ** -results["NEG_LOG10_ADJ_P"], results["ADJ_P_VALUE"], rtol=1e-12)
+
+
+def test_repeated_tables_are_computed_once(monkeypatch):
+    calls = []
+    log_sf = hypergeom.log_sf
+
+    def counting_log_sf(x, n, N, M):
+        calls.append(len(x))
+        return log_sf(x, n, N, M)
+
+    monkeypatch.setattr(hypergeom, "log_sf", counting_log_sf)
+    monkeypatch.setattr(pvalues, "_p_value_cache", pvalues.OrderedDict())
+    tables = ([1, 1, 1, 4], [20, 20, 20, 50], [100, 100, 100, 100], [5000, 5000, 5000, 5000])
+    first = util.contingency_p_values(*tables)
+    assert calls == [2]
+    second = util.contingency_p_values(*tables)
+    assert calls == [2]
+    np.testing.assert_array_equal(first[0], second[0])
+    assert first[0][0] == first[0][1] == first[0][2]
+    # the test is part of the key
+    util.contingency_p_values(*tables, statistical_test="chi2")
+    assert calls == [2]
+    assert len(pvalues._p_value_cache) == 4
+
+
+def test_chi2_matches_scipy_with_yates_correction(monkeypatch):
+    monkeypatch.setattr(pvalues, "_p_value_cache", pvalues.OrderedDict())
+    x, n, N, M = [0, 1, 3, 7, 40], [5, 2, 10, 9, 60], [4, 8, 12, 10, 80], [100, 50, 400, 30, 2000]
+    p_values, _ = util.contingency_p_values(x, n, N, M, statistical_test="chi2")
+    expected = [stats.chi2_contingency([[a, b - a], [c - a, d - c - b + a]])[1] for a, b, c, d in zip(x, n, N, M)]
+    np.testing.assert_allclose(p_values, expected, rtol=1e-12)
@@ -0,0 +1,76 @@
+"""
+Tests for the search engine site table importers.
+"""
+import base64
+import io
+
+import pandas as pd
+
+import importers
+import synthetic_data
+import uploads
+import util
+
+MAXQUANT = (
+    "Proteins\tPositions within proteins\tLeading proteins\tProtein\tGene names\tLocalization prob\t"
+    "Amino acid\tPosition\tReverse\tPotential contaminant\n"
+    "P12345;P12345-2\t15;15\tP12345\tP12345\tAKT1;AKT2\t0.99\tS\t15\t\t\n"
+    "P99999\t7\tP99999\tP99999\tMAPK1\t0.5\tT\t7\t\t\n"
+    "REV__P11111\t3\tREV__P11111\tREV__P11111\t\t1\tY\t3\t+\t\n"
+    "CON__P22222\t3\tCON__P22222\tCON__P22222\t\t1\tS\t3\t\t+\n"
+)
+SPECTRONAUT = (
+    "PG.ProteinGroups,PG.Genes,PTM.ProteinId,PTM.SiteAA,PTM.SiteLocation,PTM.SiteProbability\n"
+    "P12345;Q11111,AKT1;X,P12345;Q11111,S,15;20,1\n"
+    "P99999,MAPK1,P99999,T,7,0.6\n"
+)
+DIANN = (
+    "Protein\tGene\tResidue\tSite\tSequence\n"
+    "sp|P12345|AKT1_HUMAN\tAKT1\tS\t15\tPEPTIDE\n"
+    "P99999\tMAPK1\tT\t7\tPEPTIDE\n"
+    "P99999\tMAPK1\tT\t\tPEPTIDE\n"
+)
+
+
+def _sites(*rows):
+    return pd.DataFrame(list(rows), columns=importers.SITE_COLUMNS)
+
+
+def test_formats_are_detected_from_header():
+    assert importers.detect_format(importers.split_header(MAXQUANT.splitlines()[0])[0]) == "maxquant"
+    assert importers.detect_format(importers.split_header(SPECTRONAUT.splitlines()[0])[0]) == "spectronaut"
+    assert importers.detect_format(importers.split_header(DIANN.splitlines()[0])[0]) == "diann"
+    assert importers.detect_format(["P06732_CKM_T108"]) is None
+
+
+def test_maxquant_filters_decoys_contaminants_and_localization():
+    sites = importers.read_site_table(io.StringIO(MAXQUANT), min_localization_prob=0.75)
+    assert sites.equals(_sites(("P12345", "AKT1", "S15")))
+    assert len(importers.read_site_table(io.StringIO(MAXQUANT))) == 2
+
+
+def test_spectronaut_and_diann_use_leading_protein():
+    sites = importers.read_site_table(io.StringIO(SPECTRONAUT), min_localization_prob=0.75)
+    assert sites.equals(_sites(("P12345", "AKT1", "S15")))
+    sites = importers.read_site_table(io.StringIO(DIANN))
+    assert sites.equals(_sites(("P12345", "AKT1", "S15"), ("P99999", "MAPK1", "T7")))
+
+
+def test_chunked_import_matches_text_format():
+    background = synthetic_data.make_background(n_substrates=200, n_kinases=20, seed=1)
+    text_sites = util.read_sites(synthetic_data.make_input(background, n_sites=150, seed=4))
+    table = pd.DataFrame({"Protein": text_sites["SUB_ACC_ID"], "Gene names": text_sites["UPID"],
+                          "Amino acid": text_sites["SUB_MOD_RSD"].str[0],
+                          "Position": text_sites["SUB_MOD_RSD"].str[1:], "Localization prob": "0.9"})
+    content = table.to_csv(sep="\t", index=False)
+    sites = importers.read_site_table(io.StringIO(content), min_localization_prob=0.75, chunksize=17)
+    assert sites.equals(text_sites.reset_index(drop=True))
+
+
+def test_upload_records_table_format(tmp_path):
+    store = uploads.UploadStore(str(tmp_path), max_files=5, ttl_seconds=60, preview_lines=2)
+    data_url = "data:text/plain;base64," + base64.b64encode(DIANN.encode("utf-8")).decode("ascii")
+    upload = store.put("session-a", data_url, "report.phosphosites_99.tsv")
+    assert upload["format"] == "diann"
+    with uploads.open_text(store.path(upload)) as f:
+        assert len(importers.read_site_table(f, upload["format"])) == 2
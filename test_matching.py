@@ -0,0 +1,120 @@
+"""
+Tests for the streaming fuzzy matching engine.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import matching
+import synthetic_data
+import util
+
+
+def _case(seed):
+    background = synthetic_data.make_background(n_substrates=150, n_kinases=25, seed=seed)
+    sites = util.read_sites(synthetic_data.make_input(background, n_sites=300, seed=seed + 1))
+    # Interleaved proteins: the merge groups rows by protein, which decides ties
+    return background, sites.sample(frac=1.0, random_state=seed)
+
+
+@pytest.mark.parametrize("tolerance,aa_mode,limit", [
+    (0, "exact", None), (3, "st-similar", 2), (10, "ignore", 0), (5, "exact", 7),
+])
+def test_same_hits_in_same_order_as_fuzzy_join(tolerance, aa_mode, limit):
+    background, sites = _case(tolerance)
+    expected = util.fuzzy_join(sites, background, tolerance, aa_mode, limit).reset_index(drop=True)
+    for budget_mb in (None, 50 * matching.BYTES_PER_PAIR / 2 ** 20):
+        actual = matching.fuzzy_join_streaming(sites, background, tolerance, aa_mode, limit, memory_budget_mb=budget_mb)
+        expected["IMPUTED"] = expected["IMPUTED"].astype(bool)
+        pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_chunks_respect_budget_but_keep_sites_whole():
+    bounds = matching._chunk_bounds(np.array([3, 3, 9, 1, 1, 1]), max_pairs=6)
+    assert bounds == [(0, 2), (2, 3), (3, 6)]
+
+
+def test_no_shared_proteins_fails_like_fuzzy_join():
+    background, sites = _case(1)
+    sites = sites.assign(SUB_ACC_ID="UNKNOWN")
+    with pytest.raises(ValueError):
+        util.fuzzy_join(sites, background, 2)
+    with pytest.raises(ValueError):
+        matching.fuzzy_join_streaming(sites, background, 2)
+
+
+def test_background_index_is_cached_by_content():
+    background, _ = _case(2)
+    assert matching.get_background_index(background) is matching.get_background_index(background.copy())
+    assert matching.get_background_index(background) is not matching.get_background_index(background.iloc[::-1])
+
+
+def test_residue_views_combine_partitions_like_the_string_filter():
+    background, _ = _case(4)
+    index = matching.get_background_index(background)
+    for residues in (["S"], ["T", "Y"], ["S", "T", "Y", "H"]):
+        view = index.view(residues)
+        expected = background[background["SUB_MOD_RSD"].str[0].isin(residues)]
+        pd.testing.assert_frame_equal(view.frame, expected)
+        annotations, size = matching.annotation_counts(view.frame)
+        assert size == len(expected)
+        pd.testing.assert_series_equal(annotations, expected.groupby("KIN_ACC_ID").size(), check_names=False)
+    # View frames resolve to their own index without being hashed again
+    view = index.view(["Y", "T"])
+    assert view is index.view(["T", "Y"])
+    assert matching.get_background_index(view.frame) is view.index
+    assert matching.view_of(background).index is index
+    assert matching.view_of(view.frame.copy()) is None
+
+
+@pytest.mark.parametrize("tolerance,aa_mode,limit", [(3, "st-similar", 2), (10, "ignore", None)])
+def test_parallel_matches_streaming(tolerance, aa_mode, limit):
+    background, sites = _case(tolerance + 10)
+    expected = matching.fuzzy_join_streaming(sites, background, tolerance, aa_mode, limit)
+    actual = matching.fuzzy_join_parallel(sites, background, tolerance, aa_mode, limit, workers=2, min_pairs=0)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_shards_keep_proteins_whole_and_balance_pairs():
+    protein = np.array([0, 0, 1, 2, 2, 2, 3, 4])
+    pairs = np.array([5, 5, 8, 1, 1, 1, 4, 2])
+    shards = matching.shard_rows(np.arange(8), protein, pairs, 2)
+    assert sorted(np.concatenate(shards).tolist()) == list(range(8))
+    assert all(np.all(np.diff(rows) > 0) for rows in shards)
+    assert not set(protein[shards[0]]) & set(protein[shards[1]])
+    loads = [int(pairs[rows].sum()) for rows in shards]
+    assert max(loads) - min(loads) <= 4
+
+
+def test_shared_site_arrays_round_trip():
+    background, _ = _case(3)
+    sites = matching.BackgroundIndex(background).sites
+    descriptor = sites.share()
+    try:
+        attached = matching.SiteArrays.attach(descriptor)
+        for field in ("residue", "position", "order", "starts", "counts"):
+            np.testing.assert_array_equal(getattr(attached, field), getattr(sites, field))
+        attached.release(unlink=False)
+    finally:
+        sites.release()
+
+
+def test_evicted_index_frees_shared_block_after_last_use():
+    background, _ = _case(4)
+    index = matching.BackgroundIndex(background)
+    descriptor = index.shared()
+    index.release()  # evicted while a parallel call holds the block
+    attached = matching.SiteArrays.attach(descriptor)
+    np.testing.assert_array_equal(attached.position, index.sites.position)
+    attached.release(unlink=False)
+    index.unshare()
+    with pytest.raises(FileNotFoundError):
+        matching.SiteArrays.attach(descriptor)
+
+
+def test_pool_is_shared_whatever_the_workers_of_a_call():
+    background, sites = _case(5)
+    pool = matching.get_pool()
+    for workers in (2, 3):
+        matching.fuzzy_join_parallel(sites, background, 3, "exact", workers=workers, min_pairs=0)
+        assert matching.get_pool() is pool
@@ -0,0 +1,93 @@
+"""
+Tests for the empirical permutation p-values of the site level.
+"""
+import numpy as np
+import pandas as pd
+
+import matching
+import permutation
+import synthetic_data
+import util
+
+
+def _run(seed=0):
+    background = synthetic_data.make_background(n_substrates=200, n_kinases=20, seed=seed)
+    sites = util.read_sites(synthetic_data.make_input(background, n_sites=80, seed=seed + 1))
+    hits = matching.fuzzy_join_streaming(sites, background, tolerance=3, aa_mode="exact")
+    kinases = hits.groupby(["KINASE", "KIN_ACC_ID"]).size().reset_index(name="count")
+    return background, hits, kinases
+
+
+def test_draws_keep_size_and_residue_composition():
+    background, hits, _ = _run()
+    model = permutation.get_null_model(background)
+    residues = hits["SUB_MOD_RSD_sample"].str[0]
+    pools, sizes = model.strata(residues)
+    drawn = permutation.draw_sites(np.random.default_rng(1), pools, sizes, draws=20)
+    assert drawn.shape == (20, len(hits))
+    for row in drawn:
+        assert len(set(row)) == len(row)
+        drawn_residues = pd.Series(model.residue[row]).value_counts().sort_index()
+        pd.testing.assert_series_equal(drawn_residues, residues.value_counts().sort_index(), check_names=False)
+
+
+def test_null_model_matches_the_self_join_of_the_background():
+    background, _, _ = _run()
+    model = permutation.get_null_model(background)
+    sites = background[["SUB_ACC_ID", "SUB_MOD_RSD"]].drop_duplicates()
+    hits = matching.fuzzy_join_streaming(sites, background, tolerance=3, aa_mode="exact")
+    joined = hits.set_index(["SUB_ACC_ID", "SUB_MOD_RSD_sample"])[["KINASE", "KIN_ACC_ID"]]
+    assert len(model) == len(joined)
+    own = joined.loc[pd.MultiIndex.from_frame(model.sites)]
+    pd.testing.assert_index_equal(pd.MultiIndex.from_frame(own.reset_index(drop=True)), model.kinase)
+
+
+def test_seeded_and_independent_of_workers():
+    background, hits, kinases = _run()
+    serial = permutation.permutation_p_values(kinases, hits, background,
+                                              n_permutations=1200, seed=7, workers=1)
+    parallel = permutation.permutation_p_values(kinases, hits, background,
+                                                n_permutations=1200, seed=7, workers=2)
+    np.testing.assert_array_equal(serial, parallel)
+    other_seed = permutation.permutation_p_values(kinases, hits, background,
+                                                  n_permutations=1200, seed=8, workers=1)
+    assert not np.array_equal(serial, other_seed)
+    assert np.all((serial >= 1 / 1201) & (serial <= 1))
+
+
+def test_enriched_kinase_is_significant():
+    background, _, _ = _run(3)
+    # All annotated sites of the largest kinase as input
+    kinase = background["KINASE"].value_counts().index[0]
+    rows = background[background["KINASE"] == kinase]
+    content = "\n".join(f"{acc}_GENE_{rsd}" for acc, rsd in zip(rows["SUB_ACC_ID"], rows["SUB_MOD_RSD"]))
+    results, _ = util.perform_fuzzy_enrichment(background, util.read_sites(content), "fdr_bh", "permutation",
+                                               n_permutations=500, seed=0)
+    top = results.sort_values("P_VALUE").iloc[0]
+    assert top["KINASE"] == kinase
+    assert top["P_VALUE"] == 1 / 501
+    assert list(results.columns) == util.RESULT_COLUMNS + ["ADJ_P_VALUE", "NEG_LOG10_ADJ_P"]
+
+
+def test_early_stopping_keeps_decisions_and_borderline_p_values():
+    background, hits, kinases = _run(5)
+    full = permutation.permutation_p_values(kinases, hits, background,
+                                            n_permutations=2000, seed=3, alpha=0)
+    stopped = permutation.permutation_p_values(kinases, hits, background,
+                                               n_permutations=2000, seed=3, alpha=0.05)
+    h = permutation.stopping_count(2000, 0.05)
+    for p_full, p_stopped in zip(full, stopped):
+        assert (p_full <= 0.05) == (p_stopped <= 0.05)
+        if p_stopped <= 0.05 or p_full < h / 2000:
+            assert p_stopped == p_full
+
+
+def test_sequential_counts_stop_at_h_th_exceedance():
+    counts = permutation.SequentialCounts(2, h=2)
+    reached = np.array([[1, 0], [0, 0], [1, 1], [1, 0]], dtype=bool)
+    counts.add(np.arange(2), reached)
+    assert counts.stopped.tolist() == [True, False]
+    assert counts.draws.tolist() == [3, 4]
+    counts.add(np.arange(2), reached[::-1])
+    assert counts.draws.tolist() == [3, 6]
+    np.testing.assert_allclose(counts.p_values(8), [2 / 3, 2 / 6])
@@ -0,0 +1,79 @@
+"""
+Tests for the opt-in per-request profiling.
+"""
+import json
+import pstats
+import time
+
+import flask
+import pytest
+
+import constants
+import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(constants, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(constants, "PROFILE_ENABLED", False)
+    monkeypatch.setattr(constants, "PROFILE_TOKEN", "")
+    return tmp_path
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_enabled_by_environment_switch(profile_dir, monkeypatch):
+    assert not profiling.profiling_requested()
+    monkeypatch.setattr(constants, "PROFILE_ENABLED", True)
+    assert profiling.profiling_requested()
+
+
+def test_header_token_must_match(profile_dir, monkeypatch):
+    monkeypatch.setattr(constants, "PROFILE_TOKEN", "secret")
+    app = flask.Flask(__name__)
+    assert not profiling.profiling_requested()  # no request context
+    with app.test_request_context(headers={constants.PROFILE_HEADER: "secret"}):
+        assert profiling.profiling_requested()
+    with app.test_request_context(headers={constants.PROFILE_HEADER: "wrong"}):
+        assert not profiling.profiling_requested()
+    with app.test_request_context():
+        assert not profiling.profiling_requested()
+
+
+def test_header_is_ignored_without_token(profile_dir):
+    with flask.Flask(__name__).test_request_context(headers={constants.PROFILE_HEADER: ""}):
+        assert not profiling.profiling_requested()
+
+
+def test_no_files_when_profiling_is_off(profile_dir):
+    with profiling.profile_request("run_analysis", session_id="abc"):
+        _busy(0.01)
+    assert list(profile_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("mode,suffix", [("cprofile", ".pstats"), ("sample", ".collapsed")])
+def test_profile_and_sidecar_are_written(profile_dir, monkeypatch, mode, suffix):
+    monkeypatch.setattr(constants, "PROFILE_ENABLED", True)
+    monkeypatch.setattr(constants, "PROFILE_MODE", mode)
+    monkeypatch.setattr(constants, "PROFILE_SAMPLE_INTERVAL", 0.001)
+    with profiling.profile_request("run_analysis", session_id="session-1234567890", params={"tolerance": 5}):
+        _busy(0.2)
+
+    sidecar_path, = profile_dir.glob("*_run_analysis_session-.json")
+    sidecar = json.loads(sidecar_path.read_text())
+    assert sidecar["session_id"] == "session-1234567890"
+    assert sidecar["params"] == {"tolerance": 5}
+    assert sidecar["mode"] == mode
+    data_path = profile_dir / sidecar["data_file"]
+    assert data_path.suffix == suffix
+    if mode == "cprofile":
+        assert pstats.Stats(str(data_path)).total_calls > 0
+    else:
+        lines = data_path.read_text().splitlines()
+        assert lines
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+        assert any("test_profiling.py:_busy" in line for line in lines)
@@ -0,0 +1,100 @@
+"""
+Tests for the server-side result store.
+"""
+import pandas as pd
+
+import result_store
+
+
+def _result():
+    frame = pd.DataFrame({"KINASE": ["AKT1"], "P_VALUE": [0.01]})
+    return result_store.AnalysisResult(frame, frame, frame, frame)
+
+
+def test_put_returns_handle_that_resolves():
+    store = result_store.ResultStore(max_entries=10, ttl_seconds=60, max_runs_per_session=2)
+    result = _result()
+    handle = store.put("session-a", result)
+    assert set(handle) == {"session_id", "run_id"}
+    assert store.get(handle) is result
+    assert store.get({"session_id": "session-a", "run_id": "unknown"}) is None
+    assert store.get(None) is None
+
+
+def test_only_latest_runs_per_session_are_kept():
+    store = result_store.ResultStore(max_entries=10, ttl_seconds=60, max_runs_per_session=2)
+    handles = [store.put("session-a", _result()) for _ in range(3)]
+    other = store.put("session-b", _result())
+    assert store.get(handles[0]) is None
+    assert store.get(handles[1]) is not None
+    assert store.get(handles[2]) is not None
+    assert store.get(other) is not None
+
+
+def test_least_recently_used_entry_is_evicted():
+    store = result_store.ResultStore(max_entries=2, ttl_seconds=60, max_runs_per_session=2)
+    first = store.put("a", _result())
+    second = store.put("b", _result())
+    store.get(first)
+    store.put("c", _result())
+    assert store.get(first) is not None
+    assert store.get(second) is None
+    assert len(store) == 2
+
+
+def test_expired_entries_are_dropped():
+    store = result_store.ResultStore(max_entries=10, ttl_seconds=-1, max_runs_per_session=2)
+    handle = store.put("a", _result())
+    assert store.get(handle) is None
+    assert len(store) == 0
+
+
+def test_hits_for_kinase_uses_index():
+    hits = pd.DataFrame({"KINASE": ["AKT1", "SRC", "AKT1"], "SUB_MOD_RSD_sample": ["S1", "Y2", "T3"]},
+                        index=[5, 6, 7])
+    result = result_store.AnalysisResult(pd.DataFrame(), pd.DataFrame(), hits, pd.DataFrame())
+    assert result.hits_for_kinase("site", "AKT1")["SUB_MOD_RSD_sample"].tolist() == ["S1", "T3"]
+    assert result.hits_for_kinase("site", "ABL1").empty
+    assert result.hits_for_kinase("sub", "AKT1") is None
+
+
+def test_corrected_copy_leaves_the_stored_result_unchanged():
+    frame = pd.DataFrame({"KINASE": ["AKT1", "SRC", "ABL1"], "P_VALUE": [0.01, 0.02, 0.5]})
+    frame["ADJ_P_VALUE"] = frame["P_VALUE"]
+    result = result_store.AnalysisResult(frame, frame.copy(), pd.DataFrame(), pd.DataFrame(),
+                                         params={"correction_method": "fdr_bh"})
+    result.views["site"] = [0]
+    corrected = result.corrected("bonferroni")
+    assert corrected.site_results["ADJ_P_VALUE"].tolist() == [0.03, 0.06, 1.0]
+    assert corrected.params["correction_method"] == "bonferroni"
+    assert corrected.views == {}
+    assert "ADJ_P_VALUE" in corrected.downloads["sub"]
+    assert result.site_results["ADJ_P_VALUE"].tolist() == [0.01, 0.02, 0.5]
+    assert result.params["correction_method"] == "fdr_bh"
+    assert result.views == {"site": [0]}
+    assert result.corrected("bonferroni") is corrected
+    assert corrected.corrected("fdr_bh") is result
+
+
+def test_store_get_has_no_side_effects_on_the_stored_result():
+    frame = pd.DataFrame({"KINASE": ["AKT1", "SRC"], "P_VALUE": [0.01, 0.02]})
+    frame["ADJ_P_VALUE"] = frame["P_VALUE"]
+    store = result_store.ResultStore(10, 60, 2)
+    handle = store.put("a", result_store.AnalysisResult(frame, frame.copy(), pd.DataFrame(), pd.DataFrame(),
+                                                        params={"correction_method": "fdr_bh"}))
+    corrected = store.get({**handle, "correction_method": "bonferroni"})
+    assert corrected.site_results["ADJ_P_VALUE"].tolist() == [0.02, 0.04]
+    assert store.get(handle).site_results["ADJ_P_VALUE"].tolist() == [0.01, 0.02]
+
+
+def test_correction_in_the_handle_applies_on_other_workers():
+    frame = pd.DataFrame({"KINASE": ["AKT1", "SRC", "ABL1"], "P_VALUE": [0.01, 0.02, 0.5]})
+    frame["ADJ_P_VALUE"] = frame["P_VALUE"]
+    result = result_store.AnalysisResult(frame, frame.copy(), pd.DataFrame(), pd.DataFrame(),
+                                         params={"correction_method": "fdr_bh"})
+    handle = result_store.ClientResultStore(10, 60, 2).put("a", result)
+    handle["correction_method"] = "bonferroni"  # as patched by apply_correction_method
+
+    rebuilt = result_store.ClientResultStore(10, 60, 2).get(handle)
+    assert rebuilt.site_results["ADJ_P_VALUE"].tolist() == [0.03, 0.06, 1.0]
+    assert rebuilt.params["correction_method"] == "bonferroni"
@@ -0,0 +1,86 @@
+"""
+Tests for the columnar dcc.Store encoding.
+"""
+import base64
+import json
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_store
+import store_codec
+
+
+def _frame():
+    return pd.DataFrame({
+        "KINASE": ["AKT1", "SRC", None],
+        "P_VALUE": [0.01, np.nan, 1e-300],
+        "FOUND": [3, 1, 2],
+        "IMPUTED": [True, False, True],
+    })
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(compress):
+    payload = store_codec.encode_frame(_frame(), compress=compress)
+    # Payloads travel through the browser as JSON
+    decoded = store_codec.decode_frame(json.loads(json.dumps(payload)))
+    pd.testing.assert_frame_equal(decoded, _frame())
+
+
+def test_compressed_payload_is_smaller_than_records():
+    frame = pd.DataFrame({"SUB_ACC_ID": [f"P{i:05d}" for i in range(2000)], "SUB_MOD_RSD": ["S100"] * 2000})
+    payload = store_codec.encode_frame(frame)
+    assert len(json.dumps(payload)) * 3 < len(json.dumps(frame.to_dict("records")))
+
+
+def test_decode_accepts_records():
+    records = _frame().to_dict("records")
+    assert store_codec.decode_frame(records)["KINASE"].tolist()[:2] == ["AKT1", "SRC"]
+    assert store_codec.decode_frame(None).empty
+
+
+def test_modified_payload_is_rejected():
+    payload = store_codec.encode_frame(_frame(), compress=False)
+    payload["data"][0][0] = "ABL1"
+    with pytest.raises(ValueError):
+        store_codec.decode_frame(payload)
+
+
+def test_relabelled_payload_cannot_change_the_cached_frame():
+    payload = store_codec.encode_frame(_frame())
+    swapped = dict(payload, columns=["P_VALUE", "KINASE", "FOUND", "IMPUTED"])
+    with pytest.raises(ValueError):
+        store_codec.decode_frame(swapped)
+    # A relabelled payload with a matching digest is a different cache entry
+    swapped["digest"] = store_codec._digest(zlib.decompress(base64.b64decode(payload["data"])),
+                                            swapped["columns"], swapped["dtypes"], swapped["compression"])
+    store_codec.decode_frame(swapped)
+    pd.testing.assert_frame_equal(store_codec.decode_frame(payload), _frame())
+
+
+def test_decoded_frames_are_cached_by_digest():
+    payload = store_codec.encode_frame(_frame())
+    first = store_codec.decode_frame(payload, copy=False)
+    assert store_codec.decode_frame(payload, copy=False) is first
+    assert store_codec.decode_frame(payload) is not first
+
+
+def test_client_result_store_rebuilds_results_on_other_workers():
+    frame = pd.DataFrame({"KINASE": ["AKT1"], "P_VALUE": [0.01], "UPID": ["P31749"]})
+    hits = pd.DataFrame({"KINASE": ["AKT1"], "SUB_ACC_ID": ["P1"], "SUB_MOD_RSD_sample": ["S5"], "IMPUTED": [False]})
+    totals = {"site": {"N": 1, "M": 10}, "sub": {"N": 1, "M": 4}}
+    handle = result_store.ClientResultStore(10, 60, 2).put(
+        "a", result_store.AnalysisResult(frame, frame, hits, None, params={"tolerance": 5}, totals=totals))
+    handle = json.loads(json.dumps(handle))
+
+    other_worker = result_store.ClientResultStore(10, 60, 2)
+    result = other_worker.get(handle)
+    pd.testing.assert_frame_equal(result.site_hits, hits)
+    assert result.sub_hits is None
+    assert result.downloads["site"].splitlines()[1].endswith("P1-S5")
+    assert result.totals == totals
+    assert result.params == {"tolerance": 5}
+    assert other_worker.get(handle) is result
@@ -0,0 +1,57 @@
+"""
+Tests for server-side paging, sorting and filtering of the result tables.
+"""
+import pandas as pd
+
+import table_query
+
+
+def _frame():
+    return pd.DataFrame({
+        "KINASE": ["AKT1", "MAPK1", "CDK1", "akt2", "SRC"],
+        "P_VALUE": [0.04, 0.5, 0.001, 0.2, 0.04],
+        "FOUND": [3, 1, 5, 2, 3],
+    }, index=[10, 11, 12, 13, 14])
+
+
+def test_parse_filter_part():
+    assert table_query.parse_filter_part("{P_VALUE} < 0.05") == ("P_VALUE", "lt", "0.05", False)
+    assert table_query.parse_filter_part('{KINASE} icontains "akt"') == ("KINASE", "contains", "akt", True)
+    assert table_query.parse_filter_part("{KINASE} s= AKT1") == ("KINASE", "eq", "AKT1", False)
+    assert table_query.parse_filter_part("nonsense") is None
+
+
+def test_filter_and_multi_sort():
+    frame = _frame()
+    positions = table_query.ordered_positions(
+        frame,
+        sort_by=[{"column_id": "P_VALUE", "direction": "asc"}, {"column_id": "KINASE", "direction": "desc"}],
+        filter_query="{P_VALUE} <= 0.2 && {FOUND} > 1",
+    )
+    assert frame.iloc[positions]["KINASE"].tolist() == ["CDK1", "SRC", "AKT1", "akt2"]
+
+
+def test_case_insensitive_contains():
+    frame = _frame()
+    positions = table_query.ordered_positions(frame, filter_query="{KINASE} icontains AKT")
+    assert frame.iloc[positions]["KINASE"].tolist() == ["AKT1", "akt2"]
+    positions = table_query.ordered_positions(frame, filter_query="{KINASE} scontains AKT")
+    assert frame.iloc[positions]["KINASE"].tolist() == ["AKT1"]
+
+
+def test_query_page_slices_and_caches():
+    frame = _frame()
+    cache = {}
+    sort_by = [{"column_id": "FOUND", "direction": "desc"}]
+    page, page_count = table_query.query_page(frame, 1, 2, sort_by, "", cache=cache, cache_key="site")
+    assert page_count == 3
+    assert page["KINASE"].tolist() == ["SRC", "akt2"]
+    assert len(cache) == 1
+    page, _ = table_query.query_page(frame, 7, 2, sort_by, "", cache=cache, cache_key="site")
+    assert page["KINASE"].tolist() == ["MAPK1"]
+    assert len(cache) == 1
+
+
+def test_query_page_empty():
+    page, page_count = table_query.query_page(pd.DataFrame(), 0, 15)
+    assert page.empty and page_count == 1
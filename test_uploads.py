@@ -0,0 +1,52 @@
+"""
+Tests for stored uploads and the streaming site parser.
+"""
+import base64
+import gzip
+import io
+
+import synthetic_data
+import uploads
+import util
+
+
+def _data_url(data):
+    return "data:application/octet-stream;base64," + base64.b64encode(data).decode("ascii")
+
+
+def _content():
+    background = synthetic_data.make_background(n_substrates=200, n_kinases=20, seed=1)
+    # duplicates and ';'-separated entries must be handled like in the text area
+    return synthetic_data.make_input(background, n_sites=120, seed=3) + "\nP1_A_S1;P1_A_S1,T2\r\n\n"
+
+
+def test_streaming_parse_matches_read_sites():
+    content = _content()
+    expected = util.read_sites(content)
+    streamed = util.read_sites_stream(io.StringIO(content, newline=""), chunk_lines=7)
+    assert streamed.equals(expected)
+    assert streamed.index.equals(expected.index)
+    assert util.read_sites_stream([]).equals(util.read_sites(""))
+
+
+def test_gzip_upload_is_stored_with_preview(tmp_path):
+    content = _content()
+    store = uploads.UploadStore(str(tmp_path), max_files=5, ttl_seconds=60, preview_lines=3)
+    upload = store.put("session-a", _data_url(gzip.compress(content.encode("utf-8"))), "sites.txt.gz")
+    assert upload["gzip"]
+    assert upload["lines"] == len(io.StringIO(content, newline="").readlines())
+    assert upload["preview"] == "\n".join(content.splitlines()[:3])
+    with uploads.open_text(store.path(upload)) as f:
+        assert f.read() == content
+        f.seek(0)
+        assert util.read_sites_stream(f).equals(util.read_sites(content))
+
+
+def test_session_keeps_only_latest_upload(tmp_path):
+    store = uploads.UploadStore(str(tmp_path), max_files=5, ttl_seconds=60, preview_lines=3)
+    first = store.put("session-a", _data_url(b"P1_A_S1\n"), "a.txt")
+    second = store.put("session-a", _data_url(b"P2_B_T5\n"), "b.txt")
+    assert store.path(first) is None
+    assert store.path(second) is not None
+    assert len(list(tmp_path.iterdir())) == 1
+    assert store.path(None) is None
@@ -0,0 +1,50 @@
+"""
+Tests for the coordinates of the kinome volcano plot.
+"""
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+import synthetic_data
+import util
+
+
+def test_ratio_is_found_over_expected():
+    results = pd.DataFrame({"KINASE": ["A", "B"], "FOUND": [4, 1], "SUB#": [10, 20],
+                            "ADJ_P_VALUE": [0.001, 1.0], "P_VALUE": [0.001, 1.0]})
+    coords = util.volcano_coordinates(results, sample_size=50, background_size=1000)
+    # expected = SUB# * N / M
+    assert coords["EXPECTED"].tolist() == [0.5, 1.0]
+    assert coords["RATIO"].tolist() == [8.0, 1.0]
+    assert np.allclose(coords["LOG_ADJ_P"], [3.0, 0.0])
+
+
+def test_zero_p_value_stays_finite():
+    results = pd.DataFrame({"KINASE": ["A"], "FOUND": [4], "SUB#": [10], "ADJ_P_VALUE": [0.0]})
+    coords = util.volcano_coordinates(results, 50, 1000)
+    assert np.isfinite(coords["LOG_ADJ_P"]).all()
+    assert util.volcano_coordinates(results, 50, 0).empty
+
+
+def test_downsampling_keeps_most_significant_points():
+    rng = np.random.default_rng(0)
+    x, y = rng.lognormal(size=10000), rng.exponential(size=10000)
+    keep = util.downsample_points(x, y, max_points=500, grid=50)
+    assert len(keep) <= 500
+    assert np.all(np.diff(keep) > 0)
+    assert set(np.argsort(-y)[:250]).issubset(keep)
+    assert len(util.downsample_points(x[:100], y[:100], max_points=500)) == 100
+
+
+def test_contingency_totals_match_start_eval():
+    background = synthetic_data.make_background(n_substrates=200, n_kinases=20, seed=1)
+    content = synthetic_data.make_input(background, n_sites=80, seed=2)
+    site_results, sub_results, site_hits, sub_hits = util.start_eval(
+        content, background, "fdr_bh", selected_amino_acids=["S", "T", "Y"])
+    totals = util.contingency_totals(background, site_hits, sub_hits, ["S", "T", "Y"])
+    for level, results in (("site", site_results), ("sub", sub_results)):
+        n_sample, n_background = totals[level]["N"], totals[level]["M"]
+        # With these totals the one-sided Fisher p-value is the hypergeometric tail
+        tail = stats.hypergeom.sf(results["FOUND"] - 1, n_background, results["SUB#"], n_sample)
+        assert np.allclose(tail, results["P_VALUE"])
+        assert len(util.volcano_coordinates(results, n_sample, n_background)) == len(results)
@@ -0,0 +1,162 @@
+# uploads.py
+"""
+Server-side storage of uploaded site files.
+
+dcc.Upload hands the file to the server as a base64 data URL. Instead of
+decoding it into one string and sending the text back into the text area
+(from where it would travel up again with every analysis), the upload is
+decoded block-wise into a file on disk and referenced by an ID. The text
+area only shows a preview; run_analysis parses the stored file with
+util.read_sites_stream.
+
+Files may be gzip-compressed; they are stored as uploaded and read
+through gzip.open. Site tables of search engines are recognized by their
+header and imported with importers.read_site_table. Like the result store, the upload store is local to
+the worker process, bounded in the number of files and expires entries
+after a TTL. Each session keeps only its latest upload.
+"""
+import base64
+import gzip
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import constants
+import importers
+import util
+
+GZIP_MAGIC = b"\x1f\x8b"
+DECODE_BLOCK_CHARS = 4 * (1 << 18)  # base64 characters per decoded block (1 MiB of data)
+
+
+def _decode_data_url(contents, path):
+    """Writes the payload of a base64 data URL to path without decoding it in one piece."""
+    start = contents.index(",") + 1
+    size = 0
+    with open(path, "wb") as f:
+        for offset in range(start, len(contents), DECODE_BLOCK_CHARS):
+            block = base64.b64decode(contents[offset:offset + DECODE_BLOCK_CHARS])
+            f.write(block)
+            size += len(block)
+    return size
+
+
+def _is_gzip(path):
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_text(path):
+    """Opens a stored upload as text, decompressing gzip files on the fly."""
+    if _is_gzip(path):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def scan(path, preview_lines):
+    """Returns the first preview_lines lines and the total line count of a stored upload."""
+    preview = []
+    lines = 0
+    with open_text(path) as f:
+        for line in f:
+            if lines < preview_lines:
+                preview.append(line)
+            lines += 1
+    return "".join(preview).rstrip("\r\n"), lines
+
+
+class UploadStore:
+    """Thread-safe store of uploaded files on disk, keyed by upload ID."""
+
+    def __init__(self, directory, max_files, ttl_seconds, preview_lines):
+        self.directory = directory or tempfile.mkdtemp(prefix="fuzzykea-uploads-")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_files = max_files
+        self.ttl_seconds = ttl_seconds
+        self.preview_lines = preview_lines
+        self._entries = OrderedDict()  # upload ID -> (session ID, path, expiry)
+        self._lock = threading.Lock()
+
+    def put(self, session_id, contents, filename=None):
+        """
+        Stores an uploaded file.
+
+        Args:
+            session_id: Session of the uploading user
+            contents: Base64 data URL as provided by dcc.Upload
+            filename: Original file name
+
+        Returns:
+            Dict with upload_id, filename, bytes, gzip, lines, preview and format
+            (name in importers.FORMATS, None for the ACC_GENE_S123 text format)
+        """
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, upload_id)
+        try:
+            size = _decode_data_url(contents, path)
+            compressed = _is_gzip(path)
+            preview, lines = scan(path, self.preview_lines)
+            # Search engine site tables are imported by column (see importers.py)
+            table_format = importers.detect_format(importers.split_header(preview.split("\n", 1)[0])[0])
+        except Exception:
+            self._delete(path)
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            for old_id in [k for k, entry in self._entries.items() if entry[0] == session_id]:
+                self._remove(old_id)
+            self._entries[upload_id] = (session_id, path, now + self.ttl_seconds)
+            while len(self._entries) > self.max_files:
+                self._remove(next(iter(self._entries)))
+        util.log_info(f"Stored upload {filename or upload_id}: {size} bytes, {lines} lines"
+                      f"{' (gzip)' if compressed else ''}{', ' + table_format if table_format else ''}",
+                      user_context=session_id)
+        return {"upload_id": upload_id, "filename": filename, "bytes": size, "gzip": compressed,
+                "lines": lines, "preview": preview, "format": table_format}
+
+    def path(self, upload):
+        """Returns the file path of an upload (dict from put), or None if unknown or expired."""
+        upload_id = upload.get("upload_id") if isinstance(upload, dict) else None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(upload_id)
+            if entry is None:
+                return None
+            if entry[2] < now:
+                self._remove(upload_id)
+                return None
+            self._entries.move_to_end(upload_id)
+            self._entries[upload_id] = (entry[0], entry[1], now + self.ttl_seconds)
+            return entry[1]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, upload_id):
+        entry = self._entries.pop(upload_id, None)
+        if entry is not None:
+            self._delete(entry[1])
+
+    def _evict(self, now):
+        for upload_id in [k for k, entry in self._entries.items() if entry[2] < now]:
+            self._remove(upload_id)
+
+    @staticmethod
+    def _delete(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+store = UploadStore(
+    directory=constants.UPLOAD_DIR,
+    max_files=constants.UPLOAD_MAX_FILES,
+    ttl_seconds=constants.UPLOAD_TTL_SECONDS,
+    preview_lines=constants.UPLOAD_PREVIEW_LINES,
+)
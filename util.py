@@ -1,97 +1,18 @@
 import pandas as pd
+import numpy as np
 import os
-import logging
-import sys
-from datetime import datetime
-from statsmodels.stats.multitest import multipletests
-from scipy.stats import fisher_exact
-import scipy.stats as stats
+import functools
+import itertools
 import constants
-from tqdm import tqdm
-
-tqdm.pandas()
-
-# ANSI color codes for terminal output
-class Colors:
-    RESET = '\033[0m'
-    BOLD = '\033[1m'
-    
-    # Regular colors
-    BLACK = '\033[30m'
-    RED = '\033[31m'
-    GREEN = '\033[32m'
-    YELLOW = '\033[33m'
-    BLUE = '\033[34m'
-    MAGENTA = '\033[35m'
-    CYAN = '\033[36m'
-    WHITE = '\033[37m'
-    
-    # Bright colors
-    BRIGHT_BLACK = '\033[90m'
-    BRIGHT_RED = '\033[91m'
-    BRIGHT_GREEN = '\033[92m'
-    BRIGHT_YELLOW = '\033[93m'
-    BRIGHT_BLUE = '\033[94m'
-    BRIGHT_MAGENTA = '\033[95m'
-    BRIGHT_CYAN = '\033[96m'
-    BRIGHT_WHITE = '\033[97m'
-
-class ColoredFormatter(logging.Formatter):
-    """Custom formatter with colors for different log levels"""
-    
-    FORMATS = {
-        logging.DEBUG: Colors.BRIGHT_BLACK + '%(asctime)s [DEBUG] %(name)s: %(message)s' + Colors.RESET,
-        logging.INFO: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.GREEN + 'INFO' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': %(message)s',
-        logging.WARNING: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.YELLOW + 'WARN' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': ' + Colors.YELLOW + '%(message)s' + Colors.RESET,
-        logging.ERROR: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.RED + 'ERROR' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': ' + Colors.RED + '%(message)s' + Colors.RESET,
-        logging.CRITICAL: Colors.BRIGHT_CYAN + '%(asctime)s' + Colors.RESET + ' [' + Colors.BRIGHT_RED + Colors.BOLD + 'CRITICAL' + Colors.RESET + '] ' + Colors.CYAN + '%(name)s' + Colors.RESET + ': ' + Colors.BRIGHT_RED + Colors.BOLD + '%(message)s' + Colors.RESET,
-    }
-
-    def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt, datefmt='%H:%M:%S')
-        return formatter.format(record)
-
-# Configure logging system with colors
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(ColoredFormatter())
-
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[console_handler]
-)
-
-logger = logging.getLogger('fuzzyKEA')
-logger.setLevel(logging.INFO)
-
-def log_info(message, user_context=None):
-    """Structured logging with optional user context"""
-    if user_context:
-        logger.info(f"[User: {user_context}] {message}")
-    else:
-        logger.info(message)
-
-def log_warning(message, user_context=None):
-    """Warning logging"""
-    if user_context:
-        logger.warning(f"[User: {user_context}] {message}")
-    else:
-        logger.warning(message)
-
-def log_error(message, exception=None, user_context=None):
-    """Structured error logging"""
-    prefix = f"[User: {user_context}] " if user_context else ""
-    if exception:
-        logger.error(f"{prefix}{message}: {str(exception)}", exc_info=True)
-    else:
-        logger.error(f"{prefix}{message}")
-
-def log_debug(message, user_context=None):
-    """Debug logging"""
-    if user_context:
-        logger.debug(f"[User: {user_context}] {message}")
-    else:
-        logger.debug(message)
+import enrichment
+import matching
+import store_codec
+# Re-exported: logging, p-values and the reference fuzzy join live in their own modules,
+# which the engines (enrichment.py, matching.py) import without importing util
+from logs import logger, log_info, log_warning, log_error, log_debug
+from pvalues import adjust_p_values, adjust_neg_log10_p_values, add_adjusted_p_values, contingency_p_values
+from site_matching import parse_site, aa_match, limit_inferred_hits, fuzzy_join
+from enrichment import RESULT_COLUMNS
 
 def set_column_to_markdown(columns_dict, column):
     for col in columns_dict:
@@ -102,155 +23,167 @@ def set_column_to_markdown(columns_dict, column):
 
 def add_uniprot_link_col(df):
     if "UPID" not in df.columns:
-        print("Can not generate uniprot column without uniprot ID")
+        log_warning("Can not generate uniprot column without uniprot ID")
     df["UPID"] = df["UPID"].apply(lambda x: f"[{x}](https://www.uniprot.org/uniprotkb/{x}/entry)")
     return df
 
 
-def performKSEA(raw_data, sites, correction_method, statistical_test='fisher'):
-    # Merge raw_data and sites on both SUB_ACC_ID and SUB_MOD_RSD to match sites accurately
-    merged = pd.merge(raw_data, sites, on=["SUB_ACC_ID", "SUB_MOD_RSD"])
-
-    # Group by KINASE and KIN_ACC_ID to get the counts for each kinase
-    kinases = merged.groupby(['KINASE', 'KIN_ACC_ID']).size().reset_index(name='count')
-    kinases = kinases.sort_values(by='count', ascending=False).reset_index(drop=True)
+def format_site_hits(site_hits):
+    """Labels site-level hits as "ACC-SITE", imputed hits as "ACC-SITE(i)"."""
+    acc = site_hits["SUB_ACC_ID"].astype(str) if "SUB_ACC_ID" in site_hits.columns else ""
+    labels = acc + "-" + site_hits["SUB_MOD_RSD_sample"].astype(str)
+    return labels.where(~site_hits["IMPUTED"].astype(bool), labels + "(i)")
 
-    # Count the number of hits for each kinase
-    kinase_counts = count_kinases(kinases, raw_data)
 
-    # Convert kinase counts to DataFrame and set KINASE as index for easy access
-    kinase_counts = pd.DataFrame(kinase_counts, columns=["KINASE", "COUNT", "UPID"])
-    kinase_counts = kinase_counts.set_index("KINASE")
+def join_hits_by_kinase(hits, value_column, name):
+    """Joins the unique values of a column per KINASE, sorted ("A, B, C")."""
+    pairs = (
+        hits[["KINASE", value_column]]
+        .dropna()
+        .drop_duplicates()
+        .sort_values(["KINASE", value_column])
+    )
+    return pairs.groupby("KINASE", sort=False)[value_column].agg(", ".join).reset_index(name=name)
 
-    log_info("Initiating site-level KSEA analysis")
-    log_info(f"Statistical test: {statistical_test}")
-    log_info(f"Dataset sizes - Kinases: {len(kinases)}, Merged: {len(merged)}, Raw data: {len(raw_data)}")
 
-    # Calculate p-values using specified statistical test
-    results = calculate_p_vals(kinases, merged, raw_data, statistical_test, "Site")
+def build_download_tables(site_results, sub_results, site_hits, sub_hits):
+    """
+    Builds the downloadable result tables: site-level results with a HITS
+    column and substrate-level results with an ASSOCIATED_SUBSTRATES column.
 
-    # Convert results to DataFrame and adjust p-values for multiple testing
-    results = pd.DataFrame(results, columns=["KINASE", "P_VALUE", "UPID", "FOUND", "SUB#"])
-    results['ADJ_P_VALUE'] = multipletests(results['P_VALUE'], method=correction_method)[1]
-    results = results.reset_index(drop=True)
+    Returns:
+        Tuple (site table, substrate table), None for an empty level
+    """
+    site_table = None
+    if site_results is not None and not site_results.empty:
+        site_table = site_results.copy()
+        if site_hits is not None and not site_hits.empty and \
+           {"KINASE", "SUB_MOD_RSD_sample", "IMPUTED"}.issubset(site_hits.columns):
+            labelled = pd.DataFrame({"KINASE": site_hits["KINASE"], "FORMATTED_HIT": format_site_hits(site_hits)})
+            grouped_hits = join_hits_by_kinase(labelled, "FORMATTED_HIT", "HITS")
+            if not grouped_hits.empty:
+                site_table = pd.merge(site_table, grouped_hits, on="KINASE", how="left")
+            else:
+                site_table["HITS"] = pd.NA
+        else:
+            if site_hits is not None and not site_hits.empty:
+                log_warning("Required columns (KINASE, SUB_MOD_RSD_sample, IMPUTED) missing in site hits.")
+            site_table["HITS"] = pd.NA
 
-    return results, merged
+    sub_table = None
+    if sub_results is not None and not sub_results.empty:
+        sub_table = sub_results.copy()
+        if sub_hits is not None and not sub_hits.empty and {"KINASE", "SUB_GENE"}.issubset(sub_hits.columns):
+            genes = pd.DataFrame({"KINASE": sub_hits["KINASE"], "SUB_GENE": sub_hits["SUB_GENE"].astype(str)})
+            sub_table = pd.merge(sub_table, join_hits_by_kinase(genes, "SUB_GENE", "ASSOCIATED_SUBSTRATES"),
+                                 on="KINASE", how="left")
+    return site_table, sub_table
 
 
-def count_kinases(kinases, _raw_data):
-    kinase_counts = []
-    for _, row in kinases.iterrows():
-        kinase = row["KINASE"]
-        upid = row["KIN_ACC_ID"]
+def to_tsv(df):
+    return df.to_csv(sep="\t", index=False)
 
-        # Count the total number of sites (hits) for each kinase in raw_data
-        site_count = len(_raw_data[_raw_data["KINASE"] == kinase])
-        kinase_counts.append([kinase, site_count, upid])
 
-    return kinase_counts
+def contingency_totals(raw_data, site_hits, sub_hits, selected_amino_acids=None):
+    """
+    Sample size N and background size M of the contingency tables of a run.
 
+    Mirrors start_eval: N is the number of hit rows of a level, M the number
+    of background rows after the amino acid filter (substrate level: unique
+    KINASE / SUB_ACC_ID pairs, see performKSEA_high_level).
 
-def calculate_p_vals(kinases, merged, _raw_data, statistical_test='fisher', mode=""):
-    """
-    Calculate p-values using Fisher's Exact Test or Chi-Square Test.
-    
-    Args:
-        kinases: DataFrame with kinase information
-        merged: Merged data
-        _raw_data: Raw dataset
-        statistical_test: 'fisher' or 'chi2'
-        mode: Description of the mode for logging
-    
     Returns:
-        List of results: [KINASE, P_VALUE, UPID, FOUND, SUB#]
+        Dict {"site": {"N", "M"}, "sub": {"N", "M"}}
     """
-    results = []
-
-    print(f"Calculating p-values using {statistical_test} test...")
-    print("Mode: ", mode)
-
-    for _, row in kinases.iterrows():
-        count = row["count"]
-        kinase = row["KINASE"]
-        upid = row["KIN_ACC_ID"]
+    if raw_data is None or raw_data.empty:
+        site_m = sub_m = 0
+    else:
+        # Residue view and substrate pairs of the cached index, as built for the run
+        view = matching.get_background_index(raw_data).view(selected_amino_acids)
+        site_m = len(view)
+        sub_m = len(view.substrates()) if site_m else 0
+    return {
+        "site": {"N": 0 if site_hits is None else len(site_hits), "M": site_m},
+        "sub": {"N": 0 if sub_hits is None else len(sub_hits), "M": sub_m},
+    }
 
-        # No. of hits in sample for current kinase
-        x = count
 
-        # Sample size
-        N = len(merged)
+def volcano_coordinates(results, sample_size, background_size):
+    """
+    Observed / expected hit ratio and -log10 adjusted p-value per kinase.
 
-        # No. of annotated substrates for current kinase
-        n = len(_raw_data[_raw_data["KIN_ACC_ID"] == upid])
+    The expected count of a kinase is SUB# * N / M, the mean of the
+    hypergeometric distribution behind the Fisher test.
 
-        # No. of annotated substrates for all kinases
-        M = len(_raw_data)
+    Returns:
+        DataFrame with KINASE, FOUND, EXPECTED, RATIO and LOG_ADJ_P (kinases
+        without an expected count are dropped)
+    """
+    columns = ["KINASE", "FOUND", "EXPECTED", "RATIO", "LOG_ADJ_P"]
+    if results is None or results.empty or not background_size or \
+            not {"KINASE", "FOUND", "SUB#", "ADJ_P_VALUE"}.issubset(results.columns):
+        return pd.DataFrame(columns=columns)
+    found = results["FOUND"].to_numpy(dtype=float)
+    expected = results["SUB#"].to_numpy(dtype=float) * sample_size / background_size
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = found / expected
+        log_adj = neg_log10_adjusted(results)
+    coords = pd.DataFrame({"KINASE": results["KINASE"].to_numpy(), "FOUND": found, "EXPECTED": expected,
+                           "RATIO": ratio, "LOG_ADJ_P": log_adj}, columns=columns)
+    return coords[np.isfinite(ratio) & (ratio > 0) & np.isfinite(log_adj)].reset_index(drop=True)
+
+
+def neg_log10_adjusted(results):
+    """-log10 ADJ_P_VALUE of a result table, exact (NEG_LOG10_ADJ_P) where the table has it."""
+    if "NEG_LOG10_ADJ_P" in results.columns:
+        return results["NEG_LOG10_ADJ_P"].to_numpy(dtype=float)
+    adj = results["ADJ_P_VALUE"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # p-values that underflow to 0 are shown at the smallest representable value
+        return -np.log10(np.clip(adj, np.finfo(float).tiny, 1.0))
+
+
+def _grid_cells(values, grid):
+    span = values.max() - values.min() if len(values) else 0
+    if not span:
+        return np.zeros(len(values), dtype=np.int64)
+    return ((values - values.min()) / span * (grid - 1)).astype(np.int64)
+
+
+def downsample_points(x, y, max_points, grid=100):
+    """
+    Picks at most max_points of a scatter plot, keeping its visible shape.
 
-        table = [[x, n - x],
-                [N - x, M - N - n + x]]
+    The half with the highest y (most significant) is always kept; the
+    remaining points are thinned to one per cell of a grid x grid raster,
+    and evenly strided if that is still too many.
 
-        # Flatten the table to check if any value is valid
-        flat_list = [item for sublist in table for item in sublist]
+    Returns:
+        Sorted positions of the kept points
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+    by_y = np.argsort(-y, kind="mergesort")
+    kept, rest = by_y[:max_points // 2], by_y[max_points // 2:]
+    cells = _grid_cells(x[rest], grid) * grid + _grid_cells(y[rest], grid)
+    _, first = np.unique(cells, return_index=True)
+    thinned = rest[np.sort(first)]
+    budget = max_points - len(kept)
+    if len(thinned) > budget:
+        thinned = thinned[np.linspace(0, len(thinned) - 1, budget).astype(np.int64)]
+    return np.sort(np.concatenate([kept, thinned]))
 
-        if all(value >= 0 for value in flat_list):
-            if statistical_test == 'fisher':
-                _, p_value = fisher_exact(table, alternative='greater')
-            elif statistical_test == 'chi2':
-                _, p_value, _, _ = stats.chi2_contingency(table)
-            else:
-                print(f"Warning: Unknown statistical test '{statistical_test}', defaulting to Fisher's exact")
-                _, p_value = fisher_exact(table, alternative='greater')
-            
-            # Validation
-            if p_value < 0 or p_value > 1:
-                print(f"Warning: Invalid p-value {p_value} for kinase {kinase}")
-                print(table)
-            
-            results.append([kinase, p_value, upid, x, n])
-        else:
-            # Default values when test is not applicable
-            results.append([kinase, 1.0, upid, x, n])
 
-    return results
+def performKSEA(raw_data, sites, correction_method, statistical_test='fisher'):
+    """Site-level enrichment with exact site matches (see enrichment.SiteUnit)."""
+    return enrichment.run(enrichment.SiteUnit(), raw_data, sites, correction_method, statistical_test)
 
 
 def performKSEA_high_level(raw_data, sites, correction_method, statistical_test='fisher'):
-    # Merge raw_data and sites on both SUB_ACC_ID and SUB_MOD_RSD to match sites accurately
-
-    sites = sites.drop(columns=['SUB_MOD_RSD'])
-    sites = sites.drop_duplicates(subset=["SUB_ACC_ID"])
-
-    raw_data_cpy = raw_data.copy().drop(columns=['SUB_MOD_RSD'])
-    raw_data_cpy = raw_data_cpy.drop_duplicates(subset=["KINASE", "SUB_ACC_ID"])
-
-    merged = pd.merge(raw_data_cpy, sites, on=["SUB_ACC_ID"])
-
-    # Group by KINASE and KIN_ACC_ID to get the counts for each kinase
-    kinases = merged.groupby(['KINASE', 'KIN_ACC_ID']).size().reset_index(name='count')
-    kinases = kinases.sort_values(by='count', ascending=False).reset_index(drop=True)
-
-    # Count the number of hits for each kinase
-    kinase_counts = count_kinases(kinases, raw_data_cpy)
-
-    # Convert kinase counts to DataFrame and set KINASE as index for easy access
-    kinase_counts = pd.DataFrame(kinase_counts, columns=["KINASE", "COUNT", "UPID"])
-    kinase_counts = kinase_counts.set_index("KINASE")
-
-    print("Initiating substrate-level KSEA...")
-    log_info("Initiating substrate-level KSEA analysis")
-    log_info(f"Statistical test: {statistical_test}")
-    log_info(f"Dataset sizes - Kinases: {len(kinases)}, Merged: {len(merged)}, Raw data: {len(raw_data_cpy)}")
-
-    # Calculate p-values using specified statistical test
-    results = calculate_p_vals(kinases, merged, raw_data_cpy, statistical_test, "Substrate")
-
-    # Convert results to DataFrame and adjust p-values for multiple testing
-    results = pd.DataFrame(results, columns=["KINASE", "P_VALUE", "UPID", "FOUND", "SUB#"])
-    results = results.sort_values(by="P_VALUE")
-    results['ADJ_P_VALUE'] = multipletests(results['P_VALUE'], method=correction_method)[1]
-    results = results.reset_index(drop=True)
-
-    return results, merged
+    """Substrate-level enrichment of kinase-substrate pairs (see enrichment.SubstrateUnit)."""
+    return enrichment.run(enrichment.SubstrateUnit(), raw_data, sites, correction_method, statistical_test)
 
 
 ##############
@@ -306,42 +239,72 @@ def read_sites(content):
     return df.drop_duplicates()
 
 
-def start_eval(content, raw_data, correction_method, statistical_test='fisher', rounding=False, aa_mode='exact', tolerance=0, selected_amino_acids = None, inferred_hit_limit = None):
+def read_sites_stream(lines, chunk_lines=constants.SITE_CHUNK_LINES):
+    """
+    Parses sites from an iterable of text lines (e.g. an open file) in chunks.
+
+    Gives the same DataFrame (rows, order and index) as read_sites on the
+    joined text, without holding the whole text in memory.
+    """
+    frames = []
+    offset = 0
+    chunk = []
+    for line in itertools.chain(lines, [None]):
+        if line is not None:
+            chunk.append(line)
+            if len(chunk) < chunk_lines:
+                continue
+        if not chunk:
+            break
+        text = "".join(chunk)
+        chunk = []
+        entries = sum(1 for entry in text.replace(';', '\n').splitlines() if entry)
+        if entries:
+            df = read_sites(text)
+            df.index = df.index + offset
+            frames.append(df)
+            offset += entries
+    if not frames:
+        return read_sites("")
+    return pd.concat(frames).drop_duplicates()
+
+
+def start_eval(content, raw_data, correction_method, statistical_test='fisher', rounding=False, aa_mode='exact', tolerance=0, selected_amino_acids = None, inferred_hit_limit = None, sites = None, n_permutations=None, seed=None):
     log_info(f"Starting evaluation with amino acids: {selected_amino_acids}")
     log_info(f"Statistical test method: {statistical_test}")
-    
+
     if raw_data is not None and not raw_data.empty and 'SUB_MOD_RSD' in raw_data.columns and selected_amino_acids:
-        # Extrahiere den ersten Buchstaben (die Aminosäure) aus SUB_MOD_RSD
-        # Diese Logik muss an dein genaues Datenformat angepasst werden!
-        # z.B. wenn SUB_MOD_RSD 'S123' ist, wollen wir 'S'
+        # Residue view of the cached background index: partition counts and rows are built once per selection
         try:
-            # filter raw_data and only keep rows where SUB_MOD_RSD starts with one of the selected amino acids
             original_rows = len(raw_data)
-            raw_data = raw_data[raw_data['SUB_MOD_RSD'].str[0].isin(selected_amino_acids)]
-            print(f"Filtered raw_data from {original_rows} to {len(raw_data)} rows based on selected amino acids: {selected_amino_acids}")
-            
-            
-            print(f"Util: Filtered raw_data from {original_rows} to {len(raw_data)} rows based on selected amino acids: {selected_amino_acids}")
+            view = matching.get_background_index(raw_data).view(selected_amino_acids)
+            raw_data = view.frame
+            log_info(f"Filtered raw_data from {original_rows} to {len(view)} rows based on selected amino acids: {selected_amino_acids}")
             if raw_data.empty:
-                print("WARNUNG: Nach Filterung der Aminosäuren ist raw_data leer.")
+                log_warning("raw_data is empty after amino acid filtering.")
                 # Rückgabe leerer DataFrames, wenn nach Filterung nichts übrig bleibt
                 return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
         except Exception as e:
-            print(f"FEHLER beim Filtern nach Aminosäuren: {e}")
+            log_error("Error while filtering by amino acids", e)
             # Eventuell hier auch leere DataFrames zurückgeben oder Fehler weiterleiten
-    
-    sites = read_sites(content)
+
+    # Pre-parsed sites (e.g. from an uploaded file, see read_sites_stream) replace the text content
+    if sites is None:
+        sites = read_sites(content)
 
     if not sites.empty:
         site_result, site_hits = start_fuzzy_enrichment(
             content=content,
+            sites=sites,
             raw_data=raw_data,
             correction_method=correction_method,
             statistical_test=statistical_test,
             rounding=rounding,
             aa_mode=aa_mode,
             tolerance=tolerance,
-            inferred_hit_limit=inferred_hit_limit
+            inferred_hit_limit=inferred_hit_limit,
+            n_permutations=n_permutations,
+            seed=seed
         )
         sub_results, sub_hits = performKSEA_high_level(raw_data, sites, correction_method, statistical_test)
 
@@ -349,7 +312,7 @@ def start_eval(content, raw_data, correction_method, statistical_test='fisher',
         #print(sub_results[sub_results["KINASE"] == "ATM"])
         
         if site_result.isnull().values.any() or sub_results.isnull().values.any():
-            print("Warning: site_result or sub_results contains null or NA values.")
+            log_warning("site_result or sub_results contains null or NA values.")
         
         site_hit_columns = ['SUB_GENE',"SUB_ACC_ID",'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 'KINASE', 'IMPUTED']
         site_hits = site_hits[site_hit_columns]
@@ -390,13 +353,37 @@ def get_pathways_by_upid(lookup, df_p):
     return df_p['REACTOME_NAME'].tolist()
 
 def load_psp_dataset():
+    raw_data = read_psp_dataset()
+    return raw_data.to_dict("records") if raw_data is not None else []
+
+
+def load_encoded_psp_dataset():
+    """
+    Returns the background dataset in the columnar store encoding (see store_codec.py).
+    The payload is built once per dataset file and reused for every new session.
+    """
+    try:
+        mtime = os.path.getmtime(constants.KIN_SUB_DATASET_PATH)
+    except OSError:
+        mtime = None
+    return _encoded_psp_dataset(constants.KIN_SUB_DATASET_PATH, mtime)
+
+
+@functools.lru_cache(maxsize=2)
+def _encoded_psp_dataset(path, mtime):
+    raw_data = read_psp_dataset()
+    if raw_data is None or raw_data.empty:
+        return None
+    return store_codec.encode_frame(raw_data.reset_index(drop=True))
+
+
+def read_psp_dataset():
     try:
         if not os.path.exists(constants.KIN_SUB_DATASET_PATH):
             error_msg = f"Dataset file not found at: {constants.KIN_SUB_DATASET_PATH}"
-            print(f"CRITICAL ERROR: {error_msg}")
-            print(f"Please ensure the file exists in the assets/ folder.")
-            print(f"Expected path: {os.path.abspath(constants.KIN_SUB_DATASET_PATH)}")
-            return []
+            logger.critical(f"{error_msg}. Please ensure the file exists in the assets/ folder "
+                            f"(expected path: {os.path.abspath(constants.KIN_SUB_DATASET_PATH)})")
+            return None
         
         raw_data = pd.read_csv(constants.KIN_SUB_DATASET_PATH, sep="\t")
         raw_data = raw_data[raw_data["SUB_ORGANISM"] == constants.SUB_ORGANISM]
@@ -415,408 +402,31 @@ def load_psp_dataset():
             ]
         ]
         
-        return raw_data.to_dict("records")
-    except Exception as e:
-        print("CRITICAL ERROR LOADING PSP DATASET: ", e)
-        return []
-
-# Hilfsfunktion zum Parsen der Site-Spalte
-def parse_site(site_str):
-    """Parse a site string like 'S123' into amino acid and position."""
-    try:
-        if pd.isna(site_str):
-            return None, None
-        
-        site_str = str(site_str).strip()
-        
-        if len(site_str) < 2:
-            print(f"Warning: Invalid site format (too short): '{site_str}'")
-            return None, None
-        
-        aa = site_str[0]
-        pos_str = site_str[1:]
-        
-        # Check if position is a valid number
-        if not pos_str.lstrip('-').isdigit():
-            print(f"Warning: Invalid position in site: '{site_str}'")
-            return None, None
-        
-        pos = int(pos_str)
-        
-        return aa, pos
-    except Exception as e:
-        print(f"Warning: Error parsing site '{site_str}': {e}")
-        return None, None
-
-# Aminosäurevergleich je nach Modus
-def aa_match(aa1, aa2, aa_mode):
-    if aa_mode == 'ignore':
-        return True
-    elif aa_mode == 'exact':
-        return aa1 == aa2
-    elif aa_mode == 'ST-similar':
-        if aa1 == aa2:
-            return True
-        if {aa1, aa2} <= {'S', 'T'}:
-            return True
-        return False
-    else:
-        raise ValueError(f"Unbekannter aa_mode: {aa_mode}")
-
-def limit_inferred_hits(df, inferred_hit_limit):
-    """
-    Limit the number of inferred (fuzzy-matched) hits per kinase.
-    Keeps all exact matches and only the closest inferred hits up to the limit.
-    
-    Args:
-        df: DataFrame with matched sites
-        inferred_hit_limit: Maximum number of inferred hits to keep per kinase
-    
-    Returns:
-        DataFrame with limited inferred hits
-    """
-    if df.empty:
-        return df
-    
-    if "SUB_MOD_RSD_sample" not in df.columns:
-        print(f"ERROR: SUB_MOD_RSD_sample not in columns. Available columns: {list(df.columns)}")
-        raise ValueError("DataFrame must contain 'SUB_MOD_RSD_sample' column to limit inferred hits.")
-    
-    if "SUB_MOD_RSD_bg" not in df.columns:
-        print(f"ERROR: SUB_MOD_RSD_bg not in columns. Available columns: {list(df.columns)}")
-        raise ValueError("DataFrame must contain 'SUB_MOD_RSD_bg' column to limit inferred hits.")
-    
-    # Work on a copy and reset index immediately to avoid alignment issues
-    df = df.copy().reset_index(drop=True)
-    
-    log_debug(f"limit_inferred_hits: Processing {df.shape[0]} hits")
-    
-    # Calculate position difference - handle parsing errors
-    def safe_extract_pos(site_str):
-        """Safely extract position from site string."""
-        try:
-            if pd.isna(site_str):
-                return None
-            site_str = str(site_str).strip()
-            if len(site_str) < 2:
-                return None
-            pos_part = site_str[1:]
-            if not pos_part.lstrip('-').isdigit():
-                return None
-            return int(pos_part)
-        except (ValueError, IndexError) as e:
-            print(f"Warning: Could not extract position from '{site_str}': {e}")
-            return None
-    
-    df["sample_pos"] = df["SUB_MOD_RSD_sample"].apply(safe_extract_pos)
-    df["bg_pos"] = df["SUB_MOD_RSD_bg"].apply(safe_extract_pos)
-    
-    # Remove rows where position extraction failed
-    before_drop = len(df)
-    try:
-        df = df.dropna(subset=["sample_pos", "bg_pos"]).copy()
-        if len(df) < before_drop:
-            log_warning(f"Removed {before_drop - len(df)} rows with invalid positions")
-    except Exception as e:
-        log_error("Error during position filtering", e)
-        raise
-    
-    if df.empty:
-        log_warning("No valid positions found in limit_inferred_hits, returning empty DataFrame")
-        return pd.DataFrame(columns=df.columns)
-    
-    try:
-        df["pos_diff"] = abs(df["sample_pos"] - df["bg_pos"])
-    except Exception as e:
-        log_error("Error calculating position difference", e)
-        raise
-    
-    # For each kinase, keep all exact matches + closest inferred hits up to limit
-    result_rows = []
-    try:
-        for kinase, group in df.groupby("KINASE"):
-            # Reset index for the group to avoid negative index issues
-            group = group.reset_index(drop=True).copy()
-            log_debug(f"Processing kinase: {kinase}, {group.shape[0]} hits")
-            
-            # Convert IMPUTED to boolean explicitly to avoid indexing issues
-            imputed_mask = group["IMPUTED"].astype(bool)
-            
-            # Separate exact matches from inferred using .loc to be explicit
-            exact_mask = ~imputed_mask
-            
-            exact = group.loc[exact_mask].copy()
-            inferred = group.loc[imputed_mask].copy()
-            log_debug(f"Kinase {kinase} - exact: {len(exact)}, inferred: {len(inferred)}")
-            
-            # Sort inferred by position difference and keep only the closest ones
-            if not inferred.empty and inferred_hit_limit > 0:
-                inferred = inferred.sort_values("pos_diff", ascending=True).head(inferred_hit_limit)
-            elif inferred_hit_limit == 0:
-                inferred = pd.DataFrame(columns=group.columns)
-            
-            # Combine exact and limited inferred hits
-            kinase_hits = pd.concat([exact, inferred], ignore_index=True)
-            result_rows.append(kinase_hits)
-        
-        log_debug(f"Finished processing {len(result_rows)} kinases")
-    except Exception as e:
-        log_error("Error in kinase grouping loop", e)
-        raise
-    
-    log_info(f"Before limiting: {len(df)} total hits")
-    try:
-        df_limited = pd.concat(result_rows, ignore_index=True) if result_rows else pd.DataFrame(columns=df.columns)
-        log_info(f"After limiting: {len(df_limited)} total hits (max {inferred_hit_limit} inferred per kinase)")
-    except Exception as e:
-        log_error("Error concatenating results", e)
-        raise
-    
-    # Clean up temporary columns
-    try:
-        df_limited = df_limited.drop(columns=["sample_pos", "bg_pos", "pos_diff"])
+        return raw_data
     except Exception as e:
-        log_error(f"Error dropping temporary columns. Available: {list(df_limited.columns)}", e)
-        raise
-    
-    return df_limited
-    
-    
-# Fuzzy Join Funktion
-def fuzzy_join(samples, background, tolerance=0, aa_mode='exact', inferred_hit_limit=None):
-    """
-    Fuzzy matching of sample sites to background database sites.
-    Each sample site is matched to AT MOST ONE database site (the closest one by position).
-    
-    Args:
-        samples: DataFrame with sample sites
-        background: DataFrame with database sites
-        tolerance: Maximum position difference allowed
-        aa_mode: Amino acid matching mode ('exact', 'st-similar', 'ignore')
-        inferred_hit_limit: Maximum number of inferred hits per kinase
-    
-    Returns:
-        DataFrame with matched sites, each sample site matched to max 1 DB site
-    """
-    
-    samples = samples.copy()
-    background = background.copy()
+        logger.critical(f"Error loading PSP dataset: {e}", exc_info=True)
+        return None
 
-    # AA + Pos extrahieren
-    log_info("Parsing sample sites...")
-    samples[['AA', 'Pos']] = samples['SUB_MOD_RSD'].progress_apply(parse_site).progress_apply(pd.Series)
-    
-    log_info("Parsing background sites...")
-    background[['AA', 'Pos']] = background['SUB_MOD_RSD'].progress_apply(parse_site).progress_apply(pd.Series)
-    
-    # Remove rows with invalid sites (None values)
-    samples_before = len(samples)
-    samples = samples.dropna(subset=['AA', 'Pos'])
-    if len(samples) < samples_before:
-        print(f"Warning: Removed {samples_before - len(samples)} invalid sample sites")
-    
-    background_before = len(background)
-    background = background.dropna(subset=['AA', 'Pos'])
-    if len(background) < background_before:
-        print(f"Warning: Removed {background_before - len(background)} invalid background sites")
-    
-    if samples.empty:
-        print("Error: No valid sample sites after parsing!")
-        return pd.DataFrame(columns=['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
-                                     'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE'])
-    
-    if background.empty:
-        print("Error: No valid background sites after parsing!")
-        return pd.DataFrame(columns=['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
-                                     'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE'])
-    
-    log_info("Applying fuzzy matching with 1:1 constraint (closest match)...")
-    
-    # Merge über UniprotID
-    merged = samples.merge(background, on='SUB_ACC_ID', suffixes=('_sample', '_bg'))
-
-    # Fuzzy-Matching mit Position-Distanz
-    def match_and_calculate_distance(row):
-        if aa_match(row['AA_sample'], row['AA_bg'], aa_mode):
-            distance = abs(row['Pos_sample'] - row['Pos_bg'])
-            if distance <= tolerance:
-                is_imputed = distance > 0
-                return True, is_imputed, distance
-        return False, None, None
-
-    # Apply Matching
-    tqdm.pandas(desc="Matching rows")
-    results = merged.progress_apply(lambda row: match_and_calculate_distance(row), axis=1)
-    merged[['match', 'IMPUTED', 'pos_distance']] = pd.DataFrame(results.tolist(), index=merged.index)
-
-    # Nur passende behalten
-    filtered = merged[merged['match']].copy()
-    
-    if filtered.empty:
-        print("Warning: No matches found!")
-        return pd.DataFrame(columns=['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
-                                     'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE'])
-    
-    log_info(f"Total matches before deduplication: {len(filtered)}")
-    
-    # CRITICAL: Each sample site should map to ONLY ONE database site
-    # Group by sample identifier (SUB_ACC_ID + SUB_MOD_RSD_sample) and keep only the closest match
-    filtered = filtered.copy()  # Ensure we're working with a copy
-    filtered['sample_site_id'] = filtered['SUB_ACC_ID'] + '_' + filtered['SUB_MOD_RSD_sample']
-    
-    # Sort by distance and keep only the first (closest) match for each sample site
-    filtered = filtered.sort_values('pos_distance')
-    filtered_unique = filtered.drop_duplicates(subset=['sample_site_id'], keep='first').copy()
-    
-    log_info(f"Matches after 1:1 deduplication: {len(filtered_unique)} (closest match per input site)")
-    log_info(f"Removed {len(filtered) - len(filtered_unique)} duplicate mappings")
-    
-    # Determine which GENE column to use (from sample or background)
-    if 'GENE_sample' in filtered_unique.columns:
-        gene_col = 'GENE_sample'
-    elif 'GENE_bg' in filtered_unique.columns:
-        gene_col = 'GENE_bg'
-    elif 'GENE' in filtered_unique.columns:
-        gene_col = 'GENE'
-    elif 'SUB_GENE_bg' in filtered_unique.columns:
-        gene_col = 'SUB_GENE_bg'
-    elif 'SUB_GENE_sample' in filtered_unique.columns:
-        gene_col = 'SUB_GENE_sample'
-    else:
-        print("Warning: No GENE column found in filtered data!")
-        print(f"Available columns: {list(filtered_unique.columns)}")
-        gene_col = None
-    
-    # Create SUB_GENE column
-    if gene_col and gene_col != 'SUB_GENE':
-        filtered_unique = filtered_unique.copy()
-        filtered_unique['SUB_GENE'] = filtered_unique[gene_col]
-    elif not gene_col:
-        # If no gene column exists, create an empty one
-        filtered_unique = filtered_unique.copy()
-        filtered_unique['SUB_GENE'] = ''
-    
-    # Select final columns
-    result = filtered_unique[['SUB_ACC_ID', 'SUB_MOD_RSD_sample', 'SUB_MOD_RSD_bg', 
-                              'KINASE', 'KIN_ACC_ID', 'IMPUTED', 'SUB_GENE']].copy()
-    
-    # APPLYING MAX INFERRED HIT LIMIT (per kinase)
-    if inferred_hit_limit is not None:
-        print(f"Applying inferred hit limit: {inferred_hit_limit} per kinase")
-        result = limit_inferred_hits(result, inferred_hit_limit)
-    
-    return result
-
-
-def calculate_fuzzy_p_vals(kinases, merged, _raw_data, statistical_test='fisher', mode="limit"):
-    """
-    Calculate p-values for fuzzy matching results.
-    
-    Args:
-        kinases: DataFrame with kinase information
-        merged: Merged fuzzy data
-        _raw_data: Raw dataset
-        statistical_test: 'fisher' or 'chi2'
-        mode: 'limit' to cap x at n
-    
-    Returns:
-        List of results: [KINASE, P_VALUE, UPID, FOUND, SUB#]
-    """
-    results = []
-
-    print(f"Calculating fuzzy p-values using {statistical_test} test...")
-    print("Mode: ", mode)
-
-    for _, row in kinases.iterrows():
-        count = row["count"]
-        kinase = row["KINASE"]
-        upid = row["KIN_ACC_ID"]
-
-        # No. of hits in sample for current kinase
-        x = count
-
-        # Sample size
-        N = len(merged)
-
-        # No. of annotated substrates for current kinase
-        n = len(_raw_data[_raw_data["KIN_ACC_ID"] == upid])
+def perform_fuzzy_enrichment(raw_data, sites, correction_method, statistical_test='fisher', tolerance=0, aa_mode='exact', inferred_hit_limit=None, engine=None, n_permutations=None, seed=None):
+    """Site-level enrichment with fuzzy site matching (see enrichment.FuzzySiteUnit)."""
+    unit = enrichment.FuzzySiteUnit(tolerance, aa_mode, inferred_hit_limit, engine)
+    return enrichment.run(unit, raw_data, sites, correction_method, statistical_test,
+                          n_permutations=n_permutations, seed=seed)
 
-        # No. of annotated substrates for all kinases
-        M = len(_raw_data)
-        
-        if mode == "limit":
-            if x > n:
-                original_x = x
-                x = n
-                print(f"Warning: Capping x from {original_x} to n={n} for kinase {kinase}")
-
-        table = [[x, n - x],
-                [N - x, M - N - n + x]]
-
-        # Flatten the table to check if any value is valid
-        flat_list = [item for sublist in table for item in sublist]
-
-        if all(value >= 0 for value in flat_list):
-            if statistical_test == 'fisher':
-                _, p_value = fisher_exact(table, alternative='greater')
-            elif statistical_test == 'chi2':
-                _, p_value, _, _ = stats.chi2_contingency(table)
-            else:
-                print(f"Warning: Unknown statistical test '{statistical_test}', defaulting to Fisher's exact")
-                _, p_value = fisher_exact(table, alternative='greater')
-            
-            # Validation
-            if p_value < 0 or p_value > 1:
-                print(f"Warning: Invalid p-value {p_value} for kinase {kinase}")
-                print(table)
-
-            results.append([kinase, p_value, upid, x, n])
-        else:
-            # Default values when test is not applicable
-            results.append([kinase, 1.0, upid, x, n])
-
-    return results
-
-
-
-def perform_fuzzy_enrichment(raw_data, sites, correction_method, statistical_test='fisher', tolerance=0, aa_mode='exact', inferred_hit_limit=None):
-    
-    fuzzy_merged = fuzzy_join(
-        samples=sites,
-        background=pd.DataFrame(raw_data),
-        tolerance=tolerance,
-        aa_mode=aa_mode,
-        inferred_hit_limit=inferred_hit_limit
-    )
-    print(fuzzy_merged)
-    kinases = fuzzy_merged.groupby(['KINASE', 'KIN_ACC_ID']).size().reset_index(name='count')
-    kinases = kinases.sort_values(by='count', ascending=False).reset_index(drop=True)
-    # Count the number of hits for each kinase
-    kinase_counts = count_kinases(kinases, raw_data)
-    # Convert kinase counts to DataFrame and set KINASE as index for easy access
-    kinase_counts = pd.DataFrame(kinase_counts, columns=["KINASE", "COUNT", "UPID"])
-    kinase_counts = kinase_counts.set_index("KINASE")
-    
-    results = calculate_fuzzy_p_vals(kinases, fuzzy_merged, raw_data, statistical_test)
-    # Convert results to DataFrame and adjust p-values for multiple testing
-    results = pd.DataFrame(results, columns=["KINASE", "P_VALUE", "UPID", "FOUND", "SUB#"])
-    results['ADJ_P_VALUE'] = multipletests(results['P_VALUE'], method=correction_method)[1]
-    results = results.reset_index(drop=True)
-    return results, fuzzy_merged
-
-def start_fuzzy_enrichment(content, raw_data, correction_method, statistical_test='fisher', rounding=False, aa_mode='exact', tolerance=0, inferred_hit_limit=None):
+def start_fuzzy_enrichment(content, raw_data, correction_method, statistical_test='fisher', rounding=False, aa_mode='exact', tolerance=0, inferred_hit_limit=None, sites=None, n_permutations=None, seed=None):
     
-    sites = read_sites(content)
+    if sites is None:
+        sites = read_sites(content)
 
     if not sites.empty:
-        fuzzy_result, fuzzy_hits = perform_fuzzy_enrichment(raw_data, sites, correction_method, statistical_test, aa_mode=aa_mode, tolerance=tolerance, inferred_hit_limit=inferred_hit_limit)
+        fuzzy_result, fuzzy_hits = perform_fuzzy_enrichment(raw_data, sites, correction_method, statistical_test, aa_mode=aa_mode, tolerance=tolerance, inferred_hit_limit=inferred_hit_limit, n_permutations=n_permutations, seed=seed)
         
         if fuzzy_result.isnull().values.any():
-            print("Warning: site_result or sub_results contains null or NA values.")
+            log_warning("fuzzy_result contains null or NA values.")
         
         fuzzy_hit_columns = ['SUB_GENE',"SUB_ACC_ID" ,'SUB_MOD_RSD_sample', 'KINASE', 'KIN_ACC_ID','SUB_MOD_RSD_bg', 'IMPUTED']
 
-        print("Fuzzy hit colums ", fuzzy_hits.columns)
+        log_debug(f"Fuzzy hit columns: {list(fuzzy_hits.columns)}")
         
         fuzzy_hits = fuzzy_hits[fuzzy_hit_columns]        
 